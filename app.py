@@ -4,7 +4,6 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 os.environ['KERAS_BACKEND'] = 'tensorflow'
 
 import time
-import psutil
 import json
 from pathlib import Path
 
@@ -15,39 +14,121 @@ warnings.filterwarnings('ignore', category=FutureWarning)
 import csv
 from io import StringIO, BytesIO
 import tempfile
-import shutil
+import tarfile
+import zipfile
 import logging
-from flask import Flask, render_template, request, send_file
+import hmac
+import re
+from flask import Flask, render_template, request, send_file, jsonify, url_for, Response, stream_with_context, abort, g
 from text_extraction import TextExtractor
-from werkzeug.utils import secure_filename
-from ocr_methods import OCRMethods
+from werkzeug.exceptions import HTTPException
+from jobs import JobManager, QueueFullError
+from work_queue import WorkQueue
+import metrics
+import tracing
+import profiling
+from resources import ResourceSampler
+from recycling import RecyclePolicy
+from stats_store import StatsStore, write_results_csv, write_statistics_txt
+from ingest import ALLOWED_EXTENSIONS, ARCHIVE_EXTENSIONS, allowed_file, iter_multipart_files, iter_archive_images, is_archive
 from datetime import datetime
 
-ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'tiff', 'bmp', 'jfif'}
-
 logging.basicConfig(level=logging.WARNING)
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 120 * 1024 * 1024 
+app.config['OCR_WORKERS'] = int(os.environ.get('OCR_WORKERS', 1))
+app.config['MAX_QUEUED_IMAGES'] = int(os.environ.get('MAX_QUEUED_IMAGES', 500))
+app.config['MAX_IMAGES_PER_REQUEST'] = int(os.environ.get('MAX_IMAGES_PER_REQUEST', 200))
+app.config['MAX_TEXTS_PER_REQUEST'] = int(os.environ.get('MAX_TEXTS_PER_REQUEST', 5000))
+app.config['MAX_ARCHIVE_ENTRY_SIZE'] = int(os.environ.get('MAX_ARCHIVE_ENTRY_SIZE', 50 * 1024 * 1024))
+app.config['ARCHIVE_MEMORY_LIMIT'] = int(os.environ.get('ARCHIVE_MEMORY_LIMIT', 64 * 1024 * 1024))
+app.config['OCR_CACHE_URL'] = os.environ.get('OCR_CACHE_URL')
+app.config['OCR_TRANSCRIPTS'] = os.environ.get('OCR_TRANSCRIPTS')
+app.config['OCR_FAKE_ENGINE'] = os.environ.get('OCR_FAKE_ENGINE')
+app.config['OCR_BROKER_URL'] = os.environ.get('OCR_BROKER_URL')
+app.config['OCR_RESULT_TIMEOUT'] = int(os.environ.get('OCR_RESULT_TIMEOUT', 3600))
+app.config['OCR_TRACE_FILE'] = os.environ.get('OCR_TRACE_FILE')
+app.config['OCR_TRACE_OTLP_ENDPOINT'] = os.environ.get('OCR_TRACE_OTLP_ENDPOINT')
+app.config['OCR_TRACE_SAMPLE_RATE'] = float(os.environ.get('OCR_TRACE_SAMPLE_RATE', 1.0))
+app.config['RESOURCE_SAMPLE_INTERVAL'] = float(os.environ.get('RESOURCE_SAMPLE_INTERVAL', 0.25))
+# Replace a gunicorn worker after this many images or once its RSS passes this many MB (0 = never)
+app.config['OCR_RECYCLE_IMAGES'] = int(os.environ.get('OCR_RECYCLE_IMAGES', 0))
+app.config['OCR_RECYCLE_RSS_MB'] = float(os.environ.get('OCR_RECYCLE_RSS_MB', 0))
+app.config['STATS_DB'] = os.environ.get('STATS_DB', 'statistics/stats.db')
+app.config['STATS_LEGACY_FILES'] = os.environ.get('STATS_LEGACY_FILES', '0') == '1'
+# Per-request profiling is off unless a token is set; see start_request_profile
+app.config['PROFILE_TOKEN'] = os.environ.get('PROFILE_TOKEN')
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+app.config['PROFILE_SAMPLE_INTERVAL'] = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+app.config['PROFILE_MAX_ACTIVE'] = int(os.environ.get('PROFILE_MAX_ACTIVE', 1))
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+TextExtractor.configure_cache(app.config['OCR_CACHE_URL'])
+TextExtractor.configure_fake_engine(app.config['OCR_FAKE_ENGINE'])
+TextExtractor.configure_transcripts(app.config['OCR_TRANSCRIPTS'])
+tracing.configure(app.config['OCR_TRACE_FILE'], app.config['OCR_TRACE_OTLP_ENDPOINT'], app.config['OCR_TRACE_SAMPLE_RATE'])
+
+job_manager = JobManager(
+    max_workers=app.config['OCR_WORKERS'],
+    max_queue=app.config['MAX_QUEUED_IMAGES'],
+    work_queue=WorkQueue(app.config['OCR_BROKER_URL']) if app.config['OCR_BROKER_URL'] else None,
+    result_timeout=app.config['OCR_RESULT_TIMEOUT'],
+    sample_interval=app.config['RESOURCE_SAMPLE_INTERVAL'],
+    recycle=RecyclePolicy(app.config['OCR_RECYCLE_IMAGES'], app.config['OCR_RECYCLE_RSS_MB'])
+)
+stats_store = StatsStore(app.config['STATS_DB'])
+metrics.QUEUE_DEPTH.set_function(lambda: job_manager.queue_counts()[0])
+metrics.QUEUE_RUNNING.set_function(lambda: job_manager.queue_counts()[1])
+
+def ingest_uploads(job_id, temp_dir):
+    try:
+        return queue_uploads(job_id, temp_dir)
+    except Exception:
+        # The client never gets the id of a job that failed mid-upload, so the
+        # images queued so far are cancelled rather than left running
+        job_manager.cancel(job_id)
+        raise
+    finally:
+        job_manager.seal(job_id)
+
+def queue_uploads(job_id, temp_dir):
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        abort(400, description="Expected a multipart/form-data upload")
+
+    count = 0
+    try:
+        for filename, filepath in iter_multipart_files(request.stream, boundary.encode('latin-1'), temp_dir, allowed_file):
+            if is_archive(filename):
+                images = iter_archive_images(filepath, allowed_file, app.config['MAX_ARCHIVE_ENTRY_SIZE'],
+                                             temp_dir, app.config['ARCHIVE_MEMORY_LIMIT'])
+            else:
+                images = [(filename, filepath)]
+
+            for image_name, image in images:
+                count += 1
+                if count > app.config['MAX_IMAGES_PER_REQUEST']:
+                    abort(413, description=f"At most {app.config['MAX_IMAGES_PER_REQUEST']} images can be uploaded per request")
+                job_manager.add(job_id, image, image_name)
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        abort(400, description=f"Could not read archive: {e}")
+    except ValueError as e:
+        abort(400, description=f"Malformed multipart upload: {e}")
+    return count
+
+def track_resources(interval=None):
+    # Samples in the background from the first call; update() adds a sample now
+    sampler = ResourceSampler(interval or app.config['RESOURCE_SAMPLE_INTERVAL'] or 0.25).start()
 
-def track_resources():
-    cpu_percentages = []
-    memory_usage = []
-    process = psutil.Process()
-    
     def update():
-        cpu_percentages.append(psutil.cpu_percent())
-        memory_usage.append(process.memory_info().rss / 1024 / 1024)
-        
+        sampler.sample()
+
     def get_stats():
-        return {
-            'cpu_avg': sum(cpu_percentages) / len(cpu_percentages) if cpu_percentages else 0,
-            'cpu_max': max(cpu_percentages) if cpu_percentages else 0,
-            'memory_avg': sum(memory_usage) / len(memory_usage) if memory_usage else 0,
-            'memory_max': max(memory_usage) if memory_usage else 0
-        }
+        summary = sampler.stop().summary()
+        summary.setdefault('cpu_avg', 0)
+        summary.setdefault('cpu_max', 0)
+        summary.setdefault('memory_avg', 0)
+        summary.setdefault('memory_max', 0)
+        return summary
     return update, get_stats
 
 def save_statistics(stats, results, elapsed_time):
@@ -57,127 +138,92 @@ def save_statistics(stats, results, elapsed_time):
     
     csv_path = stats_dir / f"invoice_data_{timestamp}.csv"
     with open(csv_path, 'w', newline='', encoding='utf-8-sig') as f:
-        writer = csv.writer(f)
-        headers = ['Filename', 'Date', 'Time', 'Tax Office Name', 'Tax Office Number', 'Total Cost', 'VAT', 'Payment Methods']
-        writer.writerow(headers)
-        fields = ['filename', 'date', 'time', 'tax_office_name', 'tax_office_number', 'total_cost', 'vat', 'payment_method']
-        for row in results:
-            writer.writerow([str(row.get(field, 'N/A')) for field in fields])
+        write_results_csv(f, results)
 
     stats_path = stats_dir / f"invoice_stats_{timestamp}.txt"
     with open(stats_path, 'w', encoding='utf-8') as f:
-        f.write("=" * 80 + "\n\n")
-        f.write("FINAL STATISTICS:\n")
-        f.write(f"Total images processed: {stats['total_images']}\n")
-        f.write(f"Total fields attempted: {stats['total_fields_attempted']}\n")
-        f.write(f"Successful extractions: {stats['successful_extractions']}\n")
-        f.write(f"Failed extractions (N/A): {stats['failed_extractions']}\n")
-        f.write(f"Overall success rate: {stats['success_rate']:.2f}%\n")
-        f.write(f"Total execution time: {stats['processing_time']:.2f} seconds\n")
-        f.write(f"Average CPU Usage: {stats['avg_cpu_usage']:.2f}%\n")
-        f.write(f"Peak CPU Usage: {stats['peak_cpu_usage']:.2f}%\n")
-        f.write(f"Average Memory Usage: {stats['avg_memory_usage']:.2f} MB\n")
-        f.write(f"Peak Memory Usage: {stats['peak_memory_usage']:.2f} MB\n")
-        f.write("\n" + "=" * 80 + "\n")
-        
-        f.write("\nFIELD-LEVEL ACCURACY:\n")
-        f.write("-" * 50 + "\n")
-        field_stats = {}
-        
-        for result in results:
-            for field in ['date', 'time', 'tax_office_name', 'tax_office_number', 
-                         'total_cost', 'vat', 'payment_method']:
-                if field not in field_stats:
-                    field_stats[field] = {'success': 0, 'total': 0}
-                field_stats[field]['total'] += 1
-                if result.get(field) != 'N/A':
-                    field_stats[field]['success'] += 1
-        
-        for field, stats in field_stats.items():
-            accuracy = (stats['success'] / stats['total'] * 100) if stats['total'] > 0 else 0
-            f.write(f"{field}: {accuracy:.2f}% ({stats['success']}/{stats['total']})\n")
-        
-        f.write("\n" + "=" * 80 + "\n")
+        write_statistics_txt(f, stats, results)
         
     return csv_path, stats_path
 
-def process_files(files):
-    update_resources, get_resource_stats = track_resources()
-    start_time = time.time()
-    start_cpu_percent = psutil.cpu_percent()
-    process = psutil.Process()
-    initial_memory = process.memory_info().rss / 1024 / 1024
-    
+def record_job(job):
+    # JobManager.on_finish: every upload (/, /api/jobs, /api/extract) is recorded as a run
+    results = [image['fields'] for image in job['images'] if image['status'] == 'done']
+    if not results:
+        return None
+
+    total_fields = len(results) * 7
+    successful_extractions = sum(1 for result in results for field in
+        ['date', 'time', 'tax_office_name', 'tax_office_number', 'total_cost', 'vat', 'payment_method']
+        if result.get(field) != 'N/A')
+
+    elapsed_time = time.time() - job['created']
+    resource_stats = job['resources'] or {}
+
+    stats = {
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'total_images': job['total'],
+        'total_fields_attempted': total_fields,
+        'successful_extractions': successful_extractions,
+        'failed_extractions': total_fields - successful_extractions,
+        'success_rate': round((successful_extractions / total_fields * 100), 2),
+        'processing_time': round(elapsed_time, 2),
+        'cpu_usage': resource_stats.get('cpu_avg', 0),
+        'memory_used_mb': round(resource_stats.get('memory_end', 0) - resource_stats.get('memory_start', 0), 2),
+        'avg_cpu_usage': resource_stats.get('cpu_avg', 0),
+        'peak_cpu_usage': resource_stats.get('cpu_max', 0),
+        'avg_memory_usage': resource_stats.get('memory_avg', 0),
+        'peak_memory_usage': resource_stats.get('memory_max', 0),
+        'resources': resource_stats
+    }
+
+    run_id = stats_store.record_run(stats, job['images'])
+    summary = {'statistics': stats, 'run_id': run_id}
+    if app.config['STATS_LEGACY_FILES']:
+        csv_path, stats_path = save_statistics(stats, results, elapsed_time)
+        summary.update(csv_path=str(csv_path), stats_path=str(stats_path))
+    return summary
+
+job_manager.on_finish = record_job
+
+def process_files():
+    job_manager.check_capacity(1)
     temp_dir = tempfile.mkdtemp()
+    # The job removes temp_dir once its last image is done, even if the request fails first
+    job_id = job_manager.create(cleanup_dir=temp_dir)
     try:
-        files_info = {'paths': [], 'names': []}
-        for file in files:
-            if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(temp_dir, filename)
-                file.save(filepath)
-                files_info['paths'].append(filepath)
-                files_info['names'].append(filename)
+        image_count = ingest_uploads(job_id, temp_dir)
         
-        if not files_info['paths']:
+        if not image_count:
             return None
             
-        update_resources() 
-        results = TextExtractor.extract_all(files_info['paths'], files_info['names'])
-        update_resources()
-        
-        total_fields = len(results) * 7 
-        successful_extractions = sum(1 for result in results for field in 
-            ['date', 'time', 'tax_office_name', 'tax_office_number', 'total_cost', 'vat', 'payment_method']
-            if result.get(field) != 'N/A')
-        
-        elapsed_time = time.time() - start_time
-        end_cpu_percent = psutil.cpu_percent()
-        final_memory = process.memory_info().rss / 1024 / 1024
-        
-        resource_stats = get_resource_stats()
-        
-        stats = {
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'total_images': len(files_info['paths']),
-            'total_fields_attempted': total_fields,
-            'successful_extractions': successful_extractions,
-            'failed_extractions': total_fields - successful_extractions,
-            'success_rate': round((successful_extractions / total_fields * 100), 2),
-            'processing_time': round(elapsed_time, 2),
-            'cpu_usage': round(end_cpu_percent - start_cpu_percent, 2),
-            'memory_used_mb': round(final_memory - initial_memory, 2),
-            'avg_cpu_usage': round(resource_stats['cpu_avg'], 2),
-            'peak_cpu_usage': round(resource_stats['cpu_max'], 2),
-            'avg_memory_usage': round(resource_stats['memory_avg'], 2),
-            'peak_memory_usage': round(resource_stats['memory_max'], 2)
-        }
+        job = job_manager.wait(job_id)
+        results = [image['fields'] for image in job['images'] if image['status'] == 'done']
         
-        csv_path, stats_path = save_statistics(stats, results, elapsed_time)
-        
-        results.append({
-            'statistics': stats,
-            'csv_path': str(csv_path),
-            'stats_path': str(stats_path)
-        })
+        if not results:
+            return None
         
+        if job['statistics']:
+            results.append(job['statistics'])
         return results
         
+    except (QueueFullError, HTTPException):
+        raise
     except Exception as e:
         app.logger.error(f"Error processing files: {str(e)}")
         return None
-    finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
+
+@app.context_processor
+def upload_extensions():
+    # The file picker offers what ingest.py accepts
+    extensions = [f".{extension}" for extension in sorted(ALLOWED_EXTENSIONS)] + list(ARCHIVE_EXTENSIONS)
+    return {'upload_accept': ','.join(extensions)}
 
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
         try:
-            files = request.files.getlist("files")
-            if not files or all(file.filename == '' for file in files):
-                return render_template("index.html", error="No files were uploaded")
-                
-            results = process_files(files)
+            results = process_files()
             if not results:
                 return render_template("index.html", error="No valid results were extracted")
             
@@ -187,6 +233,8 @@ def index():
                 
             return render_template("index.html", results=results, statistics=stats['statistics'] if stats else None)
             
+        except (QueueFullError, HTTPException):
+            raise
         except Exception as e:
             app.logger.error(f"Error processing files: {str(e)}")
             return render_template("index.html", error=f"Error processing files: {str(e)}")
@@ -198,6 +246,10 @@ def export_csv():
     if not data:
         return "No data received", 400
     
+    fields = ['filename', 'date', 'time', 'tax_office_name', 'tax_office_number', 'total_cost', 'vat', 'payment_methods']
+    return send_csv(data, fields)
+
+def send_csv(rows, fields):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"invoice_data_{timestamp}.csv"
     
@@ -205,12 +257,249 @@ def export_csv():
     writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
     headers = ['Filename', 'Date', 'Time', 'Tax Office Name', 'Tax Office Number', 'Total Cost', 'VAT', 'Payment Methods']
     writer.writerow(headers)
-    fields = ['filename', 'date', 'time', 'tax_office_name', 'tax_office_number', 'total_cost', 'vat', 'payment_methods']
-    for row in data:
+    for row in rows:
         writer.writerow([str(row.get(field, 'N/A')) for field in fields])
     output.seek(0)
     file_data = BytesIO(output.getvalue().encode('utf-8-sig'))
     return send_file(file_data, mimetype='text/csv', as_attachment=True, download_name=filename)
 
+def start_upload_job():
+    job_manager.check_capacity(1)
+    temp_dir = tempfile.mkdtemp()
+    job_id = job_manager.create(cleanup_dir=temp_dir)
+    if not ingest_uploads(job_id, temp_dir):
+        abort(400, description="No valid image files were uploaded")
+    return job_id
+
+@app.route("/api/jobs", methods=["POST"])
+def create_job():
+    job_id = start_upload_job()
+    return jsonify(job_manager.get(job_id)), 202, {'Location': url_for('get_job', job_id=job_id)}
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route("/api/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    if job_manager.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    # EventSource sends the last id it saw when it reconnects; results up to it are not sent again
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    after = int(last_event_id) if last_event_id.isdigit() else 0
+
+    def generate():
+        for image in job_manager.iter_results(job_id, after=after):
+            if image is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"id: {image['sequence']}\nevent: result\ndata: {json.dumps(image, ensure_ascii=False)}\n\n"
+
+        job = job_manager.get(job_id)
+        if job:
+            job.pop('images')
+            yield f"event: done\ndata: {json.dumps(job)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def compact_result(image):
+    fields = dict(image['fields'] or {})
+    fields.pop('filename', None)
+    return {
+        'index': image['index'],
+        'filename': image['filename'],
+        'status': image['status'],
+        'fields': fields,
+        'sources': image['field_engines'],
+        'timings': {
+            'wait': image['wait_time'],
+            'processing': image['processing_time'],
+            'ocr': image['ocr_times']
+        },
+        'error': image['error']
+    }
+
+@app.before_request
+def start_request_trace():
+    if request.path == '/metrics':
+        return
+    route = request.url_rule.rule if request.url_rule else request.path
+    g.trace = tracing.start_trace(f"{request.method} {route}", force=request.args.get('trace') == '1',
+                                  method=request.method, route=route)
+
+@app.after_request
+def add_trace_header(response):
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+@app.teardown_request
+def end_request_trace(error=None):
+    trace = g.pop('trace', None)
+    if trace is not None:
+        tracing.end_trace(trace)
+
+def profile_token_valid():
+    token = app.config['PROFILE_TOKEN']
+    given = request.headers.get('X-Profile-Token', '')
+    return bool(token) and hmac.compare_digest(given.encode('utf-8'), token.encode('utf-8'))
+
+@app.before_request
+def start_request_profile():
+    # X-Profile: sample|cprofile (or ?profile=) with X-Profile-Token runs this
+    # request, including its OCR job, under the profiler
+    mode = request.headers.get('X-Profile') or request.args.get('profile')
+    if not mode or not app.config['PROFILE_TOKEN']:
+        return
+    if not profile_token_valid():
+        abort(403, description="Profiling needs a valid X-Profile-Token header")
+    if mode not in profiling.MODES:
+        abort(400, description=f"Profile mode must be one of: {', '.join(profiling.MODES)}")
+    if profiling.active_count() >= app.config['PROFILE_MAX_ACTIVE']:
+        abort(429, description="Another request is being profiled, try again shortly")
+    g.profile = profiling.start(f"{request.method} {request.full_path}", mode, app.config['PROFILE_DIR'],
+                                app.config['PROFILE_SAMPLE_INTERVAL'])
+    app.logger.info(f"Profiling {request.method} {request.path} as {g.profile.id} ({mode})")
+
+@app.after_request
+def add_profile_header(response):
+    profile = g.get('profile')
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile.id
+    return response
+
+@app.teardown_request
+def end_request_profile(error=None):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiling.end(profile)
+
+@app.route("/api/profiles/<profile_id>/<kind>", methods=["GET"])
+def download_profile(profile_id, kind):
+    if not profile_token_valid():
+        abort(403, description="Profiles need a valid X-Profile-Token header")
+    if kind not in ('txt', 'collapsed', 'prof') or not re.fullmatch(r'[0-9a-f_]+', profile_id):
+        abort(404)
+    path = os.path.join(app.config['PROFILE_DIR'], f"{profile_id}.{kind}")
+    if not os.path.isfile(path):
+        return jsonify({'error': 'Profile not found; it is written once the request and its job have finished'}), 404
+    return send_file(os.path.abspath(path), mimetype='application/octet-stream' if kind == 'prof' else 'text/plain',
+                     as_attachment=True, download_name=f"{profile_id}.{kind}")
+
+def trace_summary(payload):
+    if request.args.get('trace') == '1' and g.get('trace') is not None:
+        payload['trace'] = g.trace.summary()
+    return payload
+
+@app.route("/api/extract", methods=["POST"])
+def extract_api():
+    start_time = time.time()
+    job_id = start_upload_job()
+
+    stream = request.args.get('stream') == '1' or request.accept_mimetypes.best == 'application/x-ndjson'
+    if stream:
+        def generate():
+            for image in job_manager.iter_results(job_id):
+                if image is not None:
+                    yield json.dumps(compact_result(image), ensure_ascii=False, separators=(',', ':')) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                        headers={'X-Accel-Buffering': 'no'})
+
+    job = job_manager.wait(job_id)
+    if request.args.get('format') == 'csv':
+        fields = ['filename', 'date', 'time', 'tax_office_name', 'tax_office_number', 'total_cost', 'vat', 'payment_method']
+        return send_csv([image['fields'] for image in job['images'] if image['status'] == 'done'], fields)
+
+    return jsonify(trace_summary({
+        'results': [compact_result(image) for image in job['images']],
+        'processing_time': round(time.time() - start_time, 3),
+        'resources': job['resources']
+    }))
+
+@app.route("/api/extract-text", methods=["POST"])
+def extract_text_api():
+    start_time = time.time()
+    data = request.get_json(silent=True)
+    items = data.get('texts') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Expected a JSON list of texts or {"texts": [...]}'}), 400
+    if len(items) > app.config['MAX_TEXTS_PER_REQUEST']:
+        abort(413, description=f"At most {app.config['MAX_TEXTS_PER_REQUEST']} texts can be sent per request")
+
+    results = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {'text': item}
+        if not isinstance(item, dict) or not isinstance(item.get('text'), str):
+            return jsonify({'error': f'Item {index} has no text'}), 400
+
+        item_start = time.time()
+        fields = TextExtractor.extract_from_text(item['text'], item.get('filename') or f"text_{index + 1}")
+        results.append({
+            'index': index,
+            'filename': fields.pop('filename'),
+            'fields': fields,
+            'timings': {'processing': round(time.time() - item_start, 4)}
+        })
+
+    return jsonify(trace_summary({'results': results, 'processing_time': round(time.time() - start_time, 3)}))
+
+@app.route("/api/queue", methods=["GET"])
+def queue_status():
+    return jsonify(job_manager.queue_stats())
+
+@app.route("/api/statistics", methods=["GET"])
+def statistics_summary():
+    hours = request.args.get('hours', 24, type=int)
+    return jsonify(stats_store.aggregates(hours))
+
+@app.route("/api/statistics/runs/<run_id>", methods=["GET"])
+def statistics_run(run_id):
+    run = stats_store.get_run(run_id)
+    if run is None:
+        return jsonify({'error': 'Run not found'}), 404
+    return jsonify(run)
+
+@app.route("/api/statistics/runs/<run_id>/export", methods=["GET"])
+def export_statistics_run(run_id):
+    output_format = request.args.get('format', 'csv')
+    if output_format not in ('csv', 'txt'):
+        return jsonify({'error': 'format must be csv or txt'}), 400
+
+    output = StringIO(newline='')
+    if not stats_store.export(run_id, output_format, output):
+        return jsonify({'error': 'Run not found'}), 404
+    prefix = 'invoice_data' if output_format == 'csv' else 'invoice_stats'
+    file_data = BytesIO(output.getvalue().encode('utf-8-sig' if output_format == 'csv' else 'utf-8'))
+    return send_file(file_data, mimetype='text/csv' if output_format == 'csv' else 'text/plain', as_attachment=True,
+                     download_name=f"{prefix}_{run_id}.{output_format}")
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.errorhandler(QueueFullError)
+def handle_queue_full(e):
+    headers = {'Retry-After': str(e.retry_after)}
+    if request.path.startswith('/api/'):
+        return jsonify({'error': str(e), 'retry_after': e.retry_after}), 503, headers
+    return render_template("index.html", error=str(e)), 503, headers
+
+@app.errorhandler(400)
+@app.errorhandler(403)
+@app.errorhandler(413)
+@app.errorhandler(429)
+def handle_bad_upload(e):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': e.description}), e.code
+    return render_template("index.html", error=e.description), e.code
+
 if __name__ == "__main__":
-    app.run(debug=True, threaded=False)
\ No newline at end of file
+    app.run(debug=True, threaded=True)
\ No newline at end of file
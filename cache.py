@@ -0,0 +1,128 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+from resp import RespClient
+
+def content_hash(image):
+    # SHA-256 of an image given as bytes or a path; None if it cannot be read.
+    # Keys the result cache, transcripts and the fake engine's output.
+    digest = hashlib.sha256()
+    try:
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            digest.update(image)
+        else:
+            with open(image, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+    except (OSError, TypeError):
+        return None
+    return digest.hexdigest()
+
+class MemoryCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SQLiteCache:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)')
+        conn.commit()
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO cache (key, value, created_at) VALUES (?, ?, ?)', (key, value, time.time()))
+        conn.commit()
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute('DELETE FROM cache')
+        conn.commit()
+
+class RedisCache:
+    def __init__(self, url, ttl=None, prefix='invoice-ocr:', timeout=2):
+        self.client = RespClient(url, timeout=timeout)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.execute('GET', self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value):
+        if self.ttl:
+            self.client.execute('SET', self.prefix + key, value, 'EX', self.ttl)
+        else:
+            self.client.execute('SET', self.prefix + key, value)
+
+    def clear(self):
+        cursor = '0'
+        while True:
+            cursor, keys = self.client.execute('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 500)
+            cursor = cursor.decode('utf-8')
+            if keys:
+                self.client.execute('DEL', *keys)
+            if cursor == '0':
+                break
+
+def cache_from_url(url):
+    # memory://?max_entries=2048, sqlite:///var/cache/ocr.db, redis://host:6379/0?ttl=86400
+    if not url:
+        return None
+
+    parsed = urlparse(url)
+    options = {name: values[-1] for name, values in parse_qs(parsed.query).items()}
+
+    if parsed.scheme == 'memory':
+        return MemoryCache(int(options.get('max_entries', 1024)))
+    if parsed.scheme == 'sqlite':
+        # sqlite:///relative.db or sqlite:////absolute/path.db
+        path = url[len('sqlite:///'):].split('?', 1)[0]
+        return SQLiteCache(path or 'ocr_cache.db')
+    if parsed.scheme in ('redis', 'tcp'):
+        ttl = int(options['ttl']) if 'ttl' in options else None
+        return RedisCache(url.split('?', 1)[0], ttl=ttl)
+    raise ValueError(f"Unsupported cache URL: {url}")
@@ -0,0 +1,50 @@
+import json
+import os
+from datetime import datetime
+
+class CheckpointJournal:
+    def __init__(self, path):
+        self.path = path
+        self.done = self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+        if self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write("\n")
+
+    def _load(self):
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write leaves a torn last line; that item simply runs again
+                    continue
+                done[entry['key']] = entry
+        return done
+
+    @staticmethod
+    def key_for(path):
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    def is_done(self, key):
+        entry = self.done.get(key)
+        return entry is not None and entry['status'] == 'done'
+
+    def record(self, key, filename, status, error=None):
+        entry = {'key': key, 'filename': filename, 'status': status,
+                 'finished_at': datetime.now().isoformat(timespec='seconds')}
+        if error:
+            entry['error'] = error
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done[key] = entry
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,320 @@
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+
+from recycling import RecyclePolicy
+from text_extraction import TextExtractor
+import tracing
+
+def read_text_inputs(inputs, ndjson=False):
+    for index, path in enumerate(inputs or ['-']):
+        if path == '-':
+            f = sys.stdin
+            name = 'stdin'
+        else:
+            f = open(path, 'r', encoding='utf-8')
+            name = os.path.basename(path)
+
+        try:
+            if not ndjson:
+                yield name, f.read()
+                continue
+
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if isinstance(item, str):
+                    item = {'text': item}
+                yield item.get('filename') or f"{name}:{line_number}", item['text']
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+def run_text(args):
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    start_time = time.time()
+    count = 0
+    try:
+        for filename, text in read_text_inputs(args.inputs, args.ndjson):
+            result = TextExtractor.extract_from_text(text, filename, update_mapping=not args.no_mapping_update)
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            count += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed_time = time.time() - start_time
+    print(f"Processed {count} texts in {elapsed_time:.2f} seconds", file=sys.stderr)
+
+def run_watch(args):
+    from ingest import allowed_file
+    from sinks import open_sink
+    from watcher import FolderWatcher
+
+    index_path = args.index or os.path.join(args.directory, '.processed.json')
+    sink = open_sink(args.output, args.format)
+    watcher = FolderWatcher(args.directory, sink, index_path, allowed_file,
+                            poll_interval=args.interval, settle_time=args.settle, use_inotify=not args.poll)
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+
+    print(f"Watching {watcher.directory} ({watcher.mode}), writing results to {args.output}", file=sys.stderr)
+    try:
+        watcher.run(once=args.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+
+def collect_images(inputs, allowed_file):
+    for path in inputs:
+        if not os.path.isdir(path):
+            yield path, os.path.basename(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if allowed_file(name):
+                    full_path = os.path.join(root, name)
+                    yield full_path, os.path.relpath(full_path, path)
+
+def iter_remote(queue, paths, names):
+    for reply in queue.map(paths, names):
+        if reply.get('error'):
+            yield {'filename': reply['filename'], 'error': reply['error']}
+            continue
+        fields = reply['fields']
+        TextExtractor.update_tax_office_mapping(fields['tax_office_number'], fields['tax_office_name'])
+        yield fields
+
+def run_batch(args):
+    from ingest import allowed_file
+    from checkpoint import CheckpointJournal
+    from sinks import open_sink
+
+    journal_path = args.journal or args.output + '.journal'
+    if args.restart:
+        for path in (args.output, journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    journal = CheckpointJournal(journal_path)
+    paths, names, keys = [], [], []
+    skipped = 0
+    for path, name in collect_images(args.inputs, allowed_file):
+        key = CheckpointJournal.key_for(path)
+        if journal.is_done(key):
+            skipped += 1
+            continue
+        paths.append(path)
+        names.append(name)
+        keys.append(key)
+
+    print(f"{len(paths)} images to process, {skipped} already done according to {journal_path}", file=sys.stderr)
+
+    sink = open_sink(args.output, args.format)
+    start_time = time.time()
+    failed = 0
+    try:
+        if args.broker:
+            from work_queue import WorkQueue
+            results = iter_remote(WorkQueue(args.broker), paths, names)
+        else:
+            TextExtractor.configure_recycling(args.recycle_images, args.recycle_rss_mb)
+            # Recycling needs worker processes, so it runs one even with --workers 1
+            results = TextExtractor.iter_extract(paths, names, parallel=args.workers > 1 or TextExtractor.recycling(),
+                                                 workers=args.workers, raise_errors=False)
+        for index, (key, result) in enumerate(zip(keys, results), 1):
+            if 'error' in result:
+                failed += 1
+                print(f"[{index}/{len(paths)}] {result['filename']} failed: {result['error']}", file=sys.stderr)
+                journal.record(key, result['filename'], 'failed', result['error'])
+                continue
+
+            # The result is on disk before the journal says so; a crash in between
+            # reprocesses the image and may repeat its row, but never loses it.
+            sink.write(result)
+            sink.sync()
+            journal.record(key, result['filename'], 'done')
+            print(f"[{index}/{len(paths)}] {result['filename']}", file=sys.stderr)
+    except KeyboardInterrupt:
+        print("Interrupted, rerun the same command to resume", file=sys.stderr)
+    finally:
+        sink.close()
+        journal.close()
+
+    elapsed_time = time.time() - start_time
+    print(f"Finished in {elapsed_time:.2f} seconds, {failed} failed", file=sys.stderr)
+
+def worker_loop(broker, lease_time, max_attempts, recycle=(0, 0), ready=None, retiring=None, stop=None):
+    from ocr_methods import OCRMethods
+    from work_queue import WorkQueue
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    # Load the models before taking a task so lease time is not spent on it
+    if TextExtractor.needs_models():
+        OCRMethods.warm_up()
+    TextExtractor.get_dictionary()
+    if ready is not None:
+        ready.set()
+
+    policy = RecyclePolicy(*recycle)
+
+    def task_done():
+        reason = policy.record()
+        if reason and retiring is not None:
+            print(f"Worker {os.getpid()} recycling ({reason}), waiting for its replacement", file=sys.stderr)
+            retiring.set()
+
+    queue = WorkQueue(broker, lease_time=lease_time, max_attempts=max_attempts)
+    print(f"Worker {os.getpid()} waiting for tasks from {broker}", file=sys.stderr)
+    queue.work(should_stop=lambda: stopping.is_set() or (stop is not None and stop.is_set()), on_task_done=task_done)
+    print(f"Worker {os.getpid()} stopped", file=sys.stderr)
+
+def start_worker_process(worker_args, recycle):
+    worker = {'ready': multiprocessing.Event(), 'retiring': multiprocessing.Event(), 'stop': multiprocessing.Event(),
+              'replacement': None}
+    worker['process'] = multiprocessing.Process(
+        target=worker_loop, args=worker_args + (recycle, worker['ready'], worker['retiring'], worker['stop']))
+    worker['process'].start()
+    return worker
+
+def run_worker(args):
+    worker_args = (args.broker, args.lease_time, args.max_attempts)
+    recycle = (args.recycle_images, args.recycle_rss_mb)
+    if args.processes == 1 and not any(recycle):
+        worker_loop(*worker_args)
+        return
+
+    workers = [start_worker_process(worker_args, recycle) for _ in range(args.processes)]
+    retired = []
+    stopping = threading.Event()
+
+    def terminate(signum, frame):
+        stopping.set()
+        for worker in workers + [worker['replacement'] for worker in workers if worker['replacement']]:
+            worker['process'].terminate()
+        for process in retired:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    while True:
+        for index, worker in enumerate(workers):
+            replacement = worker['replacement']
+            if worker['retiring'].is_set() and replacement is None and not stopping.is_set():
+                worker['replacement'] = start_worker_process(worker_args, recycle)
+            elif replacement is not None and replacement['ready'].is_set():
+                # The old process finishes its current image and exits
+                worker['stop'].set()
+                retired.append(worker['process'])
+                workers[index] = replacement
+            elif replacement is not None and not replacement['process'].is_alive():
+                print(f"Replacement worker exited with code {replacement['process'].exitcode}, starting another",
+                      file=sys.stderr)
+                worker['replacement'] = None
+        retired = [process for process in retired if process.is_alive()]
+        if not retired and not any(worker['process'].is_alive() for worker in workers):
+            break
+        try:
+            time.sleep(1)
+        except KeyboardInterrupt:
+            # Ctrl+C reaches the workers too; they finish their current task
+            stopping.set()
+
+def run_transcripts(args):
+    import transcripts
+
+    if args.action == 'import':
+        count = transcripts.import_test_logs(args.inputs[0], args.output, args.images)
+        print(f"Imported {count} transcripts to {args.output}", file=sys.stderr)
+    elif args.action == 'compact':
+        count = transcripts.compact(args.inputs, args.output)
+        print(f"Wrote {count} transcripts to {args.output}", file=sys.stderr)
+    else:
+        for path in args.inputs:
+            replay = transcripts.TranscriptReplay(path)
+            print(f"{path}: {', '.join(replay.engines())}; {len(replay.by_hash)} by content, "
+                  f"{len(replay.by_name)} by file name")
+
+def add_recycle_arguments(parser):
+    parser.add_argument('--recycle-images', type=int, default=int(os.environ.get('OCR_RECYCLE_IMAGES', 0)),
+                        help='Replace a worker process after this many images (default: $OCR_RECYCLE_IMAGES or never)')
+    parser.add_argument('--recycle-rss-mb', type=float, default=float(os.environ.get('OCR_RECYCLE_RSS_MB', 0)),
+                        help='Replace a worker process once its RSS passes this many MB (default: $OCR_RECYCLE_RSS_MB or never)')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Command line tools for the invoice OCR pipeline.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    text_parser = subparsers.add_parser('text', help='Extract invoice fields from text that was already OCRed')
+    text_parser.add_argument('inputs', nargs='*', help='Text files, one receipt per file ("-" or nothing reads stdin)')
+    text_parser.add_argument('--ndjson', action='store_true',
+                             help='Inputs are NDJSON, one {"filename": ..., "text": ...} object per line')
+    text_parser.add_argument('-o', '--output', help='Write NDJSON results to this file instead of stdout')
+    text_parser.add_argument('--no-mapping-update', action='store_true',
+                             help=f'Do not add new tax office numbers to {TextExtractor._tax_office_mapping_file}')
+    text_parser.set_defaults(func=run_text)
+
+    batch_parser = subparsers.add_parser('batch', help='Process a set of images, resumable after interruption')
+    batch_parser.add_argument('inputs', nargs='+', help='Image files or folders')
+    batch_parser.add_argument('-o', '--output', required=True, help='CSV or NDJSON file results are appended to')
+    batch_parser.add_argument('--format', choices=['csv', 'ndjson'], help='Output format (default: from the output extension)')
+    batch_parser.add_argument('--journal', help='Checkpoint journal (default: <output>.journal)')
+    batch_parser.add_argument('-w', '--workers', type=int, default=1, help='Worker processes (default: 1)')
+    batch_parser.add_argument('--restart', action='store_true', help='Discard the journal and output and start over')
+    batch_parser.add_argument('--broker', help='Send the images to worker hosts through this broker (redis://host:port/db)')
+    add_recycle_arguments(batch_parser)
+    batch_parser.set_defaults(func=run_batch)
+
+    watch_parser = subparsers.add_parser('watch', help='Watch a folder and process new or changed images')
+    watch_parser.add_argument('directory', help='Folder to watch')
+    watch_parser.add_argument('-o', '--output', required=True, help='CSV or NDJSON file results are appended to')
+    watch_parser.add_argument('--format', choices=['csv', 'ndjson'], help='Output format (default: from the output extension)')
+    watch_parser.add_argument('--index', help='Processed-file index (default: <directory>/.processed.json)')
+    watch_parser.add_argument('--interval', type=float, default=2.0, help='Polling interval / inotify timeout in seconds')
+    watch_parser.add_argument('--settle', type=float, default=1.0,
+                              help='Seconds a file must be unmodified before it is processed')
+    watch_parser.add_argument('--poll', action='store_true', help='Always poll instead of using inotify')
+    watch_parser.add_argument('--once', action='store_true', help='Process pending files once and exit')
+    watch_parser.set_defaults(func=run_watch)
+
+    worker_parser = subparsers.add_parser('worker', help='Run OCR for images queued on a broker')
+    worker_parser.add_argument('--broker', default=os.environ.get('OCR_BROKER_URL'), required='OCR_BROKER_URL' not in os.environ,
+                               help='Broker URL (default: $OCR_BROKER_URL)')
+    worker_parser.add_argument('-p', '--processes', type=int, default=1, help='Worker processes on this host (default: 1)')
+    worker_parser.add_argument('--lease-time', type=int, default=120,
+                               help='Seconds a task stays claimed without a heartbeat before it is retried')
+    worker_parser.add_argument('--max-attempts', type=int, default=3, help='Attempts before a task is dead-lettered')
+    add_recycle_arguments(worker_parser)
+    worker_parser.set_defaults(func=run_worker)
+
+    transcripts_parser = subparsers.add_parser('transcripts', help='Import, compact or inspect recorded OCR output')
+    transcripts_parser.add_argument('action', choices=['import', 'compact', 'stats'])
+    transcripts_parser.add_argument('inputs', nargs='+',
+                                    help='import: test log folder; compact/stats: transcript files')
+    transcripts_parser.add_argument('-o', '--output', help='Transcript file to write (.ndjson or .ndjson.gz)')
+    transcripts_parser.add_argument('--images', default='uploads',
+                                    help='import: folder with the logged images, to match them by content')
+    transcripts_parser.set_defaults(func=run_transcripts)
+
+    args = parser.parse_args(argv)
+    if args.command == 'transcripts' and args.action != 'stats' and not args.output:
+        parser.error('transcripts import/compact need -o/--output')
+    TextExtractor.configure_cache(os.environ.get('OCR_CACHE_URL'))
+    TextExtractor.configure_fake_engine(os.environ.get('OCR_FAKE_ENGINE'))
+    TextExtractor.configure_transcripts(os.environ.get('OCR_TRANSCRIPTS'))
+    tracing.configure(os.environ.get('OCR_TRACE_FILE'), os.environ.get('OCR_TRACE_OTLP_ENDPOINT'),
+                      float(os.environ.get('OCR_TRACE_SAMPLE_RATE', 1.0)))
+    TextExtractor.initialize_tax_office_mapping()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import random
+import time
+
+import transcripts
+from cache import content_hash
+
+# Stand-in OCR engine for load-testing the serving stack without the models:
+#
+#   OCR_FAKE_ENGINE=latency=0.3,jitter=0.1 gunicorn -c gunicorn.conf.py
+#   OCR_FAKE_ENGINE=1 python app.py                       # defaults
+#
+# Settings, comma separated and all optional:
+#   latency  seconds per image (0.2)
+#   jitter   up to this many seconds more or less than the latency (0)
+#   cpu      1 to spin on the CPU instead of sleeping, as an engine holding the GIL would (0)
+#   empty    fraction of images that get no text, so the cascade moves on (0)
+#   text     a text file to return as the OCR output, or a transcript to pick texts from
+# Latency, text and empty results follow from the image content, so an image
+# gets the same output on every run.
+
+# The tax number is one vn_vd.json already has, so load tests do not write to it
+SAMPLE_TEXT = """ÖRNEK GIDA SAN. VE TİC. LTD. ŞTİ.
+BAĞLARBAŞI MAH. NUHKUYUSU CAD. NO:12
+ÜSKÜDAR/İSTANBUL
+ÜSKÜDAR V.D. 9480423762
+TARİH : 15.03.2024
+SAAT : 14:32
+FİŞ NO : 0045
+EKMEK *10,00
+SÜT *32,50
+TOPKDV *3,38
+TOPLAM *42,50
+KREDİ KARTI *42,50"""
+
+class FakeOCR:
+    def __init__(self, latency=0.2, jitter=0.0, cpu=False, empty=0.0, texts=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.cpu = cpu
+        self.empty = empty
+        self.texts = texts or [SAMPLE_TEXT]
+
+    def __call__(self, image):
+        digest = content_hash(image)
+        if digest is None:
+            raise OSError(f"Cannot read image: {image}")
+        rng = random.Random(digest)
+
+        delay = max(0.0, self.latency + self.jitter * (2 * rng.random() - 1))
+        if self.cpu:
+            deadline = time.perf_counter() + delay
+            while time.perf_counter() < deadline:
+                pass
+        else:
+            time.sleep(delay)
+
+        if rng.random() < self.empty:
+            return None
+        return self.texts[rng.randrange(len(self.texts))]
+
+def load_texts(path):
+    if path.endswith(('.ndjson', '.ndjson.gz', '.jsonl', '.jsonl.gz')):
+        return [record['text'] for record in transcripts.read_records(path) if record.get('text')]
+    with open(path, 'r', encoding='utf-8') as f:
+        return [f.read()]
+
+def configure(spec):
+    if not spec or spec == '0':
+        return None
+    settings = {}
+    if spec != '1':
+        for item in spec.split(','):
+            key, _, value = item.partition('=')
+            settings[key.strip()] = value.strip()
+
+    unknown = set(settings) - {'latency', 'jitter', 'cpu', 'empty', 'text'}
+    if unknown:
+        raise ValueError(f"Unknown OCR_FAKE_ENGINE settings: {', '.join(sorted(unknown))}")
+    try:
+        return FakeOCR(
+            latency=float(settings.get('latency', 0.2)),
+            jitter=float(settings.get('jitter', 0)),
+            cpu=settings.get('cpu', '0') == '1',
+            empty=float(settings.get('empty', 0)),
+            texts=load_texts(settings['text']) if settings.get('text') else None
+        )
+    except ValueError as e:
+        raise ValueError(f"Invalid OCR_FAKE_ENGINE {spec!r}: {e}")
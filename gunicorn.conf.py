@@ -0,0 +1,110 @@
+# Production entry point: gunicorn -c gunicorn.conf.py
+#
+# The app and the OCR models are loaded once in the master process and the
+# workers are forked afterwards, so model weights are shared copy-on-write.
+# kill -HUP <master> restarts the workers gracefully and keeps the preloaded
+# models; to pick up new code send USR2 to start a new master, then QUIT the
+# old one once the new workers are serving.
+import gc
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+wsgi_app = 'app:app'
+bind = os.environ.get('OCR_BIND', '0.0.0.0:5000')
+# One worker: /api/jobs state lives in the process that created the job, and
+# the events stream is a separate request. OCR parallelism comes from
+# OCR_WORKERS threads (or the broker); raise this only behind sticky routing.
+workers = int(os.environ.get('OCR_WEB_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('OCR_WEB_THREADS', 4))
+timeout = int(os.environ.get('OCR_WORKER_TIMEOUT', 300))
+graceful_timeout = int(os.environ.get('OCR_GRACEFUL_TIMEOUT', 120))
+keepalive = int(os.environ.get('OCR_KEEPALIVE', 5))
+max_requests = int(os.environ.get('OCR_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('OCR_MAX_REQUESTS_JITTER', 0))
+preload_app = True
+
+preload_models = os.environ.get('OCR_PRELOAD_MODELS', '1') == '1'
+recycle_timeout = int(os.environ.get('OCR_RECYCLE_TIMEOUT', 600))
+
+# Worker recycling (OCR_RECYCLE_IMAGES / OCR_RECYCLE_RSS_MB, see recycling.py):
+# a worker past its limit asks the master for one more worker (TTIN) and waits
+# until that one has finished post_worker_init, then for one fewer (TTOU). The
+# master stops its oldest worker, which nworkers_changed makes the retiring one,
+# and worker_exit lets it finish its queued images. These are created before
+# the workers are forked so all of them share them; one handover runs at a time.
+_handover_lock = multiprocessing.Lock()
+_workers_ready = multiprocessing.Value('L', 0)
+_retiring_pid = multiprocessing.Value('L', 0)
+
+def _warm_up():
+    from ocr_methods import OCRMethods
+    from text_extraction import TextExtractor
+
+    if TextExtractor.needs_models():
+        OCRMethods.warm_up()
+    TextExtractor.get_dictionary()
+    TextExtractor.initialize_tax_office_mapping()
+
+def when_ready(server):
+    if not preload_models:
+        return
+
+    start_time = time.time()
+    _warm_up()
+    # Move everything allocated so far out of the GC generations so the
+    # collector in the workers does not touch (and copy) the shared pages.
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"OCR engines loaded in master in {time.time() - start_time:.2f} seconds")
+
+def post_worker_init(worker):
+    from app import job_manager
+
+    if not preload_models:
+        start_time = time.time()
+        _warm_up()
+        worker.log.info(f"OCR engines loaded in worker {worker.pid} in {time.time() - start_time:.2f} seconds")
+
+    job_manager.on_recycle = lambda reason: threading.Thread(
+        target=_recycle, args=(worker, reason), name='recycle', daemon=True).start()
+    with _workers_ready.get_lock():
+        _workers_ready.value += 1
+
+def _recycle(worker, reason):
+    # Bounded, so a worker that died during its handover cannot block the others
+    locked = _handover_lock.acquire(timeout=recycle_timeout)
+    try:
+        ready = _workers_ready.value
+        worker.log.info(f"Recycling worker {worker.pid} ({reason}), starting its replacement")
+        os.kill(worker.ppid, signal.SIGTTIN)
+        deadline = time.time() + recycle_timeout
+        while _workers_ready.value == ready and time.time() < deadline:
+            time.sleep(0.2)
+        if _workers_ready.value == ready:
+            worker.log.warning(f"Replacement for worker {worker.pid} not ready after {recycle_timeout} seconds")
+
+        # The master handles signals in order, so this TTOU is handled before
+        # the next handover's TTIN and _retiring_pid is still this worker
+        _retiring_pid.value = worker.pid
+        os.kill(worker.ppid, signal.SIGTTOU)
+    finally:
+        if locked:
+            _handover_lock.release()
+
+def nworkers_changed(server, new_value, old_value):
+    # TTOU stops the oldest worker; make the retiring one the oldest
+    worker = server.WORKERS.get(_retiring_pid.value)
+    if old_value is not None and new_value < old_value and worker is not None:
+        worker.age = 0
+
+def worker_exit(server, worker):
+    from app import job_manager
+
+    # Images already queued (e.g. /api/jobs uploads) are finished first; the
+    # master kills the worker once graceful_timeout has passed
+    if not job_manager.drain(graceful_timeout):
+        worker.log.warning(f"Worker {worker.pid} exiting with images still queued")
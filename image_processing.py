@@ -2,12 +2,25 @@ import cv2
 import numpy as np
 import os
 from PIL import Image
+import tracing
 
 class ImageProcessor:    
+    @staticmethod
+    def load_image(image_path):
+        if isinstance(image_path, (bytes, bytearray, memoryview)):
+            return cv2.imdecode(np.frombuffer(image_path, np.uint8), cv2.IMREAD_COLOR)
+        if isinstance(image_path, np.ndarray):
+            return image_path
+        return cv2.imread(image_path)
+
     @staticmethod
     def process_image(image_path):
-        image = cv2.imread(image_path)
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        with tracing.span('decode'):
+            image = ImageProcessor.load_image(image_path)
+        if image is None:
+            return None
+        with tracing.span('preprocess'):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
         
         # clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
         # clahe_image = clahe.apply(gray)
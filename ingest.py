@@ -0,0 +1,147 @@
+import os
+import logging
+import tarfile
+import zipfile
+
+from werkzeug.sansio.multipart import MultipartDecoder, File, Data, Epilogue, NeedData
+from werkzeug.utils import secure_filename
+
+IMAGE_SIGNATURES = [
+    b'\xff\xd8\xff',            # JPEG / JFIF
+    b'\x89PNG\r\n\x1a\n',       # PNG
+    b'II*\x00',                 # TIFF, little endian
+    b'MM\x00*',                 # TIFF, big endian
+    b'BM',                      # BMP
+]
+
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'tiff', 'bmp', 'jfif'}
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+logger = logging.getLogger(__name__)
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def has_image_signature(head):
+    return any(head.startswith(signature) for signature in IMAGE_SIGNATURES)
+
+def is_archive(filename):
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def is_contained(name):
+    # Archive entry names with .. or an absolute path point outside the archive
+    parts = name.replace('\\', '/').split('/')
+    return not name.startswith(('/', '\\')) and '..' not in parts and ':' not in parts[0]
+
+def has_archive_signature(head):
+    return (head.startswith(b'PK\x03\x04')        # ZIP
+            or head.startswith(b'\x1f\x8b')       # gzip
+            or head.startswith(b'BZh')            # bzip2
+            or head.startswith(b'\xfd7zXZ\x00')   # xz
+            or head[257:262] == b'ustar')         # uncompressed tar
+
+def iter_archive_images(path, allowed_file, max_entry_size, spool_dir, memory_limit):
+    # Yields (name, bytes) until memory_limit bytes are held, then (name, path) of
+    # entries written to spool_dir, so a large archive is not queued in memory.
+    # Unreadable archives raise zipfile.BadZipFile or tarfile.TarError.
+    held = 0
+    index = 0
+
+    def keep(name, data):
+        nonlocal held, index
+        index += 1
+        if held + len(data) <= memory_limit:
+            held += len(data)
+            return name, data
+        spool_path = os.path.join(spool_dir, f"{os.path.basename(path)}.{index}{os.path.splitext(name)[1]}")
+        with open(spool_path, 'wb') as f:
+            f.write(data)
+        return name, spool_path
+
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not allowed_file(info.filename):
+                    continue
+                if not is_contained(info.filename):
+                    logger.warning(f"Skipped {info.filename}: path outside the archive")
+                    continue
+                if info.file_size > max_entry_size:
+                    logger.warning(f"Skipped {info.filename}: larger than {max_entry_size} bytes")
+                    continue
+                with archive.open(info) as entry:
+                    data = entry.read(max_entry_size + 1)
+                if len(data) <= max_entry_size and has_image_signature(data):
+                    yield keep(info.filename, data)
+        return
+
+    with tarfile.open(path, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile() or not allowed_file(member.name):
+                continue
+            if not is_contained(member.name):
+                logger.warning(f"Skipped {member.name}: path outside the archive")
+                continue
+            if member.size > max_entry_size:
+                logger.warning(f"Skipped {member.name}: larger than {max_entry_size} bytes")
+                continue
+            data = archive.extractfile(member).read()
+            if has_image_signature(data):
+                yield keep(member.name, data)
+
+def iter_multipart_files(stream, boundary, spool_dir, allowed_file, field_name='files', chunk_size=64 * 1024):
+    decoder = MultipartDecoder(boundary)
+    part = None
+    index = 0
+    input_done = False
+
+    try:
+        while True:
+            event = decoder.next_event()
+
+            if isinstance(event, NeedData):
+                if input_done:
+                    break
+                chunk = stream.read(chunk_size)
+                input_done = not chunk
+                decoder.receive_data(chunk or None)
+                continue
+
+            if isinstance(event, File):
+                part = None
+                if event.name == field_name and event.filename and (allowed_file(event.filename) or is_archive(event.filename)):
+                    filename = secure_filename(event.filename)
+                    path = os.path.join(spool_dir, f"{index}_{filename}")
+                    part = {'filename': filename, 'path': path, 'file': open(path, 'wb'), 'head': b''}
+                    index += 1
+                continue
+
+            if isinstance(event, Data):
+                if part is None:
+                    continue
+
+                if len(part['head']) < 512:
+                    part['head'] += event.data[:512 - len(part['head'])]
+                part['file'].write(event.data)
+
+                if not event.more_data:
+                    part['file'].close()
+                    completed, part = part, None
+                    if is_archive(completed['filename']):
+                        valid = has_archive_signature(completed['head'])
+                    else:
+                        valid = has_image_signature(completed['head'])
+                    if valid:
+                        yield completed['filename'], completed['path']
+                    else:
+                        logger.warning(f"Rejected {completed['filename']}: content does not match its file type")
+                        os.remove(completed['path'])
+                continue
+
+            if isinstance(event, Epilogue):
+                break
+    finally:
+        if part is not None:
+            part['file'].close()
+            os.remove(part['path'])
@@ -0,0 +1,424 @@
+import contextvars
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from resources import ResourceSampler
+from resp import RespError
+from text_extraction import TextExtractor
+import profiling
+import tracing
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"OCR queue is full, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+class JobManager:
+    def __init__(self, max_workers=1, max_queue=None, max_finished_jobs=100, work_queue=None, result_timeout=3600,
+                 sample_interval=0.25, recycle=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ocr-worker')
+        self._max_workers = max_workers
+        self._max_queue = max_queue
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._max_finished_jobs = max_finished_jobs
+        self._outstanding = 0
+        self._running = 0
+        self._recent_waits = deque(maxlen=100)
+        self._recent_processing = deque(maxlen=100)
+        self._sample_interval = sample_interval
+        # RecyclePolicy for this process; on_recycle(reason) is called once when it
+        # trips (gunicorn.conf.py sets it to start the worker handover)
+        self._recycle = recycle
+        self.on_recycle = None
+        # on_finish(snapshot) is called when a job finishes, before its waiters
+        # wake; what it returns is kept as the job's 'statistics'
+        self.on_finish = None
+
+        # Remote mode: images go to a broker and OCR runs on worker hosts (cli.py worker)
+        self._work_queue = work_queue
+        self._result_timeout = result_timeout
+        self._reply_to = None
+        self._collector_pid = None
+
+    def create(self, cleanup_dir=None):
+        TextExtractor.initialize_tax_office_mapping()
+        job_id = uuid.uuid4().hex
+        trace = tracing.current_trace()
+        if trace is not None:
+            # Keeps the request's trace open until the job finishes, for /api/jobs
+            trace.hold()
+        profile = profiling.current_profile()
+        if profile is not None:
+            profile.hold()
+        # Samples this process (and its children) for the life of the job; with a
+        # broker the OCR itself runs elsewhere and is not included
+        sampler = ResourceSampler(self._sample_interval).start() if self._sample_interval else None
+        with self._lock:
+            self._prune_finished()
+            self._jobs[job_id] = {
+                'id': job_id,
+                'status': 'queued',
+                'created': time.time(),
+                'started': None,
+                'finished': None,
+                'finishing': False,
+                'sealed': False,
+                'total': 0,
+                'completed': 0,
+                'failed': 0,
+                'images': [],
+                'cleanup_dir': cleanup_dir,
+                'trace': trace,
+                'profile': profile,
+                'sampler': sampler
+            }
+        return job_id
+
+    def add(self, job_id, image_path, filename):
+        with self._lock:
+            self._reserve(1)
+            index = self._append_image(self._jobs[job_id], filename)
+        self._dispatch(job_id, index, image_path, filename)
+        return index
+
+    def seal(self, job_id):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['sealed'] = True
+            done = self._finish_if_done(job)
+        if done:
+            self._finish(job)
+
+    def cancel(self, job_id):
+        # Fails the images that have not started and frees their queue slots;
+        # running images finish, then the job completes and its cleanup_dir goes
+        with self._lock:
+            job = self._jobs[job_id]
+            job['sealed'] = True
+            for image in job['images']:
+                if image['status'] == 'pending':
+                    image['status'] = 'failed'
+                    image['error'] = 'Cancelled'
+                    job['failed'] += 1
+                    image['sequence'] = job['completed'] + job['failed']
+                    self._outstanding -= 1
+            done = self._finish_if_done(job)
+            self._changed.notify_all()
+        if done:
+            self._finish(job)
+
+    def submit(self, image_paths, filenames, cleanup_dir=None):
+        job_id = self.create(cleanup_dir)
+        with self._lock:
+            try:
+                self._reserve(len(image_paths))
+            except QueueFullError:
+                job = self._jobs.pop(job_id)
+                if job['sampler'] is not None:
+                    job['sampler'].stop()
+                if job['profile'] is not None:
+                    job['profile'].release()
+                raise
+            indexes = [self._append_image(self._jobs[job_id], filename) for filename in filenames]
+        for index, image_path, filename in zip(indexes, image_paths, filenames):
+            self._dispatch(job_id, index, image_path, filename)
+        self.seal(job_id)
+        return job_id
+
+    def check_capacity(self, count):
+        with self._lock:
+            if self._max_queue and self._outstanding + count > self._max_queue:
+                raise QueueFullError(self._retry_after(count))
+
+    def queue_counts(self):
+        # Waiting and running images from the local counters, without asking the broker
+        with self._lock:
+            return self._outstanding - self._running, self._running
+
+    def queue_stats(self):
+        broker = None
+        if self._work_queue is not None:
+            try:
+                broker = self._work_queue.stats()
+            except (OSError, RespError) as e:
+                broker = {'error': str(e)}
+
+        with self._lock:
+            return {
+                'depth': self._outstanding - self._running,
+                'running': self._running,
+                'capacity': self._max_queue,
+                'workers': self._max_workers,
+                'avg_wait_time': round(sum(self._recent_waits) / len(self._recent_waits), 3) if self._recent_waits else 0,
+                'max_wait_time': round(max(self._recent_waits), 3) if self._recent_waits else 0,
+                'avg_processing_time': round(self._average_processing_time(), 3),
+                'estimated_wait_time': round(self._estimated_wait(0), 3),
+                'recycle': {'images': self._recycle.images, 'reason': self._recycle.reason}
+                if self._recycle is not None and self._recycle.enabled else None,
+                'broker': broker
+            }
+
+    def drain(self, timeout=None):
+        # Waits for the queued and running images, e.g. before the process exits
+        with self._lock:
+            return self._changed.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def wait(self, job_id, timeout=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            # The job may be pruned while waiting; the reference stays valid
+            self._changed.wait_for(lambda: job['finished'] is not None, timeout)
+            return self._snapshot(job)
+
+    def iter_results(self, job_id, keepalive=15, after=0):
+        # Images in the order they finished; 'sequence' numbers them from 1, so a
+        # client that reconnects can pass the last one it got as after
+        last = after
+        while True:
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return
+
+                def has_news():
+                    return job['finished'] is not None or job['completed'] + job['failed'] > last
+
+                self._changed.wait_for(has_news, keepalive)
+                ready = sorted((dict(image) for image in job['images'] if (image['sequence'] or 0) > last),
+                               key=lambda image: image['sequence'])
+                finished = job['finished'] is not None
+
+            if not ready and not finished:
+                yield None
+            for image in ready:
+                last = image['sequence']
+                yield image
+            if finished and not ready:
+                return
+
+    def _reserve(self, count):
+        if self._max_queue and self._outstanding + count > self._max_queue:
+            raise QueueFullError(self._retry_after(count))
+        self._outstanding += count
+
+    def _append_image(self, job, filename):
+        index = job['total']
+        job['total'] += 1
+        job['images'].append({
+            'index': index,
+            'filename': filename,
+            'status': 'pending',
+            'fields': None,
+            'engine': None,
+            'field_engines': None,
+            'ocr_times': None,
+            'queued': time.time(),
+            'wait_time': None,
+            'processing_time': None,
+            'error': None,
+            'sequence': None
+        })
+        return index
+
+    def _average_processing_time(self):
+        if not self._recent_processing:
+            return 0
+        return sum(self._recent_processing) / len(self._recent_processing)
+
+    def _estimated_wait(self, count):
+        return (self._outstanding + count) * self._average_processing_time() / self._max_workers
+
+    def _retry_after(self, count):
+        return max(1, math.ceil(self._estimated_wait(count)))
+
+    def _dispatch(self, job_id, index, image_path, filename):
+        if self._work_queue is None:
+            # Run in a copy of the caller's context so spans join the request's trace
+            self._executor.submit(contextvars.copy_context().run, self._run, job_id, index, image_path)
+            return
+
+        with self._lock:
+            # Started on first use so that, with gunicorn preloading, every worker
+            # process collects its own results rather than the master
+            if self._collector_pid != os.getpid():
+                self._collector_pid = os.getpid()
+                self._reply_to = self._work_queue.new_reply_list()
+                threading.Thread(target=self._collect_remote_results, name='ocr-results', daemon=True).start()
+
+        try:
+            self._work_queue.enqueue(image_path, filename, self._reply_to,
+                                     {'job_id': job_id, 'index': index, 'trace': tracing.current_context()})
+        except (OSError, RespError) as e:
+            print(f"Error sending {filename} to the work queue: {e}")
+            self._record(job_id, index, None, None, f"Work queue unavailable: {e}", 0)
+
+    def _collect_remote_results(self):
+        while True:
+            try:
+                reply = self._work_queue.wait_reply(self._reply_to)
+            except (OSError, RespError) as e:
+                print(f"Error reading results from the work queue: {e}")
+                time.sleep(5)
+                continue
+
+            if reply is not None:
+                meta = reply['meta']
+                if reply.get('error') is None:
+                    fields = reply['fields']
+                    TextExtractor.update_tax_office_mapping(fields['tax_office_number'], fields['tax_office_name'])
+                self._record(meta['job_id'], meta['index'], reply.get('fields'), reply, reply.get('error'),
+                             reply.get('processing_time', 0), reply.get('wait_time'))
+            self._expire_remote_images()
+
+    def _expire_remote_images(self):
+        cutoff = time.time() - self._result_timeout
+        with self._lock:
+            expired = [(job['id'], image['index']) for job in self._jobs.values() for image in job['images']
+                       if image['status'] == 'pending' and image['queued'] < cutoff]
+        for job_id, index in expired:
+            self._record(job_id, index, None, None, f"No result within {self._result_timeout} seconds", 0)
+
+    def _run(self, job_id, index, image_path):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['images'][index]['status'] != 'pending':
+                # Cancelled before it started
+                return
+            image = job['images'][index]
+            if job['started'] is None:
+                job['started'] = time.time()
+                job['status'] = 'running'
+            image['status'] = 'running'
+            image['wait_time'] = round(time.time() - image['queued'], 3)
+            self._recent_waits.append(image['wait_time'])
+            self._running += 1
+
+        start_time = time.time()
+        tracing.record_span('queue.wait', image['queued'], start_time)
+        try:
+            with profiling.attach():
+                fields, details = TextExtractor.extract_single(image_path, image['filename'], with_details=True)
+            error = None
+        except Exception as e:
+            print(f"Error processing {image['filename']}: {e}")
+            fields = details = None
+            error = str(e)
+
+        self._record(job_id, index, fields, details, error, time.time() - start_time)
+        if self._recycle is not None:
+            reason = self._recycle.record()
+            if reason:
+                self._recycle_requested(reason)
+
+    def _recycle_requested(self, reason):
+        if self.on_recycle is None:
+            print(f"Process {os.getpid()} reached its recycling limit ({reason}), but only gunicorn can replace it")
+            return
+        self.on_recycle(reason)
+
+    def _record(self, job_id, index, fields, details, error, processing_time, wait_time=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['images'][index]['status'] in ('done', 'failed'):
+                # Pruned job, or a late remote result for an image that already timed out
+                return
+            image = job['images'][index]
+            if job['started'] is None:
+                job['started'] = time.time()
+                job['status'] = 'running'
+            if wait_time is not None:
+                image['wait_time'] = wait_time
+                self._recent_waits.append(wait_time)
+            image['processing_time'] = round(processing_time, 2)
+            self._recent_processing.append(processing_time)
+            if self._work_queue is None:
+                self._running -= 1
+            self._outstanding -= 1
+            if error is None:
+                image['status'] = 'done'
+                image['fields'] = fields
+                image['engine'] = details['engine']
+                image['field_engines'] = details['field_engines']
+                image['ocr_times'] = details['ocr_times']
+                job['completed'] += 1
+            else:
+                image['status'] = 'failed'
+                image['error'] = error
+                job['failed'] += 1
+            image['sequence'] = job['completed'] + job['failed']
+            done = self._finish_if_done(job)
+            self._changed.notify_all()
+        if done:
+            self._finish(job)
+
+    def _finish_if_done(self, job):
+        # Called with the lock held; True once, for the caller to run _finish after releasing it
+        if not job['sealed'] or job['finishing']:
+            return False
+        if job['completed'] + job['failed'] < job['total']:
+            return False
+        job['finishing'] = True
+        return True
+
+    def _finish(self, job):
+        if job['sampler'] is not None:
+            job['sampler'].stop()
+        statistics = None
+        if self.on_finish is not None:
+            with self._lock:
+                snapshot = self._snapshot(job)
+            try:
+                statistics = self.on_finish(snapshot)
+            except Exception as e:
+                print(f"Error recording statistics for job {job['id']}: {e}")
+        if job['trace'] is not None:
+            job['trace'].release()
+        if job['profile'] is not None:
+            job['profile'].release()
+        if job['cleanup_dir']:
+            shutil.rmtree(job['cleanup_dir'], ignore_errors=True)
+
+        with self._lock:
+            job['statistics'] = statistics
+            job['finished'] = time.time()
+            job['status'] = 'completed'
+            self._changed.notify_all()
+
+    def _prune_finished(self):
+        finished = [job for job in self._jobs.values() if job['finished'] is not None]
+        finished.sort(key=lambda job: job['finished'])
+        for job in finished[:max(0, len(finished) - self._max_finished_jobs + 1)]:
+            del self._jobs[job['id']]
+
+    @staticmethod
+    def _snapshot(job):
+        done = job['completed'] + job['failed']
+        return {
+            'id': job['id'],
+            'status': job['status'],
+            'created': job['created'],
+            'started': job['started'],
+            'finished': job['finished'],
+            'total': job['total'],
+            'completed': job['completed'],
+            'failed': job['failed'],
+            'progress': round(done / job['total'] * 100, 2) if job['total'] else 0,
+            'images': [dict(image) for image in job['images']],
+            'resources': job['sampler'].summary() if job['sampler'] is not None else None,
+            'statistics': job.get('statistics')
+        }
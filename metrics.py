@@ -0,0 +1,138 @@
+import os
+import threading
+
+import psutil
+
+# In-process metrics in the Prometheus text exposition format. Every process
+# keeps its own values, so with several gunicorn workers each one reports
+# what it handled itself.
+
+REGISTRY = []
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in labels]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self._function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        # Evaluated at scrape time, for values owned by something else (queue depth, RSS)
+        self._function = function
+
+    def samples(self):
+        if self._function is None:
+            return super().samples()
+        try:
+            return [(self.name, (), self._function())]
+        except Exception as e:
+            print(f"Error collecting {self.name}: {e}")
+            return []
+
+class Histogram(Metric):
+    type_name = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, state in self._values.items():
+                for bound, count in zip(self.buckets, state['buckets']):
+                    samples.append((f"{self.name}_bucket", key + (('le', _format_value(bound)),), count))
+                samples.append((f"{self.name}_sum", key, state['sum']))
+                samples.append((f"{self.name}_count", key, state['count']))
+        return samples
+
+def render():
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+_process = psutil.Process(os.getpid())
+
+def _rss():
+    global _process
+    if _process.pid != os.getpid():
+        _process = psutil.Process(os.getpid())
+    return _process.memory_info().rss
+
+OCR_ENGINE_SECONDS = Histogram('ocr_engine_seconds', 'Time spent in each OCR engine per image', ['engine'])
+OCR_ENGINE_EMPTY = Counter('ocr_engine_empty_total', 'OCR engine runs that returned no text', ['engine'])
+FIELD_EXTRACTION_SECONDS = Histogram('field_extraction_seconds', 'Time spent extracting each field from OCR text',
+                                     ['field'], buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+FIELD_EXTRACTIONS = Counter('field_extractions_total', 'Field extraction outcomes', ['field', 'result'])
+CASCADE_DEPTH = Histogram('ocr_cascade_depth', 'Number of OCR engines run per image', buckets=(1, 2, 3, 4, 5))
+IMAGE_SECONDS = Histogram('ocr_image_seconds', 'End-to-end processing time per image')
+IMAGES_PROCESSED = Counter('ocr_images_total', 'Images processed, by where the result came from', ['source'])
+CACHE_REQUESTS = Counter('ocr_cache_requests_total', 'OCR result cache lookups', ['kind', 'result'])
+MODEL_LOAD_SECONDS = Gauge('ocr_model_load_seconds', 'Time it took to load each OCR model', ['engine'])
+QUEUE_DEPTH = Gauge('ocr_queue_depth', 'Images waiting for an OCR worker')
+QUEUE_RUNNING = Gauge('ocr_queue_running', 'Images currently being processed')
+PROCESS_RSS = Gauge('process_resident_memory_bytes', 'Resident memory of this process', function=_rss)
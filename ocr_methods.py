@@ -2,6 +2,8 @@ import os
 os.environ['PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION'] = 'python'
 
 import subprocess
+import threading
+import time
 import pytesseract
 import easyocr
 from PIL import Image
@@ -12,6 +14,7 @@ from surya.model.detection.model import load_model as load_det_model, load_proce
 from surya.model.recognition.model import load_model as load_rec_model
 from surya.model.recognition.processor import load_processor as load_rec_processor
 from image_processing import ImageProcessor
+from metrics import MODEL_LOAD_SECONDS
 
 import warnings
 import logging
@@ -35,8 +38,36 @@ for path in TESSERACT_PATHS:
 
 _easyocr_reader = None
 _paddle_ocr = None
+_model_lock = threading.Lock()
 
 class OCRMethods:
+    @staticmethod
+    def get_easyocr_reader():
+        global _easyocr_reader
+        if _easyocr_reader is None:
+            with _model_lock:
+                if _easyocr_reader is None:
+                    start_time = time.time()
+                    _easyocr_reader = easyocr.Reader(['tr'], gpu=False)
+                    MODEL_LOAD_SECONDS.set(time.time() - start_time, engine='EasyOCR')
+        return _easyocr_reader
+
+    @staticmethod
+    def get_paddle_ocr():
+        global _paddle_ocr
+        if _paddle_ocr is None:
+            with _model_lock:
+                if _paddle_ocr is None:
+                    start_time = time.time()
+                    _paddle_ocr = PaddleOCR(use_angle_cls=True, lang='en', use_gpu=False, show_log=False)
+                    MODEL_LOAD_SECONDS.set(time.time() - start_time, engine='PaddleOCR')
+        return _paddle_ocr
+
+    @staticmethod
+    def warm_up():
+        OCRMethods.get_paddle_ocr()
+        OCRMethods.get_easyocr_reader()
+
     @staticmethod
     def _calculate_adaptive_threshold(image):
         try:
@@ -64,7 +95,7 @@ class OCRMethods:
 
     @staticmethod
     def extract_with_pytesseract(image_path):
-        if not os.path.isfile(image_path):
+        if isinstance(image_path, (str, os.PathLike)) and not os.path.isfile(image_path):
             return None
 
         try:
@@ -83,15 +114,11 @@ class OCRMethods:
     @staticmethod
     def extract_with_easyocr(image_path):
         try:
-            global _easyocr_reader
             image = ImageProcessor.process_image(image_path)
             if image is None:
                 return None
-                
-            if _easyocr_reader is None:
-                _easyocr_reader = easyocr.Reader(['tr'], gpu=False)
             
-            results = _easyocr_reader.readtext(image)
+            results = OCRMethods.get_easyocr_reader().readtext(image)
             if not results:
                 return None
 
@@ -131,20 +158,16 @@ class OCRMethods:
     @staticmethod
     def extract_with_paddleocr(image_path):
         try:
-            global _paddle_ocr
             image = ImageProcessor.process_image(image_path)
             if image is None:
                 return None
-
-            if _paddle_ocr is None:
-                _paddle_ocr = PaddleOCR(use_angle_cls=True, lang='en', use_gpu=False, show_log=False)
                 
             if hasattr(image, 'shape'):
                 height = image.shape[0]
             elif isinstance(image, Image.Image):
                 height = image.size[1]
 
-            result = _paddle_ocr.ocr(image)
+            result = OCRMethods.get_paddle_ocr().ocr(image)
             if not result or not result[0]:
                 return None
 
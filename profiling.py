@@ -0,0 +1,239 @@
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# On-demand profiles of single requests. A profile follows the request into the
+# OCR worker threads through the context, as traces do, and is written out when
+# the request and its job are both done:
+#
+#   sample    the stacks of the profiled threads are read every few milliseconds;
+#             low overhead, wall-clock time (waiting shows up too), written as
+#             collapsed stacks for flamegraph.pl, speedscope or inferno
+#   cprofile  every call is instrumented; exact call counts, CPU-heavy code runs
+#             several times slower, written as a .prof file for pstats or snakeviz
+#
+# Both modes also write the top functions by cumulative time to <id>.txt.
+
+MODES = ('sample', 'cprofile')
+
+_current_profile = contextvars.ContextVar('profile', default=None)
+
+_active = []
+_sampler_pid = None
+_sampler_lock = threading.Lock()
+
+class Profile:
+    def __init__(self, name, mode='sample', output_dir='profiles', interval=0.005, top=40):
+        self.id = time.strftime('%Y%m%d_%H%M%S') + '_' + os.urandom(3).hex()
+        self.name = name
+        self.mode = mode
+        self.output_dir = output_dir
+        self.interval = interval
+        self.top = top
+        self.started = time.time()
+        self.files = {}
+        self.stacks = Counter()
+        self.samples = 0
+        self.ticks = 0
+        self.skipped_threads = 0
+        self._threads = {}
+        self._profilers = []
+        self._lock = threading.Lock()
+        self._holders = 0
+        self._token = None
+        self._attachment = None
+
+    def hold(self):
+        with self._lock:
+            self._holders += 1
+
+    def release(self):
+        with self._lock:
+            self._holders -= 1
+            done = self._holders == 0
+        if done:
+            self._finish()
+
+    @contextmanager
+    def attach(self):
+        # Profiles the calling thread until the block exits
+        if self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ allows one active cProfile per process
+                with self._lock:
+                    self.skipped_threads += 1
+                yield
+                return
+            try:
+                yield
+            finally:
+                profiler.disable()
+                with self._lock:
+                    self._profilers.append(profiler)
+            return
+
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._threads[thread_id] = self._threads.get(thread_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads[thread_id] -= 1
+                if not self._threads[thread_id]:
+                    del self._threads[thread_id]
+
+    def _sample(self, frames, names):
+        with self._lock:
+            threads = list(self._threads)
+            self.ticks += 1
+        for thread_id in threads:
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                module = frame.f_globals.get('__name__') or os.path.basename(code.co_filename)
+                stack.append(f"{module}:{getattr(code, 'co_qualname', code.co_name)}")
+                frame = frame.f_back
+            # ocr-worker_0, ocr-worker_1, ... are merged into one root
+            stack.append(names.get(thread_id, 'thread').rstrip('_0123456789'))
+            with self._lock:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def _finish(self):
+        with _sampler_lock:
+            if self in _active:
+                _active.remove(self)
+        duration = time.time() - self.started
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, self.id)
+        try:
+            if self.mode == 'cprofile':
+                self._write_cprofile(base, duration)
+            else:
+                self._write_samples(base, duration)
+        except Exception as e:
+            print(f"Error writing profile {self.id}: {e}")
+
+    def _header(self, duration):
+        return (f"{self.name}\nmode: {self.mode}, duration: {duration:.3f} seconds, "
+                f"started: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started))}\n\n")
+
+    def _write_cprofile(self, base, duration):
+        with self._lock:
+            profilers = list(self._profilers)
+        if not profilers:
+            return
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        self.files['prof'] = base + '.prof'
+        stats.dump_stats(self.files['prof'])
+
+        report = io.StringIO()
+        report.write(self._header(duration))
+        if self.skipped_threads:
+            report.write(f"{self.skipped_threads} threads could not be profiled (another profiler was active)\n\n")
+        stats.stream = report
+        stats.sort_stats('cumulative').print_stats(self.top)
+        self.files['txt'] = base + '.txt'
+        with open(self.files['txt'], 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+
+    def _write_samples(self, base, duration):
+        with self._lock:
+            stacks = dict(self.stacks)
+            samples = self.samples
+            # Sampling runs a little behind the interval, so time per sample is measured
+            period = duration / self.ticks if self.ticks else self.interval
+        self.files['collapsed'] = base + '.collapsed'
+        with open(self.files['collapsed'], 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        cumulative, own = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')[1:]
+            # Recursive functions count once per sample
+            for frame in set(frames):
+                cumulative[frame] += count
+            if frames:
+                own[frames[-1]] += count
+
+        self.files['txt'] = base + '.txt'
+        with open(self.files['txt'], 'w', encoding='utf-8') as f:
+            f.write(self._header(duration))
+            f.write(f"{samples} samples every {period * 1000:.2f} ms (wall clock, all profiled threads)\n\n")
+            f.write(f"{'cumulative':>16} {'self':>16}  function\n")
+            for frame, count in cumulative.most_common(self.top):
+                f.write(f"{count * period:>9.3f}s {count / samples * 100:>5.1f}% "
+                        f"{own[frame] * period:>9.3f}s {own[frame] / samples * 100:>5.1f}%  {frame}\n")
+
+def _sample_loop():
+    while True:
+        with _sampler_lock:
+            profiles = [profile for profile in _active if profile.mode == 'sample']
+        if profiles:
+            frames = sys._current_frames()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for profile in profiles:
+                profile._sample(frames, names)
+            del frames
+        time.sleep(min((profile.interval for profile in profiles), default=0.05))
+
+def _register(profile):
+    global _sampler_pid
+    with _sampler_lock:
+        _active.append(profile)
+        # Started on first use so every gunicorn worker has its own sampler
+        if profile.mode == 'sample' and _sampler_pid != os.getpid():
+            _sampler_pid = os.getpid()
+            threading.Thread(target=_sample_loop, name='profile-sampler', daemon=True).start()
+
+def active_count():
+    with _sampler_lock:
+        return len(_active)
+
+def start(name, mode='sample', output_dir='profiles', interval=0.005, top=40):
+    profile = Profile(name, mode, output_dir, interval, top)
+    profile.hold()
+    profile._token = _current_profile.set(profile)
+    _register(profile)
+    profile._attachment = profile.attach()
+    profile._attachment.__enter__()
+    return profile
+
+def end(profile):
+    profile._attachment.__exit__(None, None, None)
+    try:
+        _current_profile.reset(profile._token)
+    except ValueError:
+        # Ended from a different context than it was started in (e.g. after a streamed response)
+        _current_profile.set(None)
+    profile.release()
+
+def current_profile():
+    return _current_profile.get()
+
+@contextmanager
+def attach():
+    # Joins the profile of the context this runs in, if there is one
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    with profile.attach():
+        yield
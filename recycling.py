@@ -0,0 +1,136 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import psutil
+
+# Processes running the OCR engines grow over time: PaddleOCR, EasyOCR and Torch
+# keep native memory that is only given back when the process exits. Workers are
+# therefore replaced after a number of images or once their RSS passes a limit,
+# and the replacement is started and warmed up before the old one stops, so
+# there is never a worker less than configured:
+#
+#   OCR_RECYCLE_IMAGES=500 OCR_RECYCLE_RSS_MB=3000 gunicorn -c gunicorn.conf.py
+#   python cli.py batch uploads/ -o out.csv -w 4 --recycle-images 200
+#   python cli.py worker -p 2 --recycle-rss-mb 3000
+#
+# The handover is done by gunicorn.conf.py for the web workers, RecyclingPool
+# for cli.py batch and run_worker in cli.py for the broker workers.
+
+def rss_mb():
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+class RecyclePolicy:
+    # 0 turns a limit off
+    def __init__(self, max_images=0, max_rss_mb=0):
+        self.max_images = max_images
+        self.max_rss_mb = max_rss_mb
+        self.images = 0
+        self.reason = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.max_images or self.max_rss_mb)
+
+    def record(self, rss=None):
+        # Counts a finished image; returns the reason the first time a limit is passed
+        with self._lock:
+            self.images += 1
+            if self.reason is not None or not self.enabled:
+                return None
+            if self.max_images and self.images >= self.max_images:
+                self.reason = f"{self.images} images"
+            elif self.max_rss_mb:
+                rss = rss_mb() if rss is None else rss
+                if rss >= self.max_rss_mb:
+                    self.reason = f"RSS {rss:.0f} MB"
+            return self.reason
+
+def _call(fn, args):
+    return fn(*args), rss_mb()
+
+class _Worker:
+    def __init__(self, initializer, initargs, policy):
+        self.executor = ProcessPoolExecutor(max_workers=1, initializer=initializer, initargs=initargs)
+        # Starts the process, which runs the initializer (model warm-up) first
+        self.ready = self.executor.submit(os.getpid)
+        self.policy = policy
+        self.in_flight = 0
+        self.replacement = None
+
+class RecyclingPool:
+    # Process pool with the map() of ProcessPoolExecutor, where each process is
+    # replaced once its RecyclePolicy trips. The old process keeps taking images
+    # while its replacement warms up, then exits after the ones it has.
+    def __init__(self, max_workers, initializer=None, initargs=(), max_images=0, max_rss_mb=0):
+        self._initializer = initializer
+        self._initargs = initargs
+        self._max_images = max_images
+        self._max_rss_mb = max_rss_mb
+        self._workers = [self._start() for _ in range(max_workers)]
+        self._retired = []
+        self.recycled = 0
+
+    def _start(self):
+        return _Worker(self._initializer, self._initargs, RecyclePolicy(self._max_images, self._max_rss_mb))
+
+    def _join_retired(self):
+        # Retired workers whose results have all been collected have no work left,
+        # so joining them is quick; only the ones still finishing images stay listed
+        for worker in [worker for worker in self._retired if worker.in_flight == 0]:
+            worker.executor.shutdown(wait=True)
+            self._retired.remove(worker)
+
+    def _swap_ready(self):
+        self._join_retired()
+        for index, worker in enumerate(self._workers):
+            replacement = worker.replacement
+            if replacement is None or not replacement.ready.done():
+                continue
+            # Raises if the new process could not start
+            replacement.ready.result()
+            self._workers[index] = replacement
+            worker.executor.shutdown(wait=False)
+            self._retired.append(worker)
+            self.recycled += 1
+
+    def map(self, fn, *iterables):
+        tasks = zip(*iterables)
+        pending = deque()
+        while True:
+            self._swap_ready()
+            # Two images per process, one running and one waiting, so a process
+            # can be swapped out without a long queue behind it
+            while len(pending) < 2 * len(self._workers):
+                args = next(tasks, None)
+                if args is None:
+                    break
+                worker = min(self._workers, key=lambda worker: worker.in_flight)
+                worker.in_flight += 1
+                pending.append((worker, worker.executor.submit(_call, fn, args)))
+            if not pending:
+                return
+
+            worker, future = pending.popleft()
+            result, rss = future.result()
+            worker.in_flight -= 1
+            reason = worker.policy.record(rss)
+            if reason and worker.replacement is None:
+                print(f"Recycling OCR worker process ({reason})")
+                worker.replacement = self._start()
+            yield result
+
+    def shutdown(self, wait=True):
+        workers = self._workers + self._retired
+        workers += [worker.replacement for worker in self._workers if worker.replacement is not None]
+        for worker in workers:
+            worker.executor.shutdown(wait=wait, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        return False
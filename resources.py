@@ -0,0 +1,305 @@
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import psutil
+
+# Stages (OCR engines, text correction) currently running, by thread. The
+# sampler splits the CPU time of each interval between the active stages, so
+# per-engine numbers are an approximation when several jobs run at once.
+_active_stages = {}
+
+@contextmanager
+def active_stage(name):
+    thread_id = threading.get_ident()
+    previous = _active_stages.get(thread_id)
+    _active_stages[thread_id] = name
+    try:
+        yield
+    finally:
+        if previous is None:
+            _active_stages.pop(thread_id, None)
+        else:
+            _active_stages[thread_id] = previous
+
+def _cpu_busy_time(times):
+    # Busy and total CPU seconds, counted as psutil.cpu_percent does (guest time is part of user time)
+    total = sum(times) - getattr(times, 'guest', 0) - getattr(times, 'guest_nice', 0)
+    return total - times.idle - getattr(times, 'iowait', 0), total
+
+class ResourceSampler:
+    def __init__(self, interval=0.25, include_children=True, max_samples=10000, pid=None):
+        self.interval = interval
+        self.include_children = include_children
+        self.max_samples = max_samples
+        self.samples = []
+        self.stages = {}
+        self._process = psutil.Process(pid)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._started = None
+        self._last_cpu_time = None
+        self._last_time = None
+        # System CPU from psutil.cpu_times() deltas; psutil.cpu_percent(None) keeps one
+        # module-level reference shared by every sampler, so concurrent samplers skew each other
+        self._last_system_cpu = None
+        self._dropped = 0
+
+    def start(self):
+        self._started = time.time()
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None and not self._stopped.is_set():
+            self._stopped.set()
+            self._thread.join()
+            self.sample()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sample()
+            except psutil.Error as e:
+                print(f"Error sampling resources: {e}")
+
+    def _processes(self):
+        processes = [self._process]
+        if self.include_children:
+            # Keep the same Process objects between samples; psutil needs them for CPU deltas
+            current = {}
+            for child in self._process.children(recursive=True):
+                current[child.pid] = self._children.get(child.pid, child)
+            self._children = current
+            processes.extend(current.values())
+        return processes
+
+    def sample(self):
+        with self._lock:
+            rss = 0
+            threads = 0
+            cpu_time = 0.0
+            for process in self._processes():
+                try:
+                    with process.oneshot():
+                        rss += process.memory_info().rss
+                        threads += process.num_threads()
+                        times = process.cpu_times()
+                        cpu_time += times.user + times.system
+                except psutil.NoSuchProcess:
+                    continue
+
+            now = time.monotonic()
+            elapsed = now - self._last_time if self._last_time is not None else 0
+            cpu_delta = max(0.0, cpu_time - self._last_cpu_time) if self._last_cpu_time is not None else 0.0
+            self._last_time, self._last_cpu_time = now, cpu_time
+
+            system_busy, system_total = _cpu_busy_time(psutil.cpu_times())
+            system_cpu = 0.0
+            if self._last_system_cpu is not None:
+                busy_delta = system_busy - self._last_system_cpu[0]
+                total_delta = system_total - self._last_system_cpu[1]
+                if total_delta > 0:
+                    system_cpu = min(100.0, max(0.0, busy_delta / total_delta * 100))
+            self._last_system_cpu = (system_busy, system_total)
+
+            stages = sorted(set(_active_stages.values()))
+            sample = {
+                't': round(time.time() - self._started, 3),
+                'cpu': round(cpu_delta / elapsed * 100, 2) if elapsed > 0 else 0.0,
+                'system_cpu': round(system_cpu, 2),
+                'memory_mb': round(rss / 1024 / 1024, 2),
+                'threads': threads,
+                'stages': stages
+            }
+
+            if len(self.samples) < self.max_samples:
+                self.samples.append(sample)
+            else:
+                self._dropped += 1
+            for stage in stages:
+                entry = self.stages.setdefault(stage, {'cpu_seconds': 0.0, 'time_seconds': 0.0, 'peak_memory_mb': 0.0})
+                entry['cpu_seconds'] += cpu_delta / len(stages)
+                entry['time_seconds'] += elapsed
+                entry['peak_memory_mb'] = max(entry['peak_memory_mb'], sample['memory_mb'])
+        return sample
+
+    def summary(self):
+        with self._lock:
+            samples = list(self.samples)
+            stages = {name: {key: round(value, 3) for key, value in entry.items()} for name, entry in self.stages.items()}
+
+        if not samples:
+            return {'samples': 0}
+
+        cpu = [sample['cpu'] for sample in samples[1:]] or [0.0]
+        system_cpu = [sample['system_cpu'] for sample in samples[1:]] or [0.0]
+        memory = [sample['memory_mb'] for sample in samples]
+        return {
+            'samples': len(samples) + self._dropped,
+            'interval': self.interval,
+            'duration': samples[-1]['t'],
+            'cpu_avg': round(sum(cpu) / len(cpu), 2),
+            'cpu_max': round(max(cpu), 2),
+            'system_cpu_avg': round(sum(system_cpu) / len(system_cpu), 2),
+            'memory_avg': round(sum(memory) / len(memory), 2),
+            'memory_max': round(max(memory), 2),
+            'memory_start': memory[0],
+            'memory_end': memory[-1],
+            'threads_max': max(sample['threads'] for sample in samples),
+            'stages': stages
+        }
+
+# Set while a MemoryTracker is running; see track_memory()
+_memory_tracker = None
+
+class MemoryTracker:
+    # RSS and Python heap (tracemalloc) deltas around each OCR engine call and
+    # each image. RSS also sees native allocations (Paddle, Torch, OpenCV) that
+    # tracemalloc cannot, so native = RSS - Python. Deltas are process-wide:
+    # with several images in flight they include the other threads, so measure
+    # one image at a time.
+    def __init__(self, frames=1):
+        self.frames = frames
+        self.calls = []
+        self.rss_start = None
+        self._process = psutil.Process()
+        self._lock = threading.Lock()
+        self._owns_tracemalloc = False
+
+    def start(self):
+        global _memory_tracker
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._owns_tracemalloc = True
+        self.rss_start = self._rss()
+        _memory_tracker = self
+        return self
+
+    def stop(self):
+        global _memory_tracker
+        if _memory_tracker is self:
+            _memory_tracker = None
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+        return self
+
+    def _rss(self):
+        return self._process.memory_info().rss / 1024 / 1024
+
+    @contextmanager
+    def measure(self, kind, name):
+        rss_before = self._rss()
+        python_before = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            rss_after = self._rss()
+            python_after = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+            with self._lock:
+                self.calls.append({
+                    'kind': kind,
+                    'name': name,
+                    'seconds': round(time.perf_counter() - start, 3),
+                    'rss_mb': round(rss_after, 2),
+                    'python_mb': round(python_after, 2),
+                    'rss_delta_mb': round(rss_after - rss_before, 3),
+                    'python_delta_mb': round(python_after - python_before, 3),
+                    'native_delta_mb': round((rss_after - rss_before) - (python_after - python_before), 3)
+                })
+
+    def summary(self, min_growth_mb=20.0):
+        with self._lock:
+            calls = list(self.calls)
+        images = [call for call in calls if call['kind'] == 'image']
+        engines = {}
+        for call in calls:
+            if call['kind'] == 'engine':
+                engines.setdefault(call['name'], []).append(call)
+
+        engine_summary = {}
+        for name, engine_calls in engines.items():
+            cumulative, total = [], 0.0
+            for call in engine_calls:
+                total += call['rss_delta_mb']
+                cumulative.append(total)
+            engine_summary[name] = {
+                'calls': len(engine_calls),
+                'rss_delta_mb': round(total, 2),
+                'python_delta_mb': round(sum(call['python_delta_mb'] for call in engine_calls), 2),
+                'native_delta_mb': round(sum(call['native_delta_mb'] for call in engine_calls), 2),
+                'max_call_delta_mb': round(max(call['rss_delta_mb'] for call in engine_calls), 2),
+                'growth': growth(cumulative, min_growth_mb)
+            }
+        return {
+            'rss_start_mb': round(self.rss_start, 2) if self.rss_start is not None else None,
+            'images': len(images),
+            'rss_growth': growth([call['rss_mb'] for call in images], min_growth_mb),
+            'python_growth': growth([call['python_mb'] for call in images], min_growth_mb),
+            'engines': engine_summary
+        }
+
+@contextmanager
+def track_memory(kind, name):
+    tracker = _memory_tracker
+    if tracker is None:
+        yield
+        return
+    with tracker.measure(kind, name):
+        yield
+
+def growth(values, min_growth_mb=20.0):
+    # Steady growth rather than a one-off jump (model loading, a cache filling
+    # once): the lowest value of the last quarter is above the highest of the
+    # first quarter, and the fitted trend adds up to at least min_growth_mb
+    if len(values) < 8:
+        return {'points': len(values), 'flagged': False}
+    steps = len(values)
+    mean_x = (steps - 1) / 2
+    mean_y = sum(values) / steps
+    slope = (sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+             / sum((x - mean_x) ** 2 for x in range(steps)))
+    quarter = steps // 4
+    rising = min(values[-quarter:]) > max(values[:quarter])
+    return {
+        'points': steps,
+        'start_mb': round(values[0], 2),
+        'end_mb': round(values[-1], 2),
+        'slope_mb_per_step': round(slope, 4),
+        'trend_mb': round(slope * (steps - 1), 2),
+        'rising': rising,
+        'flagged': rising and slope * (steps - 1) >= min_growth_mb
+    }
+
+def snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        # The tracker's own records
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    ))
+
+def top_growth(before, after, top=20):
+    # Allocation sites that hold more memory in the later snapshot
+    key = 'traceback' if after.traceback_limit > 1 else 'lineno'
+    sites = []
+    for stat in after.compare_to(before, key)[:top]:
+        if stat.size_diff <= 0:
+            break
+        sites.append({
+            'site': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            'size_diff_kb': round(stat.size_diff / 1024, 1),
+            'count_diff': stat.count_diff,
+            'size_kb': round(stat.size / 1024, 1)
+        })
+    return sites
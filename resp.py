@@ -0,0 +1,112 @@
+import os
+import socket
+import threading
+from urllib.parse import urlparse
+
+class RespError(Exception):
+    pass
+
+class RespClient:
+    # Minimal client for the Redis protocol (RESP2), enough for the cache and
+    # work queue without pulling in a driver. One connection per thread and
+    # per process, so it is safe across gunicorn forks.
+    def __init__(self, url='redis://localhost:6379/0', timeout=10):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        conn = (sock, sock.makefile('rb'))
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        if self.password:
+            self.execute('AUTH', self.password)
+        if self.db:
+            self.execute('SELECT', self.db)
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _encode(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode('utf-8')
+            elif not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode('utf-8')
+        if prefix == b'-':
+            raise RespError(payload.decode('utf-8'))
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if prefix == b'*':
+            length = int(payload)
+            if length == -1:
+                return None
+            return [self._read_reply(reader) for _ in range(length)]
+        raise RespError(f"Unexpected reply: {line!r}")
+
+    def execute(self, *args, timeout=None):
+        sock, reader = self._connection()
+        try:
+            if timeout is not None:
+                sock.settimeout(timeout)
+            sock.sendall(self._encode(args))
+            return self._read_reply(reader)
+        except (OSError, ConnectionError):
+            self._reset()
+            raise
+        finally:
+            if timeout is not None and self._local.conn is not None:
+                sock.settimeout(self.timeout)
+
+    def transaction(self, *commands):
+        # MULTI/EXEC sent in one write: the server runs all the commands or, if
+        # the connection drops before EXEC arrives, none of them
+        sock, reader = self._connection()
+        try:
+            sock.sendall(b''.join(self._encode(args) for args in [('MULTI',), *commands, ('EXEC',)]))
+            replies = [self._read_reply(reader) for _ in range(len(commands) + 2)]
+        except (OSError, ConnectionError, RespError):
+            # Replies may be left unread after an error; start over on a new connection
+            self._reset()
+            raise
+        if replies[-1] is None:
+            raise RespError("Transaction aborted")
+        return replies[-1]
+
+    def close(self):
+        self._reset()
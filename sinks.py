@@ -0,0 +1,47 @@
+import csv
+import json
+import os
+
+CSV_HEADERS = ['Filename', 'Date', 'Time', 'Tax Office Name', 'Tax Office Number', 'Total Cost', 'VAT', 'Payment Methods']
+CSV_FIELDS = ['filename', 'date', 'time', 'tax_office_name', 'tax_office_number', 'total_cost', 'vat', 'payment_method']
+
+class CsvSink:
+    def __init__(self, path):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='', encoding='utf-8-sig' if new_file else 'utf-8')
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow(CSV_HEADERS)
+            self._file.flush()
+
+    def write(self, result):
+        self._writer.writerow([str(result.get(field, 'N/A')) for field in CSV_FIELDS])
+        self._file.flush()
+
+    def sync(self):
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+class NdjsonSink:
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, result):
+        self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def sync(self):
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+def open_sink(path, output_format=None):
+    output_format = output_format or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    if output_format == 'csv':
+        return CsvSink(path)
+    if output_format == 'ndjson':
+        return NdjsonSink(path)
+    raise ValueError(f"Unknown output format: {output_format}")
@@ -0,0 +1,248 @@
+import csv
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+FIELDS = ['date', 'time', 'tax_office_name', 'tax_office_number', 'total_cost', 'vat', 'payment_method']
+CSV_HEADERS = ['Filename', 'Date', 'Time', 'Tax Office Name', 'Tax Office Number', 'Total Cost', 'VAT', 'Payment Methods']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    stats TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    filename TEXT,
+    engine TEXT,
+    processing_time REAL,
+    fields TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id, position);
+CREATE TABLE IF NOT EXISTS hourly (
+    hour TEXT PRIMARY KEY,
+    runs INTEGER NOT NULL DEFAULT 0,
+    images INTEGER NOT NULL DEFAULT 0,
+    fields_attempted INTEGER NOT NULL DEFAULT 0,
+    fields_found INTEGER NOT NULL DEFAULT 0,
+    processing_time REAL NOT NULL DEFAULT 0,
+    peak_memory_mb REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS engine_hourly (
+    hour TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    runs INTEGER NOT NULL DEFAULT 0,
+    images INTEGER NOT NULL DEFAULT 0,
+    ocr_seconds REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, engine)
+);
+"""
+
+def _hour(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:00Z')
+
+def write_results_csv(f, results):
+    writer = csv.writer(f)
+    writer.writerow(CSV_HEADERS)
+    for row in results:
+        writer.writerow([str(row.get(field, 'N/A')) for field in ['filename'] + FIELDS])
+
+def write_statistics_txt(f, stats, results):
+    f.write("=" * 80 + "\n\n")
+    f.write("FINAL STATISTICS:\n")
+    f.write(f"Total images processed: {stats['total_images']}\n")
+    f.write(f"Total fields attempted: {stats['total_fields_attempted']}\n")
+    f.write(f"Successful extractions: {stats['successful_extractions']}\n")
+    f.write(f"Failed extractions (N/A): {stats['failed_extractions']}\n")
+    f.write(f"Overall success rate: {stats['success_rate']:.2f}%\n")
+    f.write(f"Total execution time: {stats['processing_time']:.2f} seconds\n")
+    f.write(f"Average CPU Usage: {stats['avg_cpu_usage']:.2f}%\n")
+    f.write(f"Peak CPU Usage: {stats['peak_cpu_usage']:.2f}%\n")
+    f.write(f"Average Memory Usage: {stats['avg_memory_usage']:.2f} MB\n")
+    f.write(f"Peak Memory Usage: {stats['peak_memory_usage']:.2f} MB\n")
+    f.write("\n" + "=" * 80 + "\n")
+
+    resources = stats.get('resources')
+    if resources and resources.get('samples'):
+        f.write("\nRESOURCE USAGE:\n")
+        f.write("-" * 50 + "\n")
+        f.write(f"Samples: {resources['samples']} every {resources['interval']} seconds\n")
+        f.write(f"Average System CPU Usage: {resources['system_cpu_avg']:.2f}%\n")
+        f.write(f"Memory at start/end: {resources['memory_start']:.2f} MB / {resources['memory_end']:.2f} MB\n")
+        f.write(f"Peak Threads: {resources['threads_max']}\n")
+        for stage, usage in sorted(resources['stages'].items(), key=lambda item: item[1]['cpu_seconds'], reverse=True):
+            f.write(f"{stage}: {usage['cpu_seconds']:.2f} CPU seconds over {usage['time_seconds']:.2f} seconds, "
+                    f"peak memory {usage['peak_memory_mb']:.2f} MB\n")
+        f.write("\n" + "=" * 80 + "\n")
+
+    f.write("\nFIELD-LEVEL ACCURACY:\n")
+    f.write("-" * 50 + "\n")
+    for field in FIELDS:
+        success = sum(1 for result in results if result.get(field) != 'N/A')
+        accuracy = (success / len(results) * 100) if results else 0
+        f.write(f"{field}: {accuracy:.2f}% ({success}/{len(results)})\n")
+    f.write("\n" + "=" * 80 + "\n")
+
+class StatsStore:
+    # Runs and their results are appended to SQLite by a background thread, so
+    # requests only pay for a queue put. Hourly and per-engine aggregates are
+    # updated in the same transaction; the old per-request CSV/TXT files can be
+    # rebuilt from a stored run with export().
+    def __init__(self, path, batch_size=100):
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = None
+        self._writer_pid = None
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _put(self, item):
+        with self._lock:
+            # Started on first use so every gunicorn worker has its own writer
+            if self._writer_pid != os.getpid():
+                self._queue = queue.Queue(maxsize=10000)
+                self._writer_pid = os.getpid()
+                threading.Thread(target=self._write_loop, args=(self._queue,), name='stats-writer', daemon=True).start()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            print("Statistics queue is full, dropping a run")
+            return False
+
+    def record_run(self, stats, images):
+        run_id = uuid.uuid4().hex
+        self._put((run_id, time.time(), stats, [dict(image) for image in images]))
+        return run_id
+
+    def flush(self, timeout=10):
+        if self._queue is None or self._writer_pid != os.getpid():
+            return True
+        done = threading.Event()
+        return self._put(done) and done.wait(timeout)
+
+    def _write_loop(self, items):
+        conn = self._connect()
+        while True:
+            batch = [items.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(items.get_nowait())
+                except queue.Empty:
+                    break
+
+            runs = [item for item in batch if isinstance(item, tuple)]
+            if runs:
+                try:
+                    with conn:
+                        for run in runs:
+                            self._write_run(conn, *run)
+                except sqlite3.Error as e:
+                    print(f"Error writing statistics: {e}")
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    @staticmethod
+    def _write_run(conn, run_id, created_at, stats, images):
+        hour = _hour(created_at)
+        conn.execute('INSERT INTO runs (id, created_at, stats) VALUES (?, ?, ?)',
+                     (run_id, created_at, json.dumps(stats, ensure_ascii=False)))
+        conn.executemany(
+            'INSERT INTO results (run_id, position, filename, engine, processing_time, fields, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(run_id, position, image['filename'], image.get('engine'), image.get('processing_time'),
+              json.dumps(image.get('fields') or {}, ensure_ascii=False), created_at)
+             for position, image in enumerate(images)])
+
+        conn.execute(
+            'INSERT INTO hourly (hour, runs, images, fields_attempted, fields_found, processing_time, peak_memory_mb) '
+            'VALUES (?, 1, ?, ?, ?, ?, ?) ON CONFLICT (hour) DO UPDATE SET '
+            'runs = runs + 1, images = images + excluded.images, '
+            'fields_attempted = fields_attempted + excluded.fields_attempted, '
+            'fields_found = fields_found + excluded.fields_found, '
+            'processing_time = processing_time + excluded.processing_time, '
+            'peak_memory_mb = MAX(peak_memory_mb, excluded.peak_memory_mb)',
+            (hour, stats['total_images'], stats['total_fields_attempted'], stats['successful_extractions'],
+             stats['processing_time'], stats.get('peak_memory_usage', 0)))
+
+        engines = {}
+        for image in images:
+            for engine, seconds in (image.get('ocr_times') or {}).items():
+                usage = engines.setdefault(engine, {'runs': 0, 'images': 0, 'ocr_seconds': 0.0})
+                usage['runs'] += 1
+                usage['ocr_seconds'] += seconds
+            if image.get('engine'):
+                engines.setdefault(image['engine'], {'runs': 0, 'images': 0, 'ocr_seconds': 0.0})['images'] += 1
+        conn.executemany(
+            'INSERT INTO engine_hourly (hour, engine, runs, images, ocr_seconds) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (hour, engine) DO UPDATE SET runs = runs + excluded.runs, '
+            'images = images + excluded.images, ocr_seconds = ocr_seconds + excluded.ocr_seconds',
+            [(hour, engine, usage['runs'], usage['images'], usage['ocr_seconds']) for engine, usage in engines.items()])
+
+    def aggregates(self, hours=24):
+        since = _hour(time.time() - hours * 3600)
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            hourly = [dict(row) for row in conn.execute('SELECT * FROM hourly WHERE hour >= ? ORDER BY hour', (since,))]
+            engines = [dict(row) for row in conn.execute(
+                'SELECT * FROM engine_hourly WHERE hour >= ? ORDER BY hour, engine', (since,))]
+        finally:
+            conn.close()
+
+        for row in hourly:
+            row['success_rate'] = round(row['fields_found'] / row['fields_attempted'] * 100, 2) if row['fields_attempted'] else 0
+            row['avg_image_time'] = round(row['processing_time'] / row['images'], 3) if row['images'] else 0
+        for row in engines:
+            # runs counts every time the engine was tried, images how often its text was the primary one
+            row['avg_ocr_seconds'] = round(row['ocr_seconds'] / row['runs'], 3) if row['runs'] else 0
+        return {'hourly': hourly, 'engines': engines}
+
+    def get_run(self, run_id):
+        self.flush()
+        conn = self._connect()
+        try:
+            run = conn.execute('SELECT created_at, stats FROM runs WHERE id = ?', (run_id,)).fetchone()
+            if run is None:
+                return None
+            rows = conn.execute('SELECT filename, engine, processing_time, fields FROM results '
+                                'WHERE run_id = ? ORDER BY position', (run_id,)).fetchall()
+        finally:
+            conn.close()
+
+        return {
+            'id': run_id,
+            'created_at': run[0],
+            'statistics': json.loads(run[1]),
+            'images': [{'filename': filename, 'engine': engine, 'processing_time': processing_time,
+                        'fields': json.loads(fields)} for filename, engine, processing_time, fields in rows]
+        }
+
+    def export(self, run_id, output_format, f):
+        run = self.get_run(run_id)
+        if run is None:
+            return False
+        results = [image['fields'] for image in run['images'] if image['fields']]
+        if output_format == 'csv':
+            write_results_csv(f, results)
+        else:
+            write_statistics_txt(f, run['statistics'], results)
+        return True
@@ -0,0 +1,325 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from harness import ROOT, find_images, git_commit, latency_summary
+
+from ocr_methods import OCRMethods
+from resources import ResourceSampler
+from text_extraction import TextExtractor, _init_worker, physical_core_count
+
+# python test/benchmark.py --engines paddle tesseract easyocr --workers 2 --repeat 3 -o results.json
+# Each engine runs on its own (raw text -> correct_text -> field extractors), as the
+# old per-engine scripts did; "cascade" runs the full production pipeline and
+# "cascade:tesseract,paddle" the pipeline with a different engine order.
+
+ENGINES = {
+    'paddle': ('PaddleOCR', 'extract_with_paddleocr'),
+    'tesseract': ('Tesseract', 'extract_with_pytesseract'),
+    'easyocr': ('EasyOCR', 'extract_with_easyocr'),
+    'surya': ('SuryaOCR', 'extract_with_suryaocr'),
+    'llama': ('LlamaOCR', 'extract_with_llamaocr'),
+    'cascade': ('Cascade', None),
+}
+FIELDS = ['date', 'time', 'tax_office_name', 'tax_office_number', 'total_cost', 'vat', 'payment_method']
+
+def engine_spec(value):
+    if value.startswith('cascade:'):
+        cascade_engines(value)
+    elif value not in ENGINES:
+        raise argparse.ArgumentTypeError(f"unknown engine {value!r} (choose from {', '.join(sorted(ENGINES))})")
+    return value
+
+def engine_label(engine):
+    if engine.startswith('cascade:'):
+        return 'Cascade(' + '>'.join(name for name, _ in cascade_engines(engine)) + ')'
+    return ENGINES[engine][0]
+
+def cascade_engines(spec):
+    cascade = []
+    for engine in spec.split(':', 1)[1].split(','):
+        if engine not in ENGINES or engine == 'cascade':
+            raise argparse.ArgumentTypeError(f"unknown engine {engine!r} in {spec!r}")
+        cascade.append((ENGINES[engine][0], engine_method(engine)))
+    return cascade
+
+def engine_method(engine):
+    if engine.startswith('cascade:'):
+        cascade_engines(engine)
+        return None
+    method_name = ENGINES[engine][1]
+    method = getattr(OCRMethods, method_name, None) if method_name else None
+    if method_name and method is None:
+        raise ValueError(f"{ENGINES[engine][0]} is not available in ocr_methods.py")
+    if method is not None and TextExtractor._transcripts is not None:
+        # Recording or replaying OCR output (--transcripts)
+        method = TextExtractor._transcripts.wrap([(ENGINES[engine][0], method)])[0][1]
+    return method
+
+def found(value):
+    return isinstance(value, str) and value.strip() != 'N/A'
+
+def run_image(engine, image_path, keep_text=False):
+    filename = os.path.basename(image_path)
+    start = time.perf_counter()
+    if engine.startswith('cascade'):
+        default_cascade = TextExtractor._ocr_cascade
+        if engine != 'cascade':
+            TextExtractor._ocr_cascade = cascade_engines(engine)
+        try:
+            fields, details = TextExtractor.extract_single(image_path, filename, with_details=True, update_mapping=False)
+        finally:
+            TextExtractor._ocr_cascade = default_cascade
+        return {
+            'filename': filename,
+            'latency': time.perf_counter() - start,
+            'ocr_time': sum(details['ocr_times'].values()),
+            'ocr_failed': not any(found(fields[field]) for field in FIELDS),
+            'fields': fields,
+            'engine': details['engine'],
+            'text': None
+        }
+
+    text = engine_method(engine)(image_path)
+    ocr_time = time.perf_counter() - start
+    fields = None
+    if text:
+        fields = TextExtractor.extract_from_text(text, filename, update_mapping=False)
+    return {
+        'filename': filename,
+        'latency': time.perf_counter() - start,
+        'ocr_time': ocr_time,
+        'ocr_failed': not text,
+        'fields': fields or dict({field: 'N/A' for field in FIELDS}, filename=filename),
+        'engine': engine_label(engine),
+        'text': TextExtractor.correct_text(text) if keep_text and text else None
+    }
+
+def _run_in_worker(engine, image_path, keep_text):
+    return run_image(engine, image_path, keep_text)
+
+_ready_barrier = None
+
+def _init_benchmark_worker(barrier, *initargs):
+    global _ready_barrier
+    _ready_barrier = barrier
+    _init_worker(*initargs)
+
+def _worker_ready(_):
+    # A worker blocks here until every worker holds a warm-up task, so an idle
+    # worker cannot take a second one and leave another process unstarted
+    _ready_barrier.wait(timeout=900)
+    return os.getpid()
+
+def benchmark_engine(engine, images, workers=1, repeat=1, warmup=True, keep_text=False):
+    engine_method(engine)
+    TextExtractor.initialize_tax_office_mapping()
+    if warmup and images:
+        # Model loading is reported separately from steady-state latency
+        warmup_start = time.perf_counter()
+        run_image(engine, images[0])
+        warmup_time = time.perf_counter() - warmup_start
+    else:
+        warmup_time = None
+
+    runs = []
+    if workers > 1:
+        barrier = multiprocessing.Barrier(workers)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_benchmark_worker,
+                                 initargs=(barrier, None, TextExtractor._transcripts_spec,
+                                           TextExtractor._fake_engine_spec)) as executor:
+            # Start every worker (and load its models) before the clock starts
+            list(executor.map(_worker_ready, range(workers)))
+            sampler = ResourceSampler(interval=0.1).start()
+            start = time.perf_counter()
+            for repetition in range(repeat):
+                for result in executor.map(_run_in_worker, [engine] * len(images), images,
+                                           [keep_text and repetition == 0] * len(images)):
+                    runs.append(dict(result, repeat=repetition))
+            wall_time = time.perf_counter() - start
+    else:
+        sampler = ResourceSampler(interval=0.1).start()
+        start = time.perf_counter()
+        for repetition in range(repeat):
+            for image_path in images:
+                runs.append(dict(run_image(engine, image_path, keep_text and repetition == 0), repeat=repetition))
+        wall_time = time.perf_counter() - start
+    resources = sampler.stop().summary()
+
+    field_success = {}
+    for field in FIELDS:
+        hits = sum(1 for run in runs if found(run['fields'].get(field)))
+        field_success[field] = round(hits / len(runs) * 100, 2) if runs else 0
+    total_fields = len(runs) * len(FIELDS)
+    successful = sum(1 for run in runs for field in FIELDS if found(run['fields'].get(field)))
+
+    return {
+        'engine': engine_label(engine),
+        'images': len(images),
+        'runs': len(runs),
+        'workers': workers,
+        'warmup_time': round(warmup_time, 3) if warmup_time is not None else None,
+        'wall_time': round(wall_time, 3),
+        'throughput': round(len(runs) / wall_time, 3) if wall_time else 0,
+        'latency': latency_summary([run['latency'] for run in runs]),
+        'ocr_latency': latency_summary([run['ocr_time'] for run in runs]),
+        'ocr_failures': sum(1 for run in runs if run['ocr_failed']),
+        'field_success': field_success,
+        'success_rate': round(successful / total_fields * 100, 2) if total_fields else 0,
+        'peak_rss_mb': resources.get('memory_max'),
+        'cpu_avg': resources.get('cpu_avg'),
+        'per_image': [{
+            'filename': run['filename'],
+            'repeat': run['repeat'],
+            'latency': round(run['latency'], 4),
+            'ocr_time': round(run['ocr_time'], 4),
+            'ocr_failed': run['ocr_failed'],
+            'fields': run['fields'] if run['repeat'] == 0 else None,
+            'text': run['text']
+        } for run in runs]
+    }
+
+def write_legacy_logs(result, log_dir):
+    # Same stats/data files the per-engine scripts used to write to test/test_logs
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(log_dir, exist_ok=True)
+    name = result['engine']
+    first_runs = [run for run in result['per_image'] if run['repeat'] == 0]
+    log_file = os.path.join(log_dir, f'{name}_stats_{timestamp}.txt')
+    csv_file = os.path.join(log_dir, f'{name}_data_{timestamp}.csv')
+
+    with open(csv_file, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Filename', 'Date', 'Time', 'Tax Office Name', 'Tax Office Number',
+                         'Total Cost', 'VAT', 'Payment Method'])
+        for run in first_runs:
+            if not run['ocr_failed']:
+                writer.writerow([run['filename']] + [run['fields'][field] for field in FIELDS])
+
+    with open(log_file, 'w', encoding='utf-8') as f:
+        for run in first_runs:
+            f.write("=" * 80 + "\n")
+            f.write(f"\nTesting {name} on: {run['filename']}\n")
+            if run['ocr_failed']:
+                f.write("OCR failed to read the image - counting all fields as failed\n")
+                continue
+            if run['text'] is not None:
+                f.write("-" * 40 + "\n")
+                f.write("\nProcessed Text Output:\n")
+                f.write(run['text'] + "\n")
+            f.write("-" * 40 + "\n")
+            f.write("\nExtracted Fields:\n")
+            for field_name, value in run['fields'].items():
+                f.write(f"{field_name}: {value} {'✓' if found(value) else '✗'}\n")
+            f.write("-" * 40 + "\n\n")
+
+        total_fields = result['runs'] * len(FIELDS)
+        successful = round(result['success_rate'] * total_fields / 100)
+        f.write("=" * 80 + "\n\n")
+        f.write("FINAL STATISTICS:\n")
+        f.write(f"Total images processed: {result['images']}\n")
+        f.write(f"Total fields attempted: {total_fields}\n")
+        f.write(f"Successful extractions: {successful}\n")
+        f.write(f"Failed extractions (N/A): {total_fields - successful}\n")
+        f.write(f"Overall success rate: {result['success_rate']:.2f}%\n")
+        f.write(f"Total execution time: {result['wall_time']:.2f} seconds\n")
+        f.write(f"Average CPU Usage: {result['cpu_avg'] or 0:.2f}%\n")
+        f.write(f"Peak Memory Usage: {result['peak_rss_mb'] or 0:.2f} MB\n")
+        f.write("=" * 80 + "\n")
+        f.write("\nFIELD-LEVEL ACCURACY:\n")
+        for field, rate in result['field_success'].items():
+            f.write(f"{field}: {rate:.2f}%\n")
+        f.write("\n" + "=" * 80 + "\n")
+
+    print(f"Log file: {log_file}")
+    print(f"CSV file: {csv_file}")
+
+def print_summary(result):
+    latency = result['latency'] or {}
+    print(f"{result['engine']:<10} {result['runs']:>5} runs  {result['throughput']:>7.2f} img/s  "
+          f"p50 {latency.get('p50', 0):.3f}s  p95 {latency.get('p95', 0):.3f}s  p99 {latency.get('p99', 0):.3f}s  "
+          f"success {result['success_rate']:.2f}%  peak RSS {result['peak_rss_mb'] or 0:.1f} MB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark OCR engines on a set of receipt images')
+    parser.add_argument('--engines', nargs='+', type=engine_spec, default=['cascade'],
+                        help=f"{', '.join(sorted(ENGINES))} or cascade:<engine>,<engine>,...")
+    parser.add_argument('--images', default=os.path.join(ROOT, 'uploads'), help='Directory of images')
+    parser.add_argument('--pattern', help='Only images whose name matches this regular expression')
+    parser.add_argument('--limit', type=int, help='Only the first N images (natural sort order)')
+    parser.add_argument('--sample', type=int, help='A random sample of N images')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for --sample')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help=f'Worker processes (this machine has {physical_core_count()} physical cores)')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='Times to process each image')
+    parser.add_argument('--no-warmup', dest='warmup', action='store_false',
+                        help='Include model loading in the first measurement')
+    parser.add_argument('-o', '--output', help='JSON results file (default: test/benchmark_results/benchmark_<time>.json)')
+    parser.add_argument('--transcripts', default=os.environ.get('OCR_TRANSCRIPTS'),
+                        help='record:<file> to save OCR output, replay:<file> to benchmark extraction without OCR')
+    parser.add_argument('--legacy-logs', action='store_true',
+                        help='Also write <Engine>_stats/_data files to test/test_logs')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.images):
+        print(f"Images directory not found at: {args.images}")
+        return 1
+    images = find_images(args.images, args.pattern, args.limit, args.sample, args.seed)
+    if not images:
+        print("No image files found.")
+        return 1
+    TextExtractor.configure_transcripts(args.transcripts)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'images_dir': os.path.abspath(args.images),
+            'images': [os.path.basename(path) for path in images],
+            'pattern': args.pattern,
+            'limit': args.limit,
+            'sample': args.sample,
+            'seed': args.seed,
+            'workers': args.workers,
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'transcripts': args.transcripts
+        },
+        'results': {}
+    }
+
+    for engine in args.engines:
+        try:
+            result = benchmark_engine(engine, images, args.workers, args.repeat, args.warmup, keep_text=args.legacy_logs)
+        except ValueError as e:
+            print(f"Skipping {engine}: {e}")
+            report['results'][engine] = {'error': str(e)}
+            continue
+        report['results'][engine] = result
+        print_summary(result)
+        if args.legacy_logs:
+            write_legacy_logs(result, os.path.join(ROOT, 'test', 'test_logs'))
+
+    output = args.output
+    if output is None:
+        output_dir = os.path.join(ROOT, 'test', 'benchmark_results')
+        os.makedirs(output_dir, exist_ok=True)
+        output = os.path.join(output_dir, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Results written to: {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
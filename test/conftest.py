@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app.py opens its statistics database on import; keep the tests' runs out of statistics/
+os.environ.setdefault('STATS_DB', os.path.join(tempfile.mkdtemp(prefix='ocr-tests-'), 'stats.db'))
+
+from resp_server import Server
+
+# The test_<engine>.py files are command line wrappers around benchmark.py, not tests
+collect_ignore = ['test_easy_ocr.py', 'test_tesseract_ocr.py', 'test_surya_ocr.py', 'test_paddle_ocr.py',
+                  'test_llama_ocr.py', 'test_single_file.py']
+
+FIELDS = ['date', 'time', 'tax_office_name', 'tax_office_number', 'total_cost', 'vat', 'payment_method']
+
+def jpeg(content=b''):
+    # Passes the signature checks in ingest.py; the fake pipeline reads the rest
+    return b'\xff\xd8\xff\xe0' + content
+
+class FakeExtract:
+    # Stands in for TextExtractor.extract_single: images containing b'fail' raise,
+    # images containing b'block' wait until release is set
+    def __init__(self):
+        self.release = threading.Event()
+        self.release.set()
+        self.calls = []
+
+    def __call__(self, image, filename="Unnamed", with_details=False, update_mapping=True):
+        if isinstance(image, (bytes, bytearray)):
+            content = bytes(image)
+        else:
+            with open(image, 'rb') as f:
+                content = f.read()
+        self.calls.append(filename)
+        if b'block' in content:
+            self.release.wait(10)
+        if b'fail' in content:
+            raise ValueError("unreadable image")
+        fields = dict({field: 'N/A' for field in FIELDS}, filename=filename, date='01.02.2023', total_cost='42.50')
+        details = {'engine': 'FakeOCR', 'field_engines': {'date': 'FakeOCR', 'total_cost': 'FakeOCR'},
+                   'ocr_times': {'FakeOCR': 0.01}, 'processing_time': 0.01}
+        return (fields, details) if with_details else fields
+
+@pytest.fixture
+def fake_extract(monkeypatch):
+    from text_extraction import TextExtractor
+
+    extract = FakeExtract()
+    monkeypatch.setattr(TextExtractor, 'extract_single', extract)
+    yield extract
+    extract.release.set()
+
+@pytest.fixture
+def web(tmp_path, monkeypatch, fake_extract):
+    # app.py with its own job manager and statistics store for each test
+    import app as web
+    from jobs import JobManager
+    from stats_store import StatsStore
+
+    job_manager = JobManager(max_workers=1, max_queue=50, sample_interval=0)
+    job_manager.on_finish = web.record_job
+    monkeypatch.setattr(web, 'job_manager', job_manager)
+    monkeypatch.setattr(web, 'stats_store', StatsStore(str(tmp_path / 'stats.db')))
+    monkeypatch.setitem(web.app.config, 'TESTING', True)
+    return web
+
+@pytest.fixture
+def client(web):
+    return web.app.test_client()
+
+@pytest.fixture
+def resp_url():
+    # resp_server.py on a free port, with a fresh store for each test
+    server = Server(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    finally:
+        server.shutdown()
+        server.server_close()
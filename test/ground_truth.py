@@ -0,0 +1,145 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+from collections import Counter, defaultdict
+
+# Labels for the receipts in uploads/, used by test/regression.py. Entries are
+# bootstrapped from the engine outputs in test/test_logs: a field is labelled
+# where at least two engines extracted the same value and no other value got
+# as many votes. Those labels are candidates, not truth (engines can agree on
+# the same misread), so each image has "verified": false until someone has
+# checked it against the receipt with the "set" or "verify" commands.
+#
+#   python test/ground_truth.py bootstrap
+#   python test/ground_truth.py set 13.jpeg vat=198.56
+#   python test/ground_truth.py verify 1.jpeg 2.jpeg
+#   python test/ground_truth.py stats
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PATH = os.path.join(ROOT, 'test', 'ground_truth.json')
+FIELDS = ['date', 'time', 'tax_office_name', 'tax_office_number', 'total_cost', 'vat', 'payment_method']
+
+def normalize(value):
+    if value is None:
+        return None
+    return ' '.join(str(value).split()).upper()
+
+def load(path=DEFAULT_PATH):
+    if not os.path.exists(path):
+        return {'version': 1, 'images': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save(ground_truth, path=DEFAULT_PATH):
+    ground_truth['images'] = dict(sorted(ground_truth['images'].items(), key=lambda item: _sort_key(item[0])))
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(ground_truth, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(temp_path, path)
+
+def _sort_key(filename):
+    stem = filename.split('.')[0]
+    return (0, int(stem), filename) if stem.isdigit() else (1, 0, filename)
+
+def score(fields, labels):
+    # Exact match after whitespace/case normalization; unlabelled fields are not scored
+    return {field: normalize(fields.get(field)) == normalize(expected)
+            for field, expected in labels.items() if field in FIELDS}
+
+def latest_engine_outputs(log_dir):
+    outputs = {}
+    for path in sorted(glob.glob(os.path.join(log_dir, '*_data_*.csv'))):
+        engine = os.path.basename(path).split('_data_')[0]
+        if engine.startswith('all_ocr_methods'):
+            continue
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.reader(f))[1:]
+        # Timestamped names sort chronologically; prefer the latest full run
+        if rows and len(rows) >= len(outputs.get(engine, [])) * 0.9:
+            outputs[engine] = rows
+    return outputs
+
+def bootstrap(ground_truth, log_dir, min_votes=2):
+    votes = defaultdict(lambda: defaultdict(Counter))
+    for engine, rows in latest_engine_outputs(log_dir).items():
+        for row in rows:
+            for field, value in zip(FIELDS, row[1:]):
+                value = ' '.join(value.split())
+                if value and value != 'N/A':
+                    votes[row[0]][field][value] += 1
+
+    added = 0
+    for filename, fields in votes.items():
+        entry = ground_truth['images'].get(filename)
+        if entry and entry.get('verified'):
+            continue
+        labels, agreement = {}, {}
+        for field in FIELDS:
+            ranked = fields[field].most_common(2)
+            if ranked and ranked[0][1] >= min_votes and (len(ranked) == 1 or ranked[1][1] < ranked[0][1]):
+                labels[field] = ranked[0][0]
+                agreement[field] = ranked[0][1]
+        if entry is None:
+            added += 1
+        ground_truth['images'][filename] = {'verified': False, 'fields': labels, 'agreement': agreement}
+    return added
+
+def stats(ground_truth):
+    images = ground_truth['images']
+    verified = [entry for entry in images.values() if entry.get('verified')]
+    print(f"Images: {len(images)} ({len(verified)} verified)")
+    for field in FIELDS:
+        labelled = sum(1 for entry in images.values() if field in entry['fields'])
+        checked = sum(1 for entry in verified if field in entry['fields'])
+        print(f"{field}: {labelled} labelled, {checked} verified")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage ground-truth labels for uploads/')
+    parser.add_argument('--file', default=DEFAULT_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bootstrap_parser = subparsers.add_parser('bootstrap', help='Candidate labels from engine agreement in test_logs')
+    bootstrap_parser.add_argument('--logs', default=os.path.join(ROOT, 'test', 'test_logs'))
+    bootstrap_parser.add_argument('--min-votes', type=int, default=2)
+
+    set_parser = subparsers.add_parser('set', help='Set fields of one image after checking it, and mark it verified')
+    set_parser.add_argument('image')
+    set_parser.add_argument('values', nargs='*', help='field=value; field=N/A for a field the receipt does not have')
+
+    verify_parser = subparsers.add_parser('verify', help='Mark images whose labels were checked as verified')
+    verify_parser.add_argument('images', nargs='+')
+
+    subparsers.add_parser('stats', help='Label coverage')
+    args = parser.parse_args(argv)
+
+    ground_truth = load(args.file)
+    if args.command == 'bootstrap':
+        added = bootstrap(ground_truth, args.logs, args.min_votes)
+        save(ground_truth, args.file)
+        print(f"Added {added} images, {len(ground_truth['images'])} in total")
+    elif args.command == 'set':
+        entry = ground_truth['images'].setdefault(args.image, {'verified': False, 'fields': {}, 'agreement': {}})
+        for value in args.values:
+            field, _, label = value.partition('=')
+            if field not in FIELDS:
+                parser.error(f"unknown field {field!r}")
+            entry['fields'][field] = label
+            entry['agreement'].pop(field, None)
+        entry['verified'] = True
+        save(ground_truth, args.file)
+    elif args.command == 'verify':
+        for image in args.images:
+            if image not in ground_truth['images']:
+                parser.error(f"{image} has no labels")
+            ground_truth['images'][image]['verified'] = True
+        save(ground_truth, args.file)
+    else:
+        stats(ground_truth)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+
+# Helpers shared by the scripts in test/. Only the standard library is used, so
+# scripts that do not run OCR (loadgen.py) can import this without loading the
+# engines that benchmark.py imports.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The scripts import the app's modules (resources, text_extraction, ...) from here
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.jfif')
+
+def natural_sort_key(s):
+    return [int(text) if text.isdigit() else text.lower()
+            for text in re.split('([0-9]+)', s)]
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    rank = max(0, min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def latency_summary(values):
+    if not values:
+        return None
+    return {
+        'mean': round(sum(values) / len(values), 4),
+        'min': round(min(values), 4),
+        'p50': round(percentile(values, 50), 4),
+        'p95': round(percentile(values, 95), 4),
+        'p99': round(percentile(values, 99), 4),
+        'max': round(max(values), 4)
+    }
+
+def find_images(directory, pattern=None, limit=None, sample=None, seed=0):
+    images = [os.path.join(directory, name) for name in os.listdir(directory)
+              if name.lower().endswith(IMAGE_EXTENSIONS) and (pattern is None or re.search(pattern, name))]
+    images.sort(key=lambda path: natural_sort_key(os.path.basename(path)))
+    if sample:
+        images = sorted(random.Random(seed).sample(images, min(sample, len(images))),
+                        key=lambda path: natural_sort_key(os.path.basename(path)))
+    if limit:
+        images = images[:limit]
+    return images
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
@@ -0,0 +1,294 @@
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlsplit
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from harness import ROOT, find_images, git_commit, latency_summary
+from resources import ResourceSampler
+
+# Load test for the web endpoints. With --spawn the server is started here with
+# the fake OCR engine (fake_ocr.py), so what is measured is the serving stack:
+# uploads, the job queue, extraction, templates and CSV export.
+#
+#   python test/loadgen.py --spawn --concurrency 1 4 16 --duration 20
+#   python test/loadgen.py --spawn --fake latency=0.5,cpu=1 --server flask --endpoints index
+#   python test/loadgen.py --url http://localhost:5000 --server-pid 1234
+#
+# Each concurrency level runs that many clients in a closed loop: every client
+# sends its next request as soon as the previous one is answered. Other server
+# settings (OCR_WORKERS, MAX_QUEUED_IMAGES, ...) come from the environment.
+
+ENDPOINTS = {
+    'index': ('POST', '/'),
+    'export-csv': ('POST', '/export-csv'),
+    'api-extract': ('POST', '/api/extract'),
+}
+# Only rendered when the page has results; / answers 200 with or without them
+RESULT_MARKER = b'summary-value'
+EXPORT_ROW = {'filename': 'receipt.jpg', 'date': '15/03/2024', 'time': '14:32', 'tax_office_name': 'ÜSKÜDAR',
+              'tax_office_number': '9480423762', 'total_cost': '42.50', 'vat': '3.38', 'payment_methods': 'KREDİ KARTI'}
+
+def multipart(files):
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for filename, data in files:
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+        body += data + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode('ascii')
+    return bytes(body), f'multipart/form-data; boundary={boundary}'
+
+def build_requests(endpoint, images, files_per_request, export_rows):
+    # Bodies are built up front so the clients only send
+    if endpoint == 'export-csv':
+        body = json.dumps([dict(EXPORT_ROW, filename=f'{i}.jpg') for i in range(export_rows)]).encode('utf-8')
+        return [(body, 'application/json', 0)]
+    requests = []
+    for start in range(0, len(images), files_per_request):
+        batch = images[start:start + files_per_request]
+        body, content_type = multipart(batch)
+        requests.append((body, content_type, len(batch)))
+    return requests
+
+def succeeded(endpoint, status, body):
+    if status != 200:
+        return False
+    if endpoint == 'index':
+        return RESULT_MARKER in body
+    return True
+
+class Client:
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.connection = None
+
+    def send(self, method, path, body, content_type):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers={'Content-Type': content_type})
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except Exception:
+            # Reconnect for the next request; the server may have closed a kept-alive connection
+            self.close()
+            raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+def run_level(url, endpoints, requests, concurrency, duration, max_requests, timeout, server_pid):
+    # Endpoints take turns; each cycles through its own request bodies
+    bodies = {endpoint: itertools.cycle(requests[endpoint]) for endpoint in endpoints}
+    plan = ((endpoint, next(bodies[endpoint])) for endpoint in itertools.cycle(endpoints))
+    plan_lock = threading.Lock()
+    results = []
+    results_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    sent = itertools.count()
+
+    def worker():
+        client = Client(url, timeout)
+        try:
+            while time.perf_counter() < deadline and (max_requests is None or next(sent) < max_requests):
+                with plan_lock:
+                    endpoint, (body, content_type, images) = next(plan)
+                method, path = ENDPOINTS[endpoint]
+                start = time.perf_counter()
+                try:
+                    status, response = client.send(method, path, body, content_type)
+                    ok = succeeded(endpoint, status, response)
+                except Exception as e:
+                    status, ok = type(e).__name__, False
+                with results_lock:
+                    results.append((endpoint, status, ok, time.perf_counter() - start, images))
+        finally:
+            client.close()
+
+    sampler = ResourceSampler(interval=0.25, pid=server_pid).start() if server_pid else None
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start
+    server = sampler.stop().summary() if sampler else {}
+
+    level = {
+        'concurrency': concurrency,
+        'wall_time': round(wall_time, 3),
+        'server_rss_mb': {key: server.get(f'memory_{key}') for key in ('start', 'max', 'end')} if server else None,
+        'server_cpu_avg': server.get('cpu_avg'),
+        'server_threads_max': server.get('threads_max'),
+        'endpoints': {}
+    }
+    for endpoint in endpoints:
+        runs = [run for run in results if run[0] == endpoint]
+        errors = [run for run in runs if not run[2]]
+        statuses = {}
+        for run in runs:
+            statuses[str(run[1])] = statuses.get(str(run[1]), 0) + 1
+        level['endpoints'][endpoint] = {
+            'requests': len(runs),
+            'errors': len(errors),
+            'error_rate': round(len(errors) / len(runs) * 100, 2) if runs else 0,
+            'statuses': statuses,
+            'throughput': round(len(runs) / wall_time, 3) if wall_time else 0,
+            'images_per_second': round(sum(run[4] for run in runs if run[2]) / wall_time, 3) if wall_time else 0,
+            'latency': latency_summary([run[3] for run in runs if run[2]]),
+        }
+    return level
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def log_tail(path, lines=20):
+    # The work directory, log included, is removed when the run ends
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return ''.join(f.readlines()[-lines:])
+
+def spawn_server(args, work_dir):
+    port = free_port()
+    env = dict(os.environ,
+               OCR_FAKE_ENGINE=args.fake,
+               STATS_DB=os.path.join(work_dir, 'stats.db'),
+               OCR_BIND=f'127.0.0.1:{port}',
+               OCR_WEB_WORKERS=str(args.web_workers),
+               OCR_WEB_THREADS=str(args.web_threads))
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py']
+    else:
+        command = [sys.executable, '-c', f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    log_path = os.path.join(work_dir, 'server.log')
+    log = open(log_path, 'wb')
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}:\n{log_tail(log_path)}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                connection.close()
+                return process, url, log_path
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    process.wait()
+    raise RuntimeError(f"Server did not answer within {args.startup_timeout} seconds:\n{log_tail(log_path)}")
+
+def print_level(level):
+    rss = level['server_rss_mb']
+    memory = f"  server RSS {rss['start']:.0f} -> {rss['max']:.0f} MB" if rss else ''
+    print(f"concurrency {level['concurrency']}{memory}")
+    for endpoint, result in level['endpoints'].items():
+        latency = result['latency'] or {}
+        print(f"  {endpoint:<12} {result['requests']:>6} req  {result['throughput']:>8.2f} req/s  "
+              f"errors {result['error_rate']:>6.2f}%  p50 {latency.get('p50', 0):.3f}s  "
+              f"p95 {latency.get('p95', 0):.3f}s  p99 {latency.get('p99', 0):.3f}s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the web endpoints')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='A running server, e.g. http://localhost:5000')
+    target.add_argument('--spawn', action='store_true', help='Start a server with the fake OCR engine')
+    parser.add_argument('--server-pid', type=int, help='With --url, the server (master) process to sample RSS from')
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn', help='With --spawn')
+    parser.add_argument('--fake', default='latency=0.2', help='OCR_FAKE_ENGINE for the spawned server')
+    parser.add_argument('--web-workers', type=int, default=2, help='gunicorn workers for the spawned server')
+    parser.add_argument('--web-threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=['index', 'export-csv'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4, 8, 16])
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per concurrency level')
+    parser.add_argument('--requests', type=int, help='Stop a level after this many requests')
+    parser.add_argument('--images', default=os.path.join(ROOT, 'uploads'))
+    parser.add_argument('--limit', type=int, default=20, help='Images to upload, cycled through')
+    parser.add_argument('--files-per-request', type=int, default=1)
+    parser.add_argument('--export-rows', type=int, default=50, help='Rows per /export-csv request')
+    parser.add_argument('--timeout', type=float, default=300, help='Client timeout per request')
+    parser.add_argument('-o', '--output', help='JSON results file (default: test/benchmark_results/load_<time>.json)')
+    args = parser.parse_args(argv)
+
+    images = []
+    for path in find_images(args.images, limit=args.limit):
+        with open(path, 'rb') as f:
+            images.append((os.path.basename(path), f.read()))
+    if not images and set(args.endpoints) - {'export-csv'}:
+        print("No image files found.")
+        return 1
+    requests = {endpoint: build_requests(endpoint, images, args.files_per_request, args.export_rows)
+                for endpoint in args.endpoints}
+
+    work_dir = tempfile.mkdtemp(prefix='loadgen_')
+    process = None
+    try:
+        if args.spawn:
+            process, url, log_path = spawn_server(args, work_dir)
+            server_pid = process.pid
+            print(f"Server {server_pid} at {url} (log: {log_path})")
+        else:
+            url, server_pid = args.url, args.server_pid
+
+        # One untimed request per endpoint, so first-request setup is not in the numbers
+        run_level(url, args.endpoints, requests, 1, float('inf'), len(args.endpoints), args.timeout, None)
+
+        levels = []
+        for concurrency in args.concurrency:
+            level = run_level(url, args.endpoints, requests, concurrency, args.duration, args.requests,
+                              args.timeout, server_pid)
+            print_level(level)
+            levels.append(level)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'host': platform.node(),
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'images': [name for name, _ in images],
+        'levels': levels
+    }
+    output = args.output or os.path.join(ROOT, 'test', 'benchmark_results',
+                                         f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Results written to: {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from harness import ROOT, find_images, git_commit
+import resources
+from benchmark import engine_label, engine_spec, run_image
+from text_extraction import TextExtractor
+
+# Memory profile of long extraction runs, to tell a leak from caches filling up:
+#
+#   python test/memory_profile.py --engines cascade --limit 60 --repeat 3
+#   python test/memory_profile.py --engines paddle easyocr --frames 10 --top 30
+#
+# Images run one at a time through the production pipeline (a single engine runs
+# as a one-engine cascade), recording RSS and Python heap deltas around every
+# engine call and every image. The first --warmup images run before measuring so
+# model loading is not counted. Caches (correct_word, the tax office mapping)
+# stop growing once the images repeat, so growth that continues into the later
+# repeats points at a leak; the allocation sites that grew during the last
+# repeat are listed for that reason.
+
+def profile_engine(engine, images, repeat, warmup, frames, top, min_growth_mb):
+    spec = engine if engine.startswith('cascade') else f'cascade:{engine}'
+    for image_path in images[:warmup]:
+        run_image(spec, image_path)
+    gc.collect()
+
+    tracker = resources.MemoryTracker(frames).start()
+    snapshots = [resources.snapshot()]
+    failures = 0
+    try:
+        for _ in range(repeat):
+            for image_path in images:
+                try:
+                    run_image(spec, image_path)
+                except Exception as e:
+                    failures += 1
+                    print(f"Error processing {os.path.basename(image_path)}: {e}")
+            gc.collect()
+            snapshots.append(resources.snapshot())
+    finally:
+        tracker.stop()
+
+    summary = tracker.summary(min_growth_mb)
+    image_rss = [call['rss_mb'] for call in tracker.calls if call['kind'] == 'image']
+    return {
+        'engine': engine_label(engine),
+        'images': len(images),
+        'repeat': repeat,
+        'failures': failures,
+        'summary': summary,
+        'rss_end_of_repeat_mb': image_rss[len(images) - 1::len(images)],
+        'top_growth': resources.top_growth(snapshots[0], snapshots[-1], top),
+        'top_growth_last_repeat': resources.top_growth(snapshots[-2], snapshots[-1], top) if repeat > 1 else None,
+        'calls': tracker.calls
+    }
+
+def print_result(result):
+    summary = result['summary']
+    rss, python = summary['rss_growth'], summary['python_growth']
+    print(f"{result['engine']}: {result['images']} images x {result['repeat']}, RSS {summary['rss_start_mb']:.0f} MB at start")
+    for label, growth in (('RSS', rss), ('Python heap', python)):
+        if growth['points'] < 8:
+            print(f"  {label}: too few images to judge growth")
+            continue
+        flag = '  POSSIBLE LEAK' if growth['flagged'] else ''
+        print(f"  {label}: {growth['start_mb']:.1f} -> {growth['end_mb']:.1f} MB, "
+              f"{growth['slope_mb_per_step'] * 1024:.1f} KB/image{flag}")
+    if result['repeat'] > 1:
+        print(f"  RSS after each repeat: {', '.join(f'{value:.1f}' for value in result['rss_end_of_repeat_mb'])} MB")
+    for name, engine in summary['engines'].items():
+        flag = '  POSSIBLE LEAK' if engine['growth']['flagged'] else ''
+        print(f"  {name:<10} {engine['calls']:>5} calls  RSS {engine['rss_delta_mb']:+.1f} MB "
+              f"(Python {engine['python_delta_mb']:+.1f}, native {engine['native_delta_mb']:+.1f})  "
+              f"largest call {engine['max_call_delta_mb']:+.1f} MB{flag}")
+    sites = result['top_growth_last_repeat'] if result['repeat'] > 1 else result['top_growth']
+    if sites:
+        print("  Allocation sites that grew" + (" during the last repeat:" if result['repeat'] > 1 else ":"))
+        for site in sites[:10]:
+            print(f"    {site['size_diff_kb']:>10.1f} KB {site['count_diff']:>+8}  {site['site'][-1]}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profile memory use per OCR engine and per image')
+    parser.add_argument('--engines', nargs='+', type=engine_spec, default=['cascade'],
+                        help='Engines or cascade configurations, e.g. cascade paddle cascade:tesseract,paddle')
+    parser.add_argument('--images', default=os.path.join(ROOT, 'uploads'))
+    parser.add_argument('--pattern')
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--sample', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-r', '--repeat', type=int, default=2, help='Passes over the images (default 2)')
+    parser.add_argument('--warmup', type=int, default=2, help='Images run before measuring (default 2)')
+    parser.add_argument('--frames', type=int, default=1, help='Stack frames per allocation site (default 1)')
+    parser.add_argument('--top', type=int, default=20, help='Allocation sites to report (default 20)')
+    parser.add_argument('--min-growth', type=float, default=20.0,
+                        help='MB of steady growth over the run to flag as a possible leak (default 20)')
+    parser.add_argument('--transcripts', default=os.environ.get('OCR_TRANSCRIPTS'),
+                        help='replay:<file> to profile extraction without running OCR')
+    parser.add_argument('--fake', default=os.environ.get('OCR_FAKE_ENGINE'),
+                        help='Fake OCR engine settings (see fake_ocr.py), for the cascade')
+    parser.add_argument('-o', '--output', help='JSON results file (default: test/benchmark_results/memory_<time>.json)')
+    args = parser.parse_args(argv)
+
+    images = find_images(args.images, args.pattern, args.limit, args.sample, args.seed)
+    if not images:
+        print("No image files found.")
+        return 1
+
+    TextExtractor.configure_fake_engine(args.fake)
+    TextExtractor.configure_transcripts(args.transcripts)
+    results = []
+    for engine in args.engines:
+        try:
+            result = profile_engine(engine, images, args.repeat, args.warmup, args.frames, args.top, args.min_growth)
+        except ValueError as e:
+            print(f"Skipping {engine}: {e}")
+            continue
+        print_result(result)
+        results.append(result)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'host': platform.node(),
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': results
+    }
+    output = args.output or os.path.join(ROOT, 'test', 'benchmark_results',
+                                         f"memory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Results written to: {output}")
+    return 1 if any(result['summary']['rss_growth']['flagged'] for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
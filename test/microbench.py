@@ -0,0 +1,363 @@
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from harness import ROOT, git_commit
+import transcripts
+from text_extraction import TextExtractor
+
+# python test/microbench.py                                   # every function, every case
+# python test/microbench.py --functions correct_text extract_vat --compare old.json
+#
+# Times the text-side functions on their own, without OCR: ns per call over a
+# corpus of OCR texts (a transcript from --corpus, or the outputs saved in
+# test/test_logs), noisy and adversarial variants of it, tracemalloc peak bytes
+# per call, and how the time scales with text length, with the size of the
+# dictionary (words.dic) and with the size of the tax office list.
+
+FUNCTIONS = {
+    'correct_text': TextExtractor.correct_text,
+    'extract_date': TextExtractor.extract_date,
+    'extract_time': TextExtractor.extract_time,
+    'extract_tax_office_name': TextExtractor.extract_tax_office_name,
+    'extract_tax_office_number': TextExtractor.extract_tax_office_number,
+    'extract_total_cost': TextExtractor.extract_total_cost,
+    'extract_vat': TextExtractor.extract_vat,
+    'extract_payment_method': TextExtractor.extract_payment_method,
+    'extract_from_text': lambda text: TextExtractor.extract_from_text(text, update_mapping=False),
+}
+CASES = ['corpus', 'noisy', 'long', 'long_line', 'adversarial']
+# Typical OCR confusions, used to make the noisy variant of the corpus
+CONFUSIONS = {'0': 'O', 'O': '0', '1': 'I', 'I': '1', '5': 'S', 'S': '5', '8': 'B', 'B': '8',
+              ',': '.', '.': ',', ':': ';', 'İ': 'I', 'Ş': '$', 'Ü': 'U', 'Ö': 'O'}
+DEFAULT_OUTPUT_DIR = os.path.join(ROOT, 'test', 'benchmark_results')
+
+def load_corpus(path=None, limit=None):
+    if path:
+        records = list(transcripts.read_records(path))
+    else:
+        records = transcripts.read_test_logs(os.path.join(ROOT, 'test', 'test_logs'))
+    texts = sorted({record['text'] for record in records if record.get('text') and record['text'].strip()})
+    if limit:
+        texts = random.Random(0).sample(texts, min(limit, len(texts)))
+    return texts
+
+def add_noise(text, rng, rate=0.08):
+    chars = []
+    for char in text:
+        roll = rng.random()
+        if roll < rate and char in CONFUSIONS:
+            chars.append(CONFUSIONS[char])
+        elif roll < rate / 4:
+            chars.append(rng.choice(' .,*:'))
+            chars.append(char)
+        else:
+            chars.append(char)
+    return ''.join(chars)
+
+def make_cases(corpus, seed=0):
+    rng = random.Random(seed)
+    adversarial = [
+        # Digit groups after a keyword with no decimal part, for the amount patterns
+        'TOPLAM ' + '1 234 ' * 1500,
+        'TOPKDV *' + '9' * 5000,
+        # Long uppercase runs with no keyword, for the [A-Z\s]+ prefixes
+        'ABC DEFG ' * 1500,
+        'VERGİ ' * 1000,
+        # Keyword line: every word range is compared with every tax office, so the
+        # cost grows with the square of the words on the line
+        ' '.join(rng.choice(corpus).split()[:25]) + ' V.D. 1234567890',
+        '\n'.join(['*'] * 5000),
+    ]
+    return {
+        'corpus': corpus,
+        'noisy': [add_noise(text, rng) for text in corpus],
+        # Ten receipts in one text, as a multi-page scan would give
+        'long': ['\n'.join(rng.sample(corpus, min(10, len(corpus)))) for _ in range(min(20, len(corpus)))],
+        # Lost line breaks; capped at 30 words, since a keyword line costs seconds at that length already
+        'long_line': [' '.join(text.split()[:30]) for text in rng.sample(corpus, min(20, len(corpus)))],
+        'adversarial': adversarial,
+    }
+
+def clear_caches():
+    TextExtractor.correct_word.cache_clear()
+
+@contextmanager
+def patched(**attributes):
+    saved = {name: getattr(TextExtractor, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(TextExtractor, name, value)
+    TextExtractor.get_dictionary.cache_clear()
+    clear_caches()
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(TextExtractor, name, value)
+        TextExtractor.get_dictionary.cache_clear()
+        clear_caches()
+
+def without_mapping():
+    # A known tax number skips the office search; a non-empty mapping with no
+    # numbers in it makes every call do the full search
+    return patched(_tax_office_mapping={None: None})
+
+def measure(function, texts, min_time=0.2, repeat=5, budget=5.0, cold=False):
+    # Texts the first pass did not reach within the budget are dropped, so one
+    # pathological input cannot stall the run
+    used, elapsed = [], 0
+    for text in texts:
+        if cold:
+            clear_caches()
+        start = time.perf_counter_ns()
+        function(text)
+        elapsed += time.perf_counter_ns() - start
+        used.append(text)
+        if elapsed > budget * 1e9:
+            break
+    if not cold:
+        # Calibrate on a second pass, after the first has filled the caches
+        start = time.perf_counter_ns()
+        for text in used:
+            function(text)
+        elapsed = time.perf_counter_ns() - start
+    loops = max(1, math.ceil(min_time * 1e9 / elapsed)) if elapsed else 1
+    rounds = min(repeat, int(budget * 1e9 // max(elapsed * loops, 1)))
+
+    # Too slow to repeat within the budget: the first pass is the measurement
+    per_op = [] if rounds else [elapsed / len(used)]
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            total = 0
+            if cold:
+                for _ in range(loops):
+                    for text in used:
+                        clear_caches()
+                        start = time.perf_counter_ns()
+                        function(text)
+                        total += time.perf_counter_ns() - start
+            else:
+                start = time.perf_counter_ns()
+                for _ in range(loops):
+                    for text in used:
+                        function(text)
+                total = time.perf_counter_ns() - start
+            per_op.append(total / (loops * len(used)))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {
+        'texts': len(used),
+        'truncated': len(used) < len(texts),
+        'calls': rounds * loops * len(used) or len(used),
+        'ns_per_op': round(min(per_op)),
+        'ns_per_op_median': round(statistics.median(per_op)),
+        'chars_mean': round(sum(len(text) for text in used) / len(used)),
+    }
+
+def allocations(function, texts, cold=False, budget=5.0):
+    # Peak traced bytes above the starting point of each call, and what a whole
+    # pass left allocated (cache growth shows up here)
+    peaks = []
+    deadline = time.perf_counter() + budget
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        for text in texts:
+            if time.perf_counter() > deadline:
+                break
+            if cold:
+                clear_caches()
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            function(text)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    return {
+        'peak_bytes_mean': round(sum(peaks) / len(peaks)) if peaks else 0,
+        'peak_bytes_max': max(peaks, default=0),
+        'retained_bytes': retained,
+    }
+
+def exponent(points):
+    # Least-squares slope of log(time) against log(size): ~1 linear, ~2 quadratic
+    points = [(math.log(x), math.log(y)) for x, y in points if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return None
+    return round(sum((x - mean_x) * (y - mean_y) for x, y in points) / variance, 2)
+
+def scaled(entries, factor, rng):
+    # Subsets below 1x; above it, extra entries made by shuffling the letters of
+    # real ones so they cost the same to compare against
+    entries = sorted(entries)
+    if factor <= 1:
+        return set(rng.sample(entries, max(1, round(len(entries) * factor))))
+    result = set(entries)
+    while len(result) < round(len(entries) * factor):
+        letters = list(rng.choice(entries))
+        rng.shuffle(letters)
+        result.add(''.join(letters))
+    return result
+
+def length_scaling(function, corpus, sizes, args, cold=False):
+    # The same texts repeated, so only the length changes between points; the
+    # extractors that stop at their first match should stay flat
+    base = random.Random(args.seed).sample(corpus, min(args.scaling_texts, len(corpus)))
+    points = []
+    for size in sizes:
+        texts = ['\n'.join([text] * size) for text in base]
+        result = measure(function, texts, args.min_time, args.repeat, args.budget, cold)
+        points.append({'size': size, 'chars_mean': result['chars_mean'], 'ns_per_op': result['ns_per_op'],
+                       'truncated': result['truncated']})
+    return {'points': points, 'exponent': exponent([(p['chars_mean'], p['ns_per_op']) for p in points])}
+
+def table_scaling(function, corpus, attribute, entries, factors, args, cold=False):
+    rng = random.Random(args.seed)
+    points = []
+    texts = rng.sample(corpus, min(args.scaling_texts, len(corpus)))
+    for factor in factors:
+        table = scaled(entries, factor, rng)
+        with patched(**{attribute: table}):
+            result = measure(function, texts, args.min_time, args.repeat, args.budget, cold)
+        points.append({'entries': len(table), 'ns_per_op': result['ns_per_op'], 'truncated': result['truncated']})
+    return {'points': points, 'exponent': exponent([(p['entries'], p['ns_per_op']) for p in points])}
+
+def run(args):
+    corpus = load_corpus(args.corpus, args.limit)
+    if not corpus:
+        raise SystemExit("No OCR texts found; pass --corpus <transcript>")
+    cases = make_cases(corpus, args.seed)
+    TextExtractor.initialize_tax_office_mapping()
+    dictionary = set(TextExtractor.get_dictionary())
+    offices = set(TextExtractor.get_valid_offices())
+
+    results, scaling = {}, {}
+    for name in args.functions:
+        function = FUNCTIONS[name]
+        results[name] = {}
+        for case in args.cases:
+            texts = cases[case]
+            # correct_word results are cached, so correct_text is also timed with an empty cache
+            for cold in ([False, True] if name in ('correct_text', 'extract_from_text') else [False]):
+                label = case + (':cold' if cold else '')
+                result = measure(function, texts, args.min_time, args.repeat, args.budget, cold)
+                if not args.no_allocations and result['ns_per_op'] < args.budget * 1e9:
+                    result.update(allocations(function, texts[:result['texts']], cold, args.budget))
+                results[name][label] = result
+                print(f"{name:<26} {label:<17} {result['ns_per_op']:>14,} ns/op"
+                      + (f"  peak {result['peak_bytes_mean']:>10,} B" if 'peak_bytes_mean' in result else '')
+                      + ('  (truncated)' if result['truncated'] else ''))
+        if name == 'extract_tax_office_name':
+            with without_mapping():
+                result = measure(function, corpus, args.min_time, args.repeat, args.budget)
+            results[name]['corpus:no_mapping'] = result
+            print(f"{name:<26} {'corpus:no_mapping':<17} {result['ns_per_op']:>14,} ns/op")
+
+        if args.no_scaling:
+            continue
+        cold = name == 'correct_text'
+        scaling[name] = {'text_length': length_scaling(function, corpus, args.sizes, args, cold)}
+        if name in ('correct_text', 'extract_from_text'):
+            scaling[name]['dictionary'] = table_scaling(function, corpus, '_dictionary', dictionary,
+                                                        args.table_factors, args, cold=True)
+        if name in ('extract_tax_office_name', 'extract_from_text'):
+            with without_mapping():
+                scaling[name]['tax_offices'] = table_scaling(function, corpus, '_valid_offices', offices,
+                                                             args.table_factors, args)
+        print(f"{name:<26} scaling exponents: "
+              + ', '.join(f"{key} {value['exponent']}" for key, value in scaling[name].items()))
+    return {'corpus_texts': len(corpus), 'dictionary_words': len(dictionary), 'tax_offices': len(offices),
+            'results': results, 'scaling': scaling}
+
+def compare(report, previous, threshold):
+    slower = []
+    for name, cases in report['results'].items():
+        for case, result in cases.items():
+            before = previous.get('results', {}).get(name, {}).get(case)
+            if not before or not before.get('ns_per_op'):
+                continue
+            ratio = result['ns_per_op'] / before['ns_per_op']
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  SLOWER'
+                slower.append(f"{name} {case}")
+            elif ratio < 1 / (1 + threshold):
+                flag = '  faster'
+            print(f"{name:<26} {case:<17} {before['ns_per_op']:>14,} -> {result['ns_per_op']:>14,} ns/op "
+                  f"({ratio:.2f}x){flag}")
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Microbenchmarks for the TextExtractor text functions')
+    parser.add_argument('--functions', nargs='+', choices=list(FUNCTIONS), default=list(FUNCTIONS))
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES)
+    parser.add_argument('--corpus', help='Transcript file (see transcripts.py); default: texts in test/test_logs')
+    parser.add_argument('--limit', type=int, help='Random sample of N corpus texts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-time', type=float, default=0.2, help='Seconds per timing round (default 0.2)')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Timing rounds; the fastest is reported')
+    parser.add_argument('--budget', type=float, default=5.0,
+                        help='Rough time limit in seconds per function and case (default 5)')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1, 2, 4, 8, 16],
+                        help='Receipts per text for the text-length scaling')
+    parser.add_argument('--table-factors', nargs='+', type=float, default=[0.25, 0.5, 1, 2, 4],
+                        help='Dictionary and tax office list sizes, relative to the real ones')
+    parser.add_argument('--scaling-texts', type=int, default=20, help='Texts per scaling point')
+    parser.add_argument('--no-scaling', action='store_true')
+    parser.add_argument('--no-allocations', action='store_true')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--max-slowdown', type=float, default=0.2,
+                        help='With --compare, exit 1 if any case is this fraction slower (default 0.2)')
+    parser.add_argument('-o', '--output', help='JSON results file (default: test/benchmark_results/microbench_<time>.json)')
+    args = parser.parse_args(argv)
+
+    # The lookup files are opened relative to the working directory
+    os.chdir(ROOT)
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+    }
+    report.update(run(args))
+
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"microbench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Results written to: {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous.get('host') != report['host']:
+            print(f"Warning: {args.compare} was recorded on {previous.get('host')}")
+        slower = compare(report, previous, args.max_slowdown)
+        if slower:
+            print(f"{len(slower)} cases more than {args.max_slowdown * 100:.0f}% slower than {previous.get('commit')}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
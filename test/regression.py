@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import platform
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import ground_truth
+from benchmark import benchmark_engine, engine_spec
+from harness import ROOT, find_images, git_commit, percentile
+from text_extraction import TextExtractor
+
+# Accuracy and latency regression check against test/ground_truth.json:
+#
+#   python test/regression.py --update-baseline          # record the current numbers
+#   python test/regression.py                            # exit 1 if worse than the baseline
+#
+# Accuracy is exact match per labelled field, over the images whose labels were
+# checked by hand. --include-unverified also scores the bootstrapped candidate
+# labels; those are only reported, never compared with the baseline, since
+# engines agreeing on a misread would make the gate reward the misread. Latency
+# depends on the machine, so the p95 check is skipped when the baseline was
+# recorded on another host.
+
+DEFAULT_BASELINE = os.path.join(ROOT, 'test', 'regression_baseline.json')
+
+def evaluate(result, labels, verified_only=True):
+    correct = {field: 0 for field in ground_truth.FIELDS}
+    labelled = {field: 0 for field in ground_truth.FIELDS}
+    mismatches = []
+    for run in result['per_image']:
+        entry = labels.get(run['filename'])
+        if run['repeat'] != 0 or entry is None or (verified_only and not entry.get('verified')):
+            continue
+        for field, ok in ground_truth.score(run['fields'], entry['fields']).items():
+            labelled[field] += 1
+            correct[field] += ok
+            if not ok:
+                mismatches.append({'filename': run['filename'], 'field': field,
+                                   'expected': entry['fields'][field], 'got': run['fields'].get(field)})
+
+    accuracy = {field: round(correct[field] / labelled[field] * 100, 2) if labelled[field] else None
+                for field in ground_truth.FIELDS}
+    total = sum(labelled.values())
+    latencies = [run['latency'] for run in result['per_image']]
+    return {
+        'engine': result['engine'],
+        'images': result['images'],
+        'labelled_fields': total,
+        'accuracy': round(sum(correct.values()) / total * 100, 2) if total else None,
+        'field_accuracy': accuracy,
+        'p50': round(percentile(latencies, 50), 4),
+        'p95': round(percentile(latencies, 95), 4),
+        'throughput': result['throughput'],
+        'peak_rss_mb': result['peak_rss_mb'],
+        'mismatches': mismatches
+    }
+
+def compare(current, baseline, max_accuracy_drop, max_p95_increase, check_latency):
+    failures = []
+    for engine, scores in current.items():
+        previous = baseline.get(engine)
+        if previous is None:
+            continue
+        if scores['images'] != previous['images'] or scores['labelled_fields'] != previous['labelled_fields']:
+            print(f"Warning: {engine} was measured on a different image set than the baseline")
+
+        checks = [('overall', scores['accuracy'], previous['accuracy'])]
+        checks += [(field, scores['field_accuracy'][field], previous['field_accuracy'].get(field))
+                   for field in ground_truth.FIELDS]
+        for name, value, expected in checks:
+            if value is not None and expected is not None and expected - value > max_accuracy_drop:
+                failures.append(f"{engine} {name} accuracy {value:.2f}% < baseline {expected:.2f}%")
+
+        if check_latency and previous['p95'] and scores['p95'] > previous['p95'] * (1 + max_p95_increase):
+            failures.append(f"{engine} p95 latency {scores['p95']:.3f}s > baseline {previous['p95']:.3f}s "
+                            f"+{max_p95_increase * 100:.0f}%")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check extraction accuracy and latency against a baseline')
+    parser.add_argument('--engines', nargs='+', type=engine_spec, default=['cascade'],
+                        help='Engines or cascade configurations, e.g. cascade cascade:tesseract,paddle easyocr')
+    parser.add_argument('--images', default=os.path.join(ROOT, 'uploads'))
+    parser.add_argument('--pattern')
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--sample', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-w', '--workers', type=int, default=1)
+    parser.add_argument('-r', '--repeat', type=int, default=1)
+    parser.add_argument('--transcripts', default=os.environ.get('OCR_TRANSCRIPTS'),
+                        help='replay:<file> to check extraction accuracy without running OCR')
+    parser.add_argument('--ground-truth', default=ground_truth.DEFAULT_PATH)
+    parser.add_argument('--include-unverified', dest='verified_only', action='store_false',
+                        help='Also score unchecked candidate labels (report only, no baseline check)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--max-accuracy-drop', type=float, default=1.0, help='Percentage points (default 1.0)')
+    parser.add_argument('--max-p95-increase', type=float, default=0.25, help='Fraction of the baseline p95 (default 0.25)')
+    parser.add_argument('--skip-latency', action='store_true')
+    parser.add_argument('-o', '--output', help='Write the full report, including mismatches, to this JSON file')
+    args = parser.parse_args(argv)
+
+    labels = ground_truth.load(args.ground_truth)['images']
+    if args.verified_only:
+        labels = {filename: entry for filename, entry in labels.items() if entry.get('verified')}
+    images = [path for path in find_images(args.images, args.pattern, args.limit, args.sample, args.seed)
+              if os.path.basename(path) in labels]
+    if not images:
+        print("No labelled images found.")
+        return 1
+
+    TextExtractor.configure_transcripts(args.transcripts)
+    current = {}
+    for engine in args.engines:
+        try:
+            result = benchmark_engine(engine, images, args.workers, args.repeat)
+        except ValueError as e:
+            print(f"Skipping {engine}: {e}")
+            continue
+        scores = current[engine] = evaluate(result, labels, args.verified_only)
+        accuracy = f"{scores['accuracy']:.2f}%" if scores['accuracy'] is not None else 'n/a'
+        print(f"{scores['engine']:<10} accuracy {accuracy} over {scores['labelled_fields']} fields  "
+              f"p50 {scores['p50']:.3f}s  p95 {scores['p95']:.3f}s")
+        for field, value in scores['field_accuracy'].items():
+            print(f"  {field}: {value if value is not None else 'n/a'}%")
+
+    report = {
+        'commit': git_commit(),
+        'host': platform.node(),
+        'verified_only': args.verified_only,
+        'workers': args.workers,
+        'results': current
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if not args.verified_only:
+        if args.update_baseline:
+            print("Not writing a baseline from unverified labels")
+            return 1
+        print("Scored unverified labels; skipping the baseline check")
+        return 0
+
+    if args.update_baseline:
+        baseline = {'commit': report['commit'], 'host': report['host'], 'verified_only': args.verified_only,
+                    'workers': args.workers,
+                    'results': {engine: {key: value for key, value in scores.items() if key != 'mismatches'}
+                                for engine, scores in current.items()}}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"Baseline written to: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline first")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    if not baseline.get('verified_only'):
+        print("Warning: the baseline includes unverified labels; re-run with --update-baseline")
+    check_latency = not args.skip_latency and baseline.get('host') == report['host']
+    if not args.skip_latency and not check_latency:
+        print(f"Baseline was recorded on {baseline.get('host')}, skipping the latency check")
+    failures = compare(current, baseline['results'], args.max_accuracy_drop, args.max_p95_increase, check_latency)
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    if not failures:
+        print(f"No regressions against baseline {baseline.get('commit')}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
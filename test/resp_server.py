@@ -0,0 +1,289 @@
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+
+# Small in-memory stand-in for a Redis server, for running the shared cache
+# and the work queue against something local: python test/resp_server.py --port 6390
+# then OCR_CACHE_URL / OCR_BROKER_URL=redis://localhost:6390/0
+
+class Store:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+
+    def _alive(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def ping(self, *args):
+        return ('+', 'PONG')
+
+    def select(self, db):
+        return ('+', 'OK')
+
+    def auth(self, *args):
+        return ('+', 'OK')
+
+    def get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    def set(self, key, value, *options):
+        self.data[key] = value
+        self.expires.pop(key, None)
+        options = [option.upper() for option in options]
+        if b'EX' in options:
+            self.expires[key] = time.time() + int(options[options.index(b'EX') + 1])
+        return ('+', 'OK')
+
+    def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                del self.data[key]
+                self.expires.pop(key, None)
+                removed += 1
+        return removed
+
+    def exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def scan(self, cursor, *options):
+        pattern = b'*'
+        if b'MATCH' in [option.upper() for option in options]:
+            pattern = options[[option.upper() for option in options].index(b'MATCH') + 1]
+        keys = [key for key in list(self.data) if self._alive(key) and fnmatch.fnmatchcase(key.decode(), pattern.decode())]
+        return [b'0', keys]
+
+    def expire(self, key, seconds):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.time() + int(seconds)
+        return 1
+
+    def _list(self, key):
+        if not self._alive(key):
+            self.data[key] = []
+        return self.data[key]
+
+    def _drop_if_empty(self, key):
+        if key in self.data and not self.data[key]:
+            del self.data[key]
+            self.expires.pop(key, None)
+
+    def lpush(self, key, *values):
+        items = self._list(key)
+        for value in values:
+            items.insert(0, value)
+        return len(items)
+
+    def rpush(self, key, *values):
+        items = self._list(key)
+        items.extend(values)
+        return len(items)
+
+    def lpop(self, key):
+        if not self._alive(key):
+            return None
+        value = self.data[key].pop(0)
+        self._drop_if_empty(key)
+        return value
+
+    def rpop(self, key):
+        if not self._alive(key):
+            return None
+        value = self.data[key].pop()
+        self._drop_if_empty(key)
+        return value
+
+    def lpop_first(self, *keys):
+        for key in keys:
+            value = self.lpop(key)
+            if value is not None:
+                return [key, value]
+        return None
+
+    def rpoplpush(self, source, destination):
+        value = self.rpop(source)
+        if value is not None:
+            self.lpush(destination, value)
+        return value
+
+    def llen(self, key):
+        return len(self.data[key]) if self._alive(key) else 0
+
+    def lrange(self, key, start, stop):
+        if not self._alive(key):
+            return []
+        items = self.data[key]
+        start, stop = int(start), int(stop)
+        stop = len(items) if stop == -1 else stop + 1
+        return items[start:stop]
+
+    def lrem(self, key, count, value):
+        if not self._alive(key):
+            return 0
+        items = self.data[key]
+        removed = 0
+        while value in items and (int(count) == 0 or removed < int(count)):
+            items.remove(value)
+            removed += 1
+        self._drop_if_empty(key)
+        return removed
+
+    def _zset(self, key):
+        if not self._alive(key):
+            self.data[key] = {}
+        return self.data[key]
+
+    def zadd(self, key, *args):
+        args = list(args)
+        only_existing = args and args[0].upper() == b'XX'
+        if only_existing:
+            args = args[1:]
+        members = self._zset(key)
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            if only_existing and member not in members:
+                continue
+            added += member not in members
+            members[member] = float(score)
+        self._drop_if_empty(key)
+        return added
+
+    def zrem(self, key, *members):
+        if not self._alive(key):
+            return 0
+        removed = sum(1 for member in members if self.data[key].pop(member, None) is not None)
+        self._drop_if_empty(key)
+        return removed
+
+    def zscore(self, key, member):
+        if not self._alive(key) or member not in self.data[key]:
+            return None
+        return repr(self.data[key][member])
+
+    def zcard(self, key):
+        return len(self.data[key]) if self._alive(key) else 0
+
+    def zrangebyscore(self, key, low, high):
+        if not self._alive(key):
+            return []
+        low, high = float(low), float(high)
+        return [member for member, score in sorted(self.data[key].items(), key=lambda item: item[1])
+                if low <= score <= high]
+
+    def flushdb(self):
+        self.data.clear()
+        self.expires.clear()
+        return ('+', 'OK')
+
+# Blocking commands poll their non-blocking counterpart without holding the lock
+BLOCKING = {
+    'brpoplpush': lambda store, source, destination, timeout: (store.rpoplpush(source, destination), timeout),
+    'blpop': lambda store, *args: (store.lpop_first(*args[:-1]), args[-1]),
+}
+
+class Handler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def encode(self, value):
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, tuple):
+            return f"{value[0]}{value[1]}\r\n".encode('utf-8')
+        if isinstance(value, int):
+            return b':%d\r\n' % value
+        if isinstance(value, (list, tuple)):
+            return b'*%d\r\n' % len(value) + b''.join(self.encode(item) for item in value)
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def blocking(self, store, command, args):
+        deadline = None
+        while True:
+            with store.lock:
+                reply, timeout = command(store, *args)
+            if reply is not None:
+                return reply
+            if deadline is None:
+                deadline = time.time() + float(timeout) if float(timeout) else float('inf')
+            if time.time() >= deadline:
+                return None
+            time.sleep(0.02)
+
+    def run(self, store, name, args):
+        # Called with store.lock held
+        method = getattr(store, name, None)
+        if method is None:
+            return ('-', f"ERR unknown command '{name}'")
+        try:
+            return method(*args)
+        except Exception as e:
+            return ('-', f"ERR {e}")
+
+    def handle(self):
+        store = self.server.store
+        # Commands queued since MULTI, or None outside a transaction
+        queued = None
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            name = args[0].decode().lower()
+            name = {'del': 'delete'}.get(name, name)
+            if name == 'multi':
+                reply = ('-', "ERR MULTI calls can not be nested") if queued is not None else ('+', 'OK')
+                queued = [] if queued is None else queued
+            elif name in ('exec', 'discard'):
+                if queued is None:
+                    reply = ('-', f"ERR {name.upper()} without MULTI")
+                elif name == 'discard':
+                    reply = ('+', 'OK')
+                else:
+                    with store.lock:
+                        reply = [self.run(store, command, command_args) for command, command_args in queued]
+                queued = None
+            elif queued is not None:
+                queued.append((name, args[1:]))
+                reply = ('+', 'QUEUED')
+            elif name in BLOCKING:
+                reply = self.blocking(store, BLOCKING[name], args[1:])
+            else:
+                with store.lock:
+                    reply = self.run(store, name, args[1:])
+            self.wfile.write(self.encode(reply))
+            self.wfile.flush()
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, Handler)
+        self.store = Store()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='In-memory Redis protocol stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+
+    server = Server((args.host, args.port))
+    print(f"Listening on {args.host}:{args.port}")
+    server.serve_forever()
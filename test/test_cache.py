@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from cache import MemoryCache, RedisCache, SQLiteCache, cache_from_url
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = cache_from_url('memory://?max_entries=2')
+    assert isinstance(cache, MemoryCache)
+    cache.set('a', '1')
+    cache.set('b', '2')
+    assert cache.get('a') == '1'
+    cache.set('c', '3')
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    assert cache.get('c') == '3'
+
+def test_sqlite_cache_persists_between_instances(tmp_path):
+    url = f"sqlite:///{tmp_path / 'cache' / 'ocr.db'}"
+    cache = cache_from_url(url)
+    assert isinstance(cache, SQLiteCache)
+    cache.set('key', '{"date": "01.02.2023"}')
+    cache.set('key', '{"date": "02.02.2023"}')
+
+    reopened = cache_from_url(url)
+    assert reopened.get('key') == '{"date": "02.02.2023"}'
+    reopened.clear()
+    assert cache.get('key') is None
+
+def test_redis_cache_round_trip(resp_url):
+    cache = cache_from_url(resp_url)
+    assert isinstance(cache, RedisCache)
+    assert cache.get('missing') is None
+    cache.set('key', 'değer')
+    assert cache.get('key') == 'değer'
+
+def test_redis_cache_ttl(resp_url):
+    cache = cache_from_url(resp_url + '?ttl=1')
+    assert cache.ttl == 1
+    cache.set('key', 'value')
+    assert cache.get('key') == 'value'
+    time.sleep(1.1)
+    assert cache.get('key') is None
+
+def test_redis_cache_clear_keeps_other_prefixes(resp_url):
+    cache = cache_from_url(resp_url)
+    other = RedisCache(resp_url, prefix='other:')
+    cache.set('a', '1')
+    cache.set('b', '2')
+    other.set('a', '3')
+    cache.clear()
+    assert cache.get('a') is None and cache.get('b') is None
+    assert other.get('a') == '3'
+
+def test_unsupported_url():
+    assert cache_from_url(None) is None
+    with pytest.raises(ValueError):
+        cache_from_url('ftp://localhost/cache')
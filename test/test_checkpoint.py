@@ -0,0 +1,65 @@
+import json
+
+import cli
+from checkpoint import CheckpointJournal
+from conftest import jpeg
+
+def read_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().splitlines()
+
+def test_journal_skips_torn_last_line(tmp_path):
+    path = str(tmp_path / 'batch.journal')
+    journal = CheckpointJournal(path)
+    journal.record('a', 'a.jpg', 'done')
+    journal.record('b', 'b.jpg', 'failed', 'unreadable image')
+    journal.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"key": "c", "filename": "c.jp')
+
+    journal = CheckpointJournal(path)
+    assert journal.is_done('a')
+    assert not journal.is_done('b')
+    assert journal.done['b']['error'] == 'unreadable image'
+    assert not journal.is_done('c')
+    # The next entry starts on a line of its own
+    journal.record('c', 'c.jpg', 'done')
+    journal.close()
+    assert CheckpointJournal(path).is_done('c')
+
+def test_batch_resumes_after_crash(tmp_path, fake_extract):
+    images = tmp_path / 'images'
+    images.mkdir()
+    for index in range(1, 5):
+        (images / f'{index}.jpg').write_bytes(jpeg(bytes([index])))
+    (images / '5.jpg').write_bytes(jpeg(b'fail'))
+    (images / 'notes.txt').write_text('not an image')
+    output = str(tmp_path / 'results.ndjson')
+    journal = output + '.journal'
+
+    cli.main(['batch', str(images), '-o', output])
+    assert fake_extract.calls == ['1.jpg', '2.jpg', '3.jpg', '4.jpg', '5.jpg']
+    assert [json.loads(line)['filename'] for line in read_lines(output)] == ['1.jpg', '2.jpg', '3.jpg', '4.jpg']
+    entries = [json.loads(line) for line in read_lines(journal)]
+    assert [entry['status'] for entry in entries] == ['done', 'done', 'done', 'done', 'failed']
+
+    # A crash while journaling 3.jpg: its row is in the output, its journal line is torn
+    lines = read_lines(journal)
+    with open(journal, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines[:2]) + '\n' + lines[2][:len(lines[2]) // 2])
+    rows = read_lines(output)
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(rows[:3]) + '\n')
+
+    fake_extract.calls.clear()
+    cli.main(['batch', str(images), '-o', output])
+    # Completed images are skipped; the torn one and the failed one run again
+    assert fake_extract.calls == ['3.jpg', '4.jpg', '5.jpg']
+    assert [json.loads(line)['filename'] for line in read_lines(output)] == ['1.jpg', '2.jpg', '3.jpg', '3.jpg', '4.jpg']
+
+    fake_extract.calls.clear()
+    cli.main(['batch', str(images), '-o', output])
+    assert fake_extract.calls == ['5.jpg']
+
+    cli.main(['batch', str(images), '-o', output, '--restart'])
+    assert len(read_lines(output)) == 4
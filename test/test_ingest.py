@@ -0,0 +1,169 @@
+import io
+import os
+import tarfile
+import zipfile
+from io import BytesIO
+
+import pytest
+
+from conftest import jpeg
+from ingest import allowed_file, iter_archive_images, iter_multipart_files
+
+BOUNDARY = 'test-boundary'
+PNG = b'\x89PNG\r\n\x1a\n'
+
+def multipart(parts, boundary=BOUNDARY):
+    body = b''
+    for name, filename, content in parts:
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8') + content + b'\r\n'
+    return body + f'--{boundary}--\r\n'.encode('utf-8')
+
+def post(client, url, body, content_type=f'multipart/form-data; boundary={BOUNDARY}'):
+    return client.post(url, data=body, content_type=content_type)
+
+def test_multipart_keeps_valid_images(tmp_path):
+    body = multipart([
+        ('files', '1.jpg', jpeg(b'x' * 1000)),
+        ('files', 'notes.txt', b'not an image'),
+        ('files', 'fake.jpg', b'plain text with an image name'),
+        ('other', '2.jpg', jpeg()),
+        ('files', '../../3.png', PNG + b'y' * 100),
+    ])
+    # A small chunk size splits the boundaries across reads
+    files = list(iter_multipart_files(BytesIO(body), BOUNDARY.encode(), str(tmp_path), allowed_file, chunk_size=7))
+
+    assert [filename for filename, _ in files] == ['1.jpg', '3.png']
+    with open(files[0][1], 'rb') as f:
+        assert f.read() == jpeg(b'x' * 1000)
+    with open(files[1][1], 'rb') as f:
+        assert f.read() == PNG + b'y' * 100
+    # Rejected parts are removed from the spool dir
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for _, path in files)
+
+def test_truncated_multipart_is_rejected(tmp_path):
+    body = multipart([('files', '1.jpg', jpeg()), ('files', '2.jpg', jpeg(b'z' * 500))])[:-200]
+    with pytest.raises(ValueError):
+        list(iter_multipart_files(BytesIO(body), BOUNDARY.encode(), str(tmp_path), allowed_file))
+    # The partly written file is removed
+    assert [name for name in os.listdir(tmp_path) if name.endswith('2.jpg')] == []
+
+def test_truncated_upload_returns_400(client, web):
+    body = multipart([('files', '1.jpg', jpeg()), ('files', '2.jpg', jpeg(b'z' * 500))])[:-200]
+    response = post(client, '/api/jobs', body)
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Malformed multipart upload')
+
+    # The image that arrived complete was cancelled or finished, and the job was sealed
+    [job_id] = list(web.job_manager._jobs)
+    assert web.job_manager.wait(job_id, timeout=5)['status'] == 'completed'
+
+def test_non_multipart_upload_returns_400(client):
+    response = client.post('/api/jobs', data=jpeg(), content_type='image/jpeg')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Expected a multipart/form-data upload'
+
+    response = post(client, '/api/jobs', multipart([('files', '1.jpg', jpeg())]), content_type='multipart/form-data')
+    assert response.status_code == 400
+
+def test_upload_without_valid_images_returns_400(client):
+    response = post(client, '/api/jobs', multipart([('files', 'notes.txt', b'text'), ('files', 'a.jpg', b'text')]))
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'No valid image files were uploaded'
+
+def test_too_many_images_returns_413(client, web, monkeypatch):
+    monkeypatch.setitem(web.app.config, 'MAX_IMAGES_PER_REQUEST', 2)
+    body = multipart([('files', f'{index}.jpg', jpeg()) for index in range(3)])
+    response = post(client, '/api/jobs', body)
+    assert response.status_code == 413
+    assert response.get_json()['error'] == 'At most 2 images can be uploaded per request'
+
+    body = multipart([('files', f'{index}.jpg', jpeg()) for index in range(2)])
+    assert post(client, '/api/jobs', body).status_code == 202
+
+ARCHIVE_ENTRIES = [
+    ('receipts/1.jpg', jpeg(b'first')),
+    ('receipts/notes.txt', b'not an image'),
+    ('receipts/fake.jpg', b'plain text with an image name'),
+    ('../evil.jpg', jpeg(b'outside')),
+    ('/absolute.jpg', jpeg(b'outside')),
+    ('receipts/large.jpg', jpeg(b'x' * 2000)),
+    ('receipts/2.png', PNG + b'second'),
+]
+
+def make_zip(entries):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as archive:
+        archive.writestr('receipts/', b'')
+        for name, content in entries:
+            archive.writestr(name, content)
+    return data.getvalue()
+
+def make_tar(entries, mode='w:gz'):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode=mode) as archive:
+        for name, content in entries:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+def read_archive(tmp_path, filename, data, memory_limit=10 ** 6):
+    path = tmp_path / filename
+    path.write_bytes(data)
+    spool_dir = tmp_path / 'spool'
+    spool_dir.mkdir()
+    return list(iter_archive_images(str(path), allowed_file, 1000, str(spool_dir), memory_limit))
+
+def test_zip_entries_are_filtered(tmp_path):
+    images = read_archive(tmp_path, 'receipts.zip', make_zip(ARCHIVE_ENTRIES))
+    assert images == [('receipts/1.jpg', jpeg(b'first')), ('receipts/2.png', PNG + b'second')]
+
+@pytest.mark.parametrize('mode, filename', [('w', 'receipts.tar'), ('w:gz', 'receipts.tgz'),
+                                            ('w:bz2', 'receipts.tar.bz2'), ('w:xz', 'receipts.tar.xz')])
+def test_tar_entries_are_filtered(tmp_path, mode, filename):
+    images = read_archive(tmp_path, filename, make_tar(ARCHIVE_ENTRIES, mode))
+    assert images == [('receipts/1.jpg', jpeg(b'first')), ('receipts/2.png', PNG + b'second')]
+
+def test_archive_entries_past_memory_limit_are_spooled(tmp_path):
+    entries = [(f'{index}.jpg', jpeg(bytes([index]) * 100)) for index in range(3)]
+    images = read_archive(tmp_path, 'receipts.zip', make_zip(entries), memory_limit=150)
+
+    assert images[0] == ('0.jpg', entries[0][1])
+    for (name, spooled), (entry_name, content) in zip(images[1:], entries[1:]):
+        assert name == entry_name
+        assert os.path.dirname(spooled) == str(tmp_path / 'spool')
+        with open(spooled, 'rb') as f:
+            assert f.read() == content
+
+def test_archive_upload_queues_each_image(client, web, monkeypatch):
+    monkeypatch.setitem(web.app.config, 'MAX_ARCHIVE_ENTRY_SIZE', 1000)
+    response = post(client, '/api/jobs', multipart([('files', 'receipts.zip', make_zip(ARCHIVE_ENTRIES)),
+                                                    ('files', '3.jpg', jpeg())]))
+    assert response.status_code == 202
+    job = web.job_manager.wait(response.get_json()['id'], timeout=5)
+    assert [image['filename'] for image in job['images']] == ['receipts/1.jpg', 'receipts/2.png', '3.jpg']
+    assert job['completed'] == 3
+
+def test_corrupt_zip_returns_400(client):
+    body = multipart([('files', 'receipts.zip', b'PK\x03\x04' + b'\x00' * 600)])
+    response = post(client, '/api/jobs', body)
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Could not read archive')
+
+def test_truncated_tgz_returns_400(client):
+    entries = [(f'{index}.jpg', jpeg(os.urandom(2000))) for index in range(5)]
+    data = make_tar(entries)
+    response = post(client, '/api/jobs', multipart([('files', 'receipts.tgz', data[:len(data) // 2])]))
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Could not read archive')
+
+def test_archive_over_image_limit_returns_413(client, web, monkeypatch):
+    monkeypatch.setitem(web.app.config, 'MAX_IMAGES_PER_REQUEST', 2)
+    entries = [(f'{index}.jpg', jpeg()) for index in range(3)]
+    response = post(client, '/api/jobs', multipart([('files', 'receipts.zip', make_zip(entries))]))
+    assert response.status_code == 413
+
+def test_file_picker_offers_accepted_extensions(client):
+    page = client.get('/').data.decode('utf-8')
+    assert 'accept=".bmp,.jfif,.jpeg,.jpg,.png,.tiff,.zip,.tar,.tar.gz,.tgz,.tar.bz2,.tar.xz"' in page
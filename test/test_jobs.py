@@ -0,0 +1,212 @@
+import json
+import os
+import time
+from io import BytesIO
+
+import pytest
+
+from conftest import jpeg
+from jobs import JobManager, QueueFullError
+
+@pytest.fixture
+def manager(fake_extract):
+    return JobManager(max_workers=1, max_queue=10, max_finished_jobs=2, sample_interval=0)
+
+def write_images(directory, *contents):
+    paths = []
+    for index, content in enumerate(contents):
+        path = directory / f"{index + 1}.jpg"
+        path.write_bytes(jpeg(content))
+        paths.append(str(path))
+    return paths
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.01)
+
+def test_submit_and_wait(manager, tmp_path):
+    paths = write_images(tmp_path, b'', b'fail', b'')
+    job_id = manager.submit(paths, ['1.jpg', '2.jpg', '3.jpg'])
+    job = manager.wait(job_id, timeout=5)
+
+    assert job['status'] == 'completed'
+    assert (job['total'], job['completed'], job['failed'], job['progress']) == (3, 2, 1, 100.0)
+    assert [image['status'] for image in job['images']] == ['done', 'failed', 'done']
+    assert job['images'][0]['fields']['date'] == '01.02.2023'
+    assert job['images'][0]['engine'] == 'FakeOCR'
+    assert job['images'][1]['error'] == 'unreadable image'
+    assert manager.queue_counts() == (0, 0)
+
+def test_job_finishes_only_once_sealed(manager, tmp_path):
+    cleanup_dir = tmp_path / 'upload'
+    cleanup_dir.mkdir()
+    paths = write_images(cleanup_dir, b'', b'')
+    job_id = manager.create(cleanup_dir=str(cleanup_dir))
+    assert manager.add(job_id, paths[0], '1.jpg') == 0
+    assert manager.add(job_id, paths[1], '2.jpg') == 1
+
+    job = manager.wait(job_id, timeout=0.5)
+    assert job['completed'] == 2
+    assert job['finished'] is None
+    assert cleanup_dir.exists()
+
+    manager.seal(job_id)
+    job = manager.wait(job_id, timeout=5)
+    assert job['status'] == 'completed'
+    assert not cleanup_dir.exists()
+
+def test_sealing_empty_job(manager):
+    job_id = manager.create()
+    manager.seal(job_id)
+    job = manager.wait(job_id, timeout=5)
+    assert job['status'] == 'completed'
+    assert job['total'] == 0
+
+def test_cancel_fails_pending_images(manager, fake_extract, tmp_path):
+    fake_extract.release.clear()
+    cleanup_dir = tmp_path / 'upload'
+    cleanup_dir.mkdir()
+    paths = write_images(cleanup_dir, b'block', b'', b'')
+    job_id = manager.create(cleanup_dir=str(cleanup_dir))
+    for path, filename in zip(paths, ['1.jpg', '2.jpg', '3.jpg']):
+        manager.add(job_id, path, filename)
+    wait_until(lambda: manager.get(job_id)['images'][0]['status'] == 'running')
+
+    manager.cancel(job_id)
+    job = manager.get(job_id)
+    assert [image['status'] for image in job['images']] == ['running', 'failed', 'failed']
+    assert [image['error'] for image in job['images'][1:]] == ['Cancelled', 'Cancelled']
+    assert job['finished'] is None
+    assert manager.queue_counts() == (0, 1)
+
+    fake_extract.release.set()
+    job = manager.wait(job_id, timeout=5)
+    assert (job['completed'], job['failed']) == (1, 2)
+    assert manager.queue_counts() == (0, 0)
+    assert not cleanup_dir.exists()
+    # Cancelled images never reach the engine
+    assert fake_extract.calls == ['1.jpg']
+
+def test_queue_full(manager, tmp_path):
+    paths = write_images(tmp_path, *[b''] * 11)
+    with pytest.raises(QueueFullError) as error:
+        manager.submit(paths, [os.path.basename(path) for path in paths])
+    assert error.value.retry_after >= 1
+    assert manager.queue_counts() == (0, 0)
+    with pytest.raises(QueueFullError):
+        manager.check_capacity(11)
+
+def test_on_finish_result_kept_as_statistics(manager, tmp_path):
+    finished = []
+    manager.on_finish = lambda job: finished.append(job['id']) or {'images': job['total']}
+    job_id = manager.submit(write_images(tmp_path, b'', b''), ['1.jpg', '2.jpg'])
+    job = manager.wait(job_id, timeout=5)
+    assert finished == [job_id]
+    assert job['statistics'] == {'images': 2}
+
+def test_iter_results_in_sequence_order(manager, tmp_path):
+    job_id = manager.submit(write_images(tmp_path, b'', b'fail', b''), ['1.jpg', '2.jpg', '3.jpg'])
+    results = [image for image in manager.iter_results(job_id, keepalive=1) if image is not None]
+    assert [image['sequence'] for image in results] == [1, 2, 3]
+    assert [image['filename'] for image in results] == ['1.jpg', '2.jpg', '3.jpg']
+
+    resumed = [image for image in manager.iter_results(job_id, keepalive=1, after=2) if image is not None]
+    assert [image['sequence'] for image in resumed] == [3]
+    assert list(manager.iter_results(job_id, keepalive=1, after=3)) == []
+
+def test_iter_results_while_running(manager, fake_extract, tmp_path):
+    fake_extract.release.clear()
+    job_id = manager.submit(write_images(tmp_path, b'block', b''), ['1.jpg', '2.jpg'])
+    results = manager.iter_results(job_id, keepalive=0.05)
+    # Keep-alives until the first image is released
+    assert next(results) is None
+    fake_extract.release.set()
+    assert [image['sequence'] for image in results if image is not None] == [1, 2]
+
+def test_unknown_job(manager):
+    assert manager.get('missing') is None
+    assert manager.wait('missing', timeout=1) is None
+    assert list(manager.iter_results('missing')) == []
+
+def test_finished_jobs_are_pruned(manager, tmp_path):
+    paths = write_images(tmp_path, b'')
+    job_ids = []
+    for _ in range(3):
+        job_ids.append(manager.submit(paths, ['1.jpg']))
+        manager.wait(job_ids[-1], timeout=5)
+
+    # Creating a job keeps at most max_finished_jobs - 1 finished ones
+    new_job = manager.create()
+    assert manager.get(job_ids[0]) is None
+    assert manager.get(job_ids[1]) is None
+    assert manager.wait(job_ids[0], timeout=1) is None
+    assert manager.get(job_ids[2])['status'] == 'completed'
+    assert manager.get(new_job)['status'] == 'queued'
+
+def upload(client, url, files, **kwargs):
+    data = {'files': [(BytesIO(content), filename) for filename, content in files]}
+    return client.post(url, data=data, content_type='multipart/form-data', **kwargs)
+
+def read_events(body):
+    events = []
+    for block in body.decode('utf-8').split('\n\n'):
+        event = {}
+        for line in block.split('\n'):
+            name, _, value = line.partition(': ')
+            if name in ('id', 'event', 'data'):
+                event[name] = value
+        if event:
+            events.append(event)
+    return events
+
+def test_job_events_resume_after_last_event_id(client, web):
+    response = upload(client, '/api/jobs', [('1.jpg', jpeg()), ('2.jpg', jpeg(b'fail')), ('3.jpg', jpeg())])
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    assert response.headers['Location'].endswith(f'/api/jobs/{job_id}')
+
+    events = read_events(client.get(f'/api/jobs/{job_id}/events').data)
+    assert [event['event'] for event in events] == ['result', 'result', 'result', 'done']
+    assert [event.get('id') for event in events] == ['1', '2', '3', None]
+    assert json.loads(events[1]['data'])['error'] == 'unreadable image'
+    done = json.loads(events[-1]['data'])
+    assert (done['completed'], done['failed']) == (2, 1)
+    assert done['statistics']['statistics']['total_images'] == 3
+
+    events = read_events(client.get(f'/api/jobs/{job_id}/events', headers={'Last-Event-ID': '2'}).data)
+    assert [event.get('id') for event in events] == ['3', None]
+
+def test_unknown_job_routes(client):
+    assert client.get('/api/jobs/missing').status_code == 404
+    assert client.get('/api/jobs/missing/events').status_code == 404
+
+def test_failed_upload_cancels_its_job(client, web, fake_extract, monkeypatch):
+    # The third image is over the limit: the request fails with 413, the queued
+    # image is cancelled and the job is sealed so its temp dir is removed
+    monkeypatch.setitem(web.app.config, 'MAX_IMAGES_PER_REQUEST', 2)
+    fake_extract.release.clear()
+    response = upload(client, '/api/jobs', [('1.jpg', jpeg(b'block')), ('2.jpg', jpeg()), ('3.jpg', jpeg())])
+    assert response.status_code == 413
+
+    [job_id] = list(web.job_manager._jobs)
+    cleanup_dir = web.job_manager._jobs[job_id]['cleanup_dir']
+    fake_extract.release.set()
+    job = web.job_manager.wait(job_id, timeout=5)
+    assert job['status'] == 'completed'
+    assert job['total'] == 2
+    assert job['images'][1]['error'] == 'Cancelled'
+    assert '2.jpg' not in fake_extract.calls
+    assert not os.path.exists(cleanup_dir)
+    assert web.job_manager.queue_counts() == (0, 0)
+
+def test_extract_stream(client):
+    # The page falls back to this single request when the job's events stream is unavailable
+    response = upload(client, '/api/extract?stream=1', [('1.jpg', jpeg()), ('2.jpg', jpeg(b'fail'))])
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+    assert [(line['filename'], line['status']) for line in lines] == [('1.jpg', 'done'), ('2.jpg', 'failed')]
+    assert lines[0]['fields']['date'] == '01.02.2023'
@@ -0,0 +1,36 @@
+import os
+import time
+
+from recycling import RecyclePolicy, RecyclingPool
+
+def square(value):
+    # Slow enough for each replacement to start before its predecessor runs out of images
+    time.sleep(0.05)
+    return value * value, os.getpid()
+
+def test_policy_trips_once():
+    policy = RecyclePolicy(max_images=2)
+    assert policy.record() is None
+    assert policy.record() == '2 images'
+    assert policy.record() is None
+    assert policy.reason == '2 images'
+    assert not RecyclePolicy().enabled
+
+def test_policy_rss_limit():
+    policy = RecyclePolicy(max_rss_mb=100)
+    assert policy.record(rss=50) is None
+    assert policy.record(rss=150) == 'RSS 150 MB'
+
+def test_pool_replaces_workers_and_joins_retired_ones():
+    with RecyclingPool(1, max_images=2) as pool:
+        results = []
+        retired = []
+        for result in pool.map(square, range(20)):
+            results.append(result)
+            retired.append(len(pool._retired))
+        assert [value for value, _ in results] == [value * value for value in range(20)]
+        assert pool.recycled >= 3
+        assert len({pid for _, pid in results}) >= pool.recycled
+        # Retired workers are joined once their images are collected, not kept for the life of the pool
+        assert max(retired) <= 1
+        assert len(pool._retired) < pool.recycled
@@ -0,0 +1,136 @@
+import csv
+import io
+import time
+
+import pytest
+
+from conftest import jpeg
+from stats_store import StatsStore, _hour
+
+def run_stats(images, found, processing_time, peak_memory):
+    attempted = images * 7
+    return {
+        'timestamp': '2024-03-15 14:32:00',
+        'total_images': images,
+        'total_fields_attempted': attempted,
+        'successful_extractions': found,
+        'failed_extractions': attempted - found,
+        'success_rate': round(found / attempted * 100, 2),
+        'processing_time': processing_time,
+        'cpu_usage': 50.0,
+        'memory_used_mb': 10.0,
+        'avg_cpu_usage': 50.0,
+        'peak_cpu_usage': 90.0,
+        'avg_memory_usage': 200.0,
+        'peak_memory_usage': peak_memory,
+        'resources': {}
+    }
+
+def image(filename, engine, ocr_times, **fields):
+    return {'filename': filename, 'engine': engine, 'processing_time': 1.5, 'ocr_times': ocr_times,
+            'fields': dict({'filename': filename, 'date': 'N/A', 'time': 'N/A', 'tax_office_name': 'N/A',
+                            'tax_office_number': 'N/A', 'total_cost': 'N/A', 'vat': 'N/A', 'payment_method': 'N/A'},
+                           **fields)}
+
+@pytest.fixture
+def store(tmp_path):
+    return StatsStore(str(tmp_path / 'stats' / 'stats.db'), batch_size=2)
+
+def test_aggregates(store):
+    first = store.record_run(run_stats(2, 10, 3.0, 250.0), [
+        image('1.jpg', 'PaddleOCR', {'PaddleOCR': 1.0}, date='01.02.2023'),
+        image('2.jpg', 'Tesseract', {'PaddleOCR': 0.5, 'Tesseract': 2.0}),
+    ])
+    second = store.record_run(run_stats(1, 7, 1.0, 300.0), [image('3.jpg', 'PaddleOCR', {'PaddleOCR': 1.5})])
+    # A run that failed to produce any image results still counts
+    store.record_run(run_stats(1, 0, 0.5, 100.0), [image('4.jpg', None, {})])
+    assert first != second
+    assert store.flush()
+
+    aggregates = store.aggregates()
+    [hourly] = aggregates['hourly']
+    assert hourly['hour'] == _hour(time.time())
+    assert (hourly['runs'], hourly['images'], hourly['fields_attempted'], hourly['fields_found']) == (3, 4, 28, 17)
+    assert hourly['success_rate'] == round(17 / 28 * 100, 2)
+    assert hourly['avg_image_time'] == round(4.5 / 4, 3)
+    assert hourly['peak_memory_mb'] == 300.0
+
+    engines = {row['engine']: row for row in aggregates['engines']}
+    assert set(engines) == {'PaddleOCR', 'Tesseract'}
+    assert (engines['PaddleOCR']['runs'], engines['PaddleOCR']['images']) == (3, 2)
+    assert engines['PaddleOCR']['avg_ocr_seconds'] == 1.0
+    assert (engines['Tesseract']['runs'], engines['Tesseract']['images']) == (1, 1)
+    assert engines['Tesseract']['ocr_seconds'] == 2.0
+
+def test_aggregates_window(store):
+    old = time.time() - 3 * 3600
+    store._put(('old-run', old, run_stats(1, 7, 1.0, 100.0), [image('1.jpg', 'PaddleOCR', {'PaddleOCR': 1.0})]))
+    store.record_run(run_stats(1, 7, 1.0, 100.0), [image('2.jpg', 'PaddleOCR', {'PaddleOCR': 1.0})])
+    store.flush()
+
+    assert [row['hour'] for row in store.aggregates(hours=1)['hourly']] == [_hour(time.time())]
+    assert [row['hour'] for row in store.aggregates(hours=4)['hourly']] == [_hour(old), _hour(time.time())]
+
+def test_get_run_and_export(store):
+    stats = run_stats(2, 9, 3.0, 250.0)
+    run_id = store.record_run(stats, [
+        image('1.jpg', 'PaddleOCR', {'PaddleOCR': 1.0}, date='01.02.2023', total_cost='42.50'),
+        image('2.jpg', 'Tesseract', {'Tesseract': 2.0}, vat='3.38'),
+    ])
+
+    # get_run flushes the writer first
+    run = store.get_run(run_id)
+    assert run['statistics'] == stats
+    assert [entry['filename'] for entry in run['images']] == ['1.jpg', '2.jpg']
+    assert run['images'][0]['engine'] == 'PaddleOCR'
+    assert run['images'][0]['fields']['total_cost'] == '42.50'
+
+    output = io.StringIO(newline='')
+    assert store.export(run_id, 'csv', output)
+    rows = list(csv.reader(io.StringIO(output.getvalue())))
+    assert rows[0][:3] == ['Filename', 'Date', 'Time']
+    assert rows[1] == ['1.jpg', '01.02.2023', 'N/A', 'N/A', 'N/A', '42.50', 'N/A', 'N/A']
+    assert rows[2][0] == '2.jpg' and rows[2][6] == '3.38'
+
+    output = io.StringIO()
+    assert store.export(run_id, 'txt', output)
+    text = output.getvalue()
+    assert "Total images processed: 2\n" in text
+    assert "Overall success rate: 64.29%\n" in text
+    assert "date: 50.00% (1/2)\n" in text
+
+def test_unknown_run(store):
+    assert store.flush()
+    assert store.get_run('missing') is None
+    assert not store.export('missing', 'csv', io.StringIO())
+
+def test_store_reopens_existing_database(tmp_path):
+    path = str(tmp_path / 'stats.db')
+    store = StatsStore(path)
+    run_id = store.record_run(run_stats(1, 7, 1.0, 100.0), [image('1.jpg', 'PaddleOCR', {'PaddleOCR': 1.0})])
+    store.flush()
+    assert StatsStore(path).get_run(run_id)['images'][0]['filename'] == '1.jpg'
+
+def test_statistics_routes(client, web):
+    response = client.post('/api/jobs', data={'files': [(io.BytesIO(jpeg()), '1.jpg'), (io.BytesIO(jpeg()), '2.jpg')]},
+                           content_type='multipart/form-data')
+    job = web.job_manager.wait(response.get_json()['id'], timeout=5)
+    run_id = job['statistics']['run_id']
+
+    run = client.get(f'/api/statistics/runs/{run_id}').get_json()
+    assert [entry['filename'] for entry in run['images']] == ['1.jpg', '2.jpg']
+    assert run['statistics']['total_images'] == 2
+
+    [hourly] = client.get('/api/statistics').get_json()['hourly']
+    assert (hourly['runs'], hourly['images']) == (1, 2)
+
+    response = client.get(f'/api/statistics/runs/{run_id}/export?format=csv')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.data.decode('utf-8-sig').splitlines()[1].startswith('1.jpg,01.02.2023')
+    response = client.get(f'/api/statistics/runs/{run_id}/export?format=txt')
+    assert b'Total images processed: 2' in response.data
+
+    assert client.get(f'/api/statistics/runs/{run_id}/export?format=xml').status_code == 400
+    assert client.get('/api/statistics/runs/missing').status_code == 404
+    assert client.get('/api/statistics/runs/missing/export').status_code == 404
@@ -0,0 +1,157 @@
+import threading
+import time
+
+import pytest
+
+from resp import RespClient, RespError
+from text_extraction import TextExtractor
+from work_queue import WorkQueue
+
+@pytest.fixture
+def queue(resp_url):
+    return WorkQueue(resp_url, name='test-queue', lease_time=0.5, max_attempts=2, reply_ttl=60)
+
+def test_claim_and_complete(queue):
+    reply_to = queue.new_reply_list()
+    task_id = queue.enqueue(b'image', '1.jpeg', reply_to, meta={'job': 'a'})
+    assert queue.stats() == {'pending': 1, 'processing': 0, 'dead': 0}
+
+    task = queue.claim(timeout=1)
+    assert task['id'] == task_id and task['image'] == b'image' and task['attempts'] == 0
+    assert queue.stats()['processing'] == 1
+
+    queue.complete(task, {'fields': {'date': '01.02.2023'}})
+    reply = queue.wait_reply(reply_to, timeout=1)
+    assert reply['id'] == task_id
+    assert reply['filename'] == '1.jpeg'
+    assert reply['meta'] == {'job': 'a'}
+    assert reply['fields'] == {'date': '01.02.2023'}
+    assert queue.stats() == {'pending': 0, 'processing': 0, 'dead': 0}
+    assert queue.client.execute('EXISTS', queue._key('task', task_id), queue._key('image', task_id)) == 0
+
+def test_transaction(resp_url):
+    client = RespClient(resp_url)
+    assert client.transaction(('SET', 'a', '1'), ('RPUSH', 'list', 'x', 'y'), ('GET', 'a')) == ['OK', 2, b'1']
+    with pytest.raises(RespError):
+        client.transaction(('SET', 'b', '1'), ('NOSUCHCOMMAND',))
+    # The connection is replaced after an error, so replies do not get out of step
+    assert client.execute('GET', 'a') == b'1'
+    assert client.execute('LRANGE', 'list', 0, -1) == [b'x', b'y']
+
+def test_complete_is_one_transaction(queue, monkeypatch):
+    reply_to = queue.new_reply_list()
+    queue.enqueue(b'image', '1.jpeg', reply_to)
+    task = queue.claim(timeout=1)
+
+    transactions = []
+    transaction = queue.client.transaction
+    monkeypatch.setattr(queue.client, 'transaction', lambda *commands: transactions.append(commands) or transaction(*commands))
+    monkeypatch.setattr(queue.client, 'execute', lambda *args, **kwargs: pytest.fail(f"{args[0]} outside the transaction"))
+    queue.complete(task, {'fields': {}})
+
+    assert [[command[0] for command in commands] for commands in transactions] == [['RPUSH', 'EXPIRE', 'LREM', 'ZREM', 'DEL']]
+    monkeypatch.undo()
+    assert queue.wait_reply(reply_to, timeout=1)['id'] == task['id']
+    assert queue.stats() == {'pending': 0, 'processing': 0, 'dead': 0}
+
+def test_map_ignores_duplicate_replies(queue):
+    def answer_twice():
+        # Each task is completed by two workers, as after a lease expiry
+        for _ in range(3):
+            task = queue.claim(timeout=5)
+            queue.complete(task, {'fields': {'worker': 1}})
+            queue.client.transaction(*queue._reply_commands(task, {'fields': {'worker': 2}}))
+            queue.client.transaction(*queue._reply_commands(dict(task, id='unknown'), {'fields': {}}))
+
+    worker = threading.Thread(target=answer_twice, daemon=True)
+    worker.start()
+    replies = list(queue.map([b'1', b'2', b'3'], ['1.jpeg', '2.jpeg', '3.jpeg'], result_timeout=30))
+    worker.join(10)
+
+    assert [reply['filename'] for reply in replies] == ['1.jpeg', '2.jpeg', '3.jpeg']
+    assert [reply['fields'] for reply in replies] == [{'worker': 1}] * 3
+
+def test_claim_times_out_on_empty_queue(queue):
+    assert queue.claim(timeout=1) is None
+
+def test_expired_lease_is_retried(queue):
+    task_id = queue.enqueue(b'image', '1.jpeg', queue.new_reply_list())
+    queue.claim(timeout=1)
+    time.sleep(0.6)
+    queue.reap()
+
+    assert queue.stats() == {'pending': 1, 'processing': 0, 'dead': 0}
+    task = queue.claim(timeout=1)
+    assert task['id'] == task_id
+    assert task['attempts'] == 1
+    assert task['last_error'] == 'lease expired'
+
+def test_extended_lease_is_not_reaped(queue):
+    queue.enqueue(b'image', '1.jpeg', queue.new_reply_list())
+    task = queue.claim(timeout=1)
+    for _ in range(3):
+        time.sleep(0.3)
+        queue.extend_lease(task['id'])
+        queue.reap()
+    assert queue.stats() == {'pending': 0, 'processing': 1, 'dead': 0}
+
+def test_task_without_lease_is_requeued(queue):
+    # A worker that died between BRPOPLPUSH and ZADD
+    task_id = queue.enqueue(b'image', '1.jpeg', queue.new_reply_list())
+    queue.client.execute('RPOPLPUSH', queue._key('pending'), queue._key('processing'))
+    queue.reap()
+    assert queue.stats()['processing'] == 1
+
+    time.sleep(0.6)
+    queue.reap()
+    assert queue.stats() == {'pending': 1, 'processing': 0, 'dead': 0}
+    assert queue.claim(timeout=1)['last_error'] == 'worker lost'
+    assert queue._unleased == {}
+
+def test_failed_task_goes_to_dead_letters(queue):
+    reply_to = queue.new_reply_list()
+    task_id = queue.enqueue(b'image', '1.jpeg', reply_to)
+
+    queue.fail(queue.claim(timeout=1), 'first')
+    assert queue.stats() == {'pending': 1, 'processing': 0, 'dead': 0}
+    assert queue.wait_reply(reply_to, timeout=1) is None
+
+    queue.fail(queue.claim(timeout=1), 'second')
+    assert queue.stats() == {'pending': 0, 'processing': 0, 'dead': 1}
+    reply = queue.wait_reply(reply_to, timeout=1)
+    assert reply['id'] == task_id
+    assert reply['error'] == 'second'
+    assert reply['attempts'] == 2
+    assert queue.client.execute('GET', queue._key('image', task_id)) is None
+    assert queue.client.execute('LRANGE', queue._key('dead'), 0, -1) == [task_id.encode()]
+
+def test_completed_task_is_not_claimed_again(queue):
+    # The lease ran out, the task was requeued, then the first worker finished it
+    queue.enqueue(b'image', '1.jpeg', queue.new_reply_list())
+    task = queue.claim(timeout=1)
+    time.sleep(0.6)
+    queue.reap()
+    queue.complete(task, {'fields': {}})
+
+    assert queue.claim(timeout=1) is None
+    assert queue.stats() == {'pending': 0, 'processing': 0, 'dead': 0}
+
+def test_worker_processes_map(queue):
+    TextExtractor.configure_fake_engine('latency=0')
+    stop = threading.Event()
+    worker = threading.Thread(target=queue.work, args=(stop.is_set,), daemon=True)
+    worker.start()
+    try:
+        images = [b'first image', b'second image', b'third image']
+        filenames = ['1.jpeg', '2.jpeg', '3.jpeg']
+        replies = list(queue.map(images, filenames, result_timeout=30))
+    finally:
+        stop.set()
+        TextExtractor.configure_fake_engine(None)
+    worker.join(10)
+
+    assert [reply['filename'] for reply in replies] == filenames
+    for reply in replies:
+        assert reply['engine'] == 'FakeOCR'
+        assert reply['fields']['tax_office_number'] == '9480423762'
+    assert queue.stats() == {'pending': 0, 'processing': 0, 'dead': 0}
@@ -4,17 +4,69 @@ from fuzzywuzzy import fuzz
 import difflib
 import os
 import json
+import threading
+import time
+import sys
+import psutil
+from concurrent.futures import ProcessPoolExecutor
 from functools import lru_cache
 from ocr_methods import OCRMethods
+from cache import cache_from_url, content_hash
+import metrics
+import resources
+import tracing
+import transcripts
+import fake_ocr
+from recycling import RecyclingPool
+
+def physical_core_count():
+    return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+
+def _init_worker(cache_url=None, transcripts_spec=None, fake_engine_spec=None):
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(1)
+    TextExtractor.configure_cache(cache_url)
+    TextExtractor.configure_fake_engine(fake_engine_spec)
+    TextExtractor.configure_transcripts(transcripts_spec)
+    if TextExtractor.needs_models():
+        OCRMethods.warm_up()
+    TextExtractor.get_dictionary()
+    TextExtractor.initialize_tax_office_mapping()
+
+def _extract_in_worker(image_path, filename, raise_errors=True):
+    try:
+        return TextExtractor.extract_single(image_path, filename, update_mapping=False)
+    except Exception as e:
+        if raise_errors:
+            raise
+        return {"filename": filename, "error": str(e)}
 
 class TextExtractor:
     _dictionary = None
     _testing_mode = False
     _test_ocr_method = None
     _valid_offices = None
-    _cache = {}
+    _cache = None
+    _cache_url = None
+    # Bump when the OCR preprocessing or the field extractors change so cached entries are not reused
+    _cache_version = 1
+    _cache_retry_at = 0
     _tax_office_mapping_file = 'vn_vd.json'
     _tax_office_mapping = {}
+    _mapping_lock = threading.Lock()
+    _ocr_cascade = [
+        ('PaddleOCR', OCRMethods.extract_with_paddleocr),
+        ('Tesseract', OCRMethods.extract_with_pytesseract),
+        ('EasyOCR', OCRMethods.extract_with_easyocr),
+        # ('SuryaOCR', OCRMethods.extract_with_suryaocr),
+    ]
+    _default_cascade = _ocr_cascade
+    _engine_cascade = _ocr_cascade
+    _transcripts_spec = None
+    _transcripts = None
+    _fake_engine_spec = None
+    _recycle_images = 0
+    _recycle_rss_mb = 0
     _patterns = {
         'date': [
             r'(?:^|[^\d])(\d{2})\.(\d{2})\.(\d{4})(?:$|[^\d])',
@@ -106,6 +158,75 @@ class TextExtractor:
         cls._testing_mode = enabled
         cls._test_ocr_method = ocr_method
 
+    @classmethod
+    def configure_cache(cls, url):
+        cls._cache_url = url or None
+        cls._cache = cache_from_url(url)
+        cls._cache_retry_at = 0
+
+    @classmethod
+    def configure_transcripts(cls, spec):
+        # Record every engine's raw output, or replay recorded output instead of running OCR
+        cls._transcripts_spec = spec or None
+        cls._transcripts = transcripts.configure(spec)
+        cls._ocr_cascade = cls._transcripts.wrap(cls._engine_cascade) if cls._transcripts else cls._engine_cascade
+
+    @classmethod
+    def configure_fake_engine(cls, spec):
+        # Replace the engines with fake_ocr.FakeOCR, for load tests of the serving stack
+        cls._fake_engine_spec = spec if spec and spec != '0' else None
+        engine = fake_ocr.configure(spec)
+        cls._engine_cascade = [('FakeOCR', engine)] if engine else cls._default_cascade
+        cls.configure_transcripts(cls._transcripts_spec)
+
+    @classmethod
+    def configure_recycling(cls, max_images=0, max_rss_mb=0):
+        # Replace the parallel worker processes after max_images images or once their RSS passes max_rss_mb
+        cls._recycle_images = max_images or 0
+        cls._recycle_rss_mb = max_rss_mb or 0
+
+    @classmethod
+    def recycling(cls):
+        return bool(cls._recycle_images or cls._recycle_rss_mb)
+
+    @classmethod
+    def replaying(cls):
+        return isinstance(cls._transcripts, transcripts.TranscriptReplay)
+
+    @classmethod
+    def needs_models(cls):
+        return not cls.replaying() and cls._fake_engine_spec is None
+
+    content_hash = staticmethod(content_hash)
+
+    @classmethod
+    def _cache_get(cls, key):
+        if time.time() < cls._cache_retry_at:
+            return None
+        try:
+            with tracing.span('cache.get'):
+                value = cls._cache.get(key)
+            return json.loads(value) if value is not None else None
+        except Exception as e:
+            cls._cache_unavailable(e)
+            return None
+
+    @classmethod
+    def _cache_set(cls, key, value):
+        if time.time() < cls._cache_retry_at:
+            return
+        try:
+            with tracing.span('cache.set'):
+                cls._cache.set(key, json.dumps(value, ensure_ascii=False))
+        except Exception as e:
+            cls._cache_unavailable(e)
+
+    @classmethod
+    def _cache_unavailable(cls, error, retry_after=30):
+        # OCR still works without the cache; don't pay a connection timeout on every lookup
+        print(f"Cache unavailable, bypassing it for {retry_after} seconds: {error}")
+        cls._cache_retry_at = time.time() + retry_after
+
     @classmethod
     @lru_cache(maxsize=128)
     def get_dictionary(cls):
@@ -127,9 +248,28 @@ class TextExtractor:
                 cls._dictionary = set()
         return cls._dictionary
 
+    @classmethod
+    def get_valid_offices(cls):
+        if cls._valid_offices is None:
+            with open('vergidaireleri.txt', 'r', encoding='utf-8') as f:
+                cls._valid_offices = {office.strip().upper() for office in f.readlines() if office.strip()}
+        return cls._valid_offices
+
     @staticmethod
-    def correct_text(text):
+    @lru_cache(maxsize=65536)
+    def correct_word(word):
         dictionary = TextExtractor.get_dictionary()
+        if word.upper() in dictionary:
+            return word
+        best_match = max(dictionary, key=lambda w: fuzz.ratio(word.upper(), w), default=None)
+        if best_match and fuzz.ratio(word.upper(), best_match) >= 70:
+            return best_match
+        return word
+
+    @staticmethod
+    def correct_text(text):
+        if isinstance(text, transcripts.CorrectedText):
+            return text
         corrected_lines = []
         
         lines = text.split('\n') if isinstance(text, str) else text
@@ -140,20 +280,7 @@ class TextExtractor:
             
             line = line.replace('$', 'Ş')
                 
-            words = line.split()
-            corrected_words = []
-            
-            for word in words:
-                if word.upper() in dictionary:
-                    corrected_words.append(word)
-                else:
-                    best_match = max(dictionary, key=lambda w: fuzz.ratio(word.upper(), w), default=None)
-                    if best_match and fuzz.ratio(word.upper(), best_match) >= 70:
-                        corrected_words.append(best_match)
-                    else:
-                        corrected_words.append(word)
-            
-            corrected_lines.append(' '.join(corrected_words))
+            corrected_lines.append(' '.join(TextExtractor.correct_word(word) for word in line.split()))
         
         return '\n'.join(corrected_lines)
 
@@ -188,95 +315,197 @@ class TextExtractor:
                 return "N/A", "N/A"
 
     @classmethod
-    def extract_all(cls, texts, filenames=None):
+    def extract_all(cls, texts, filenames=None, parallel=False, workers=None):
+        return list(TextExtractor.iter_extract(texts, filenames, parallel, workers))
+
+    @classmethod
+    def iter_extract(cls, texts, filenames=None, parallel=False, workers=None, raise_errors=True):
         TextExtractor.initialize_tax_office_mapping()
 
         if filenames is None:
             filenames = ["Unnamed"] * len(texts)
-        results = []
 
-        for image_path, filename in zip(texts, filenames):
-            text1 = text2 = text3 = text4 = None
+        if not parallel:
+            for image_path, filename in zip(texts, filenames):
+                try:
+                    yield TextExtractor.extract_single(image_path, filename)
+                except Exception as e:
+                    if raise_errors:
+                        raise
+                    yield {"filename": filename, "error": str(e)}
+            return
 
-            text1 = OCRMethods.extract_with_paddleocr(image_path)
-            if text1:
-                text1 = TextExtractor.correct_text(text1)
-            
-            def try_extraction(extraction_method, field_name):
-                nonlocal text1, text2, text3, text4
-                result = "N/A"  # Initialize with N/A instead of None
-
-                if text1:
-                    if field_name in ["total_cost", "vat"]:
-                        total = TextExtractor.extract_total_cost(text1) or "N/A"
-                        vat = TextExtractor.extract_vat(text1) or "N/A"
-                        total, vat = TextExtractor.validate_total_cost_and_vat(total, vat)
-                        return total if field_name == "total_cost" else vat
-                    else:
-                        result = extraction_method(text1) or "N/A"
-                        if result != "N/A":
-                            return result
-
-                if text2 is None:
-                    text2 = OCRMethods.extract_with_pytesseract(image_path)
-                    if text2:
-                        text2 = TextExtractor.correct_text(text2)
-                        if field_name in ["total_cost", "vat"]:
-                            total = TextExtractor.extract_total_cost(text2) or "N/A"
-                            vat = TextExtractor.extract_vat(text2) or "N/A"
-                            total, vat = TextExtractor.validate_total_cost_and_vat(total, vat)
-                            return total if field_name == "total_cost" else vat
-                        else:
-                            result = extraction_method(text2) or "N/A"
-                            if result != "N/A":
-                                return result
-
-                if text3 is None:
-                    text3 = OCRMethods.extract_with_easyocr(image_path)
-                    if text3:
-                        text3 = TextExtractor.correct_text(text3)
-                        if field_name in ["total_cost", "vat"]:
-                            total = TextExtractor.extract_total_cost(text3) or "N/A"
-                            vat = TextExtractor.extract_vat(text3) or "N/A"
-                            total, vat = TextExtractor.validate_total_cost_and_vat(total, vat)
-                            return total if field_name == "total_cost" else vat
-                        else:
-                            result = extraction_method(text3) or "N/A"
-                            if result != "N/A":
-                                return result
-
-                # if text4 is None:
-                #    text4 = OCRMethods.extract_with_suryaocr(image_path)
-                #    if text4:
-                #        text4 = TextExtractor.correct_text(text4)
-                #        if field_name in ["total_cost", "vat"]:
-                #            total = TextExtractor.extract_total_cost(text4) or "N/A"
-                #            vat = TextExtractor.extract_vat(text4) or "N/A"
-                #            total, vat = TextExtractor.validate_total_cost_and_vat(total, vat)
-                #            return total if field_name == "total_cost" else vat
-                #        else:
-                #            result = extraction_method(text4) or "N/A"
-                #            if result != "N/A":
-                #                return result
-                return "N/A " 
-
-            results.append({
-                "filename": filename,
-                "date": try_extraction(TextExtractor.extract_date, "date"),
-                "time": try_extraction(TextExtractor.extract_time, "time"),
-                "tax_office_name": try_extraction(TextExtractor.extract_tax_office_name, "tax_office_name"),
-                "tax_office_number": try_extraction(TextExtractor.extract_tax_office_number, "tax_office_number"),
-                "total_cost": try_extraction(TextExtractor.extract_total_cost, "total_cost"),
-                "vat": try_extraction(TextExtractor.extract_vat, "vat"),
-                "payment_method": try_extraction(TextExtractor.extract_payment_method, "payment_method")
-            })
-
-            tax_number = results[-1]["tax_office_number"]
-            tax_office = results[-1]["tax_office_name"]
-            if tax_number != "N/A" and tax_office != "N/A":
-                TextExtractor.update_tax_office_mapping(tax_number, tax_office)
-
-        return results
+        workers = workers or physical_core_count()
+        initargs = (cls._cache_url, cls._transcripts_spec, cls._fake_engine_spec)
+        if cls.recycling():
+            executor = RecyclingPool(workers, _init_worker, initargs, cls._recycle_images, cls._recycle_rss_mb)
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs)
+        with executor:
+            for result in executor.map(_extract_in_worker, texts, filenames, [raise_errors] * len(texts)):
+                if "error" not in result:
+                    TextExtractor.update_tax_office_mapping(result["tax_office_number"], result["tax_office_name"])
+                yield result
+
+    @classmethod
+    def extract_single(cls, image_path, filename="Unnamed", with_details=False, update_mapping=True):
+        with tracing.span('extract_single', filename=filename), resources.track_memory('image', filename):
+            return cls._extract_single(image_path, filename, with_details, update_mapping)
+
+    @classmethod
+    def _extract_single(cls, image_path, filename, with_details, update_mapping):
+        start_time = time.time()
+        cascade = cls._ocr_cascade
+        texts = [None] * len(cascade)
+        ocr_times = {}
+        field_engines = {}
+
+        content_hash = None
+        if cls._cache is not None and not cls._testing_mode:
+            content_hash = cls.content_hash(image_path)
+        if content_hash:
+            fields_key = f"fields:{cls._cache_version}:{','.join(name for name, _ in cascade)}:{content_hash}"
+            cached = cls._cache_get(fields_key)
+            metrics.CACHE_REQUESTS.inc(kind="fields", result="hit" if cached else "miss")
+            if cached:
+                metrics.IMAGES_PROCESSED.inc(source="cache")
+                result = dict(cached["result"], filename=filename)
+                if update_mapping and result["tax_office_number"] != "N/A" and result["tax_office_name"] != "N/A":
+                    TextExtractor.update_tax_office_mapping(result["tax_office_number"], result["tax_office_name"])
+                if not with_details:
+                    return result
+                details = dict(cached["details"], ocr_times={}, cached=True,
+                               processing_time=round(time.time() - start_time, 3))
+                return result, details
+
+        def run_engine(position):
+            engine_name, engine = cascade[position]
+            engine_start = time.time()
+            text = None
+            if content_hash:
+                text_key = f"ocr-text:{cls._cache_version}:{engine_name}:{content_hash}"
+                cached = cls._cache_get(text_key)
+                metrics.CACHE_REQUESTS.inc(kind="text", result="hit" if cached else "miss")
+                text = cached["text"] if cached else None
+                if cached and cached.get("corrected"):
+                    text = transcripts.CorrectedText(text)
+            if text is None:
+                ocr_start = time.time()
+                with tracing.span(f'ocr.{engine_name}') as span, resources.active_stage(engine_name), \
+                        resources.track_memory('engine', engine_name):
+                    text = engine(image_path)
+                    span.set('characters', len(text or ''))
+                metrics.OCR_ENGINE_SECONDS.observe(time.time() - ocr_start, engine=engine_name)
+                if not text:
+                    metrics.OCR_ENGINE_EMPTY.inc(engine=engine_name)
+                if text and content_hash:
+                    cls._cache_set(text_key, {"text": text, "corrected": isinstance(text, transcripts.CorrectedText)})
+            if text:
+                with tracing.span('correct_text', engine=engine_name), resources.active_stage('correct_text'):
+                    text = TextExtractor.correct_text(text)
+            ocr_times[engine_name] = round(ocr_times.get(engine_name, 0) + time.time() - engine_start, 3)
+            texts[position] = text
+
+        run_engine(0)
+        field_times = {}
+
+        def timed(field_name, method, text):
+            method_start = time.perf_counter()
+            with tracing.span(f'extract.{field_name}'):
+                value = method(text)
+            field_times[field_name] = field_times.get(field_name, 0) + time.perf_counter() - method_start
+            return value
+
+        def try_extraction(extraction_method, field_name):
+            for position, (engine_name, _) in enumerate(cascade):
+                if position > 0:
+                    if texts[position] is not None:
+                        continue
+                    run_engine(position)
+
+                text = texts[position]
+                if not text:
+                    continue
+
+                if field_name in ["total_cost", "vat"]:
+                    total = timed("total_cost", TextExtractor.extract_total_cost, text) or "N/A"
+                    vat = timed("vat", TextExtractor.extract_vat, text) or "N/A"
+                    total, vat = TextExtractor.validate_total_cost_and_vat(total, vat)
+                    value = total if field_name == "total_cost" else vat
+                    field_engines[field_name] = engine_name if value != "N/A" else None
+                    return value
+
+                result = timed(field_name, extraction_method, text) or "N/A"
+                if result != "N/A":
+                    field_engines[field_name] = engine_name
+                    return result
+
+            field_engines[field_name] = None
+            return "N/A "
+
+        result = {
+            "filename": filename,
+            "date": try_extraction(TextExtractor.extract_date, "date"),
+            "time": try_extraction(TextExtractor.extract_time, "time"),
+            "tax_office_name": try_extraction(TextExtractor.extract_tax_office_name, "tax_office_name"),
+            "tax_office_number": try_extraction(TextExtractor.extract_tax_office_number, "tax_office_number"),
+            "total_cost": try_extraction(TextExtractor.extract_total_cost, "total_cost"),
+            "vat": try_extraction(TextExtractor.extract_vat, "vat"),
+            "payment_method": try_extraction(TextExtractor.extract_payment_method, "payment_method")
+        }
+
+        tax_number = result["tax_office_number"]
+        tax_office = result["tax_office_name"]
+        if update_mapping and tax_number != "N/A" and tax_office != "N/A":
+            TextExtractor.update_tax_office_mapping(tax_number, tax_office)
+
+        for field_name, seconds in field_times.items():
+            metrics.FIELD_EXTRACTION_SECONDS.observe(seconds, field=field_name)
+        for field_name, engine_name in field_engines.items():
+            metrics.FIELD_EXTRACTIONS.inc(field=field_name, result="found" if engine_name else "missing")
+        metrics.CASCADE_DEPTH.observe(len(ocr_times))
+        metrics.IMAGE_SECONDS.observe(time.time() - start_time)
+        metrics.IMAGES_PROCESSED.inc(source="ocr")
+
+        engines_used = [engine for engine in field_engines.values() if engine]
+        details = {
+            "engine": max(dict.fromkeys(engines_used), key=engines_used.count) if engines_used else None,
+            "field_engines": field_engines,
+            "ocr_times": ocr_times,
+            "processing_time": round(time.time() - start_time, 3)
+        }
+
+        # Only cache receipts that produced text; an empty run may be a transient engine failure
+        if content_hash and any(texts):
+            cls._cache_set(fields_key, {"result": result, "details": {
+                "engine": details["engine"], "field_engines": field_engines}})
+
+        if not with_details:
+            return result
+        return result, details
+
+    @classmethod
+    def extract_from_text(cls, text, filename="Unnamed", update_mapping=True):
+        with tracing.span('correct_text'):
+            text = TextExtractor.correct_text(text)
+        result = {"filename": filename}
+        for field_name, method in [
+            ("date", TextExtractor.extract_date),
+            ("time", TextExtractor.extract_time),
+            ("tax_office_name", TextExtractor.extract_tax_office_name),
+            ("tax_office_number", TextExtractor.extract_tax_office_number),
+            ("total_cost", TextExtractor.extract_total_cost),
+            ("vat", TextExtractor.extract_vat),
+            ("payment_method", TextExtractor.extract_payment_method),
+        ]:
+            with tracing.span(f'extract.{field_name}'):
+                result[field_name] = method(text)
+        result["total_cost"], result["vat"] = TextExtractor.validate_total_cost_and_vat(result["total_cost"], result["vat"])
+
+        if update_mapping and result["tax_office_number"] != "N/A" and result["tax_office_name"] != "N/A":
+            TextExtractor.update_tax_office_mapping(result["tax_office_number"], result["tax_office_name"])
+
+        return result
 
     @classmethod
     def initialize_tax_office_mapping(cls):
@@ -285,7 +514,7 @@ class TextExtractor:
                 json.dump({}, f)
         
         try:
-            with open(cls._tax_office_mapping_file, 'r', encoding='utf-8') as f:
+            with tracing.span('mapping.read'), open(cls._tax_office_mapping_file, 'r', encoding='utf-8') as f:
                 cls._tax_office_mapping = json.load(f)
         except (json.JSONDecodeError, ValueError) as e:
             print(f"Error reading tax office mapping file: {e}")
@@ -296,13 +525,17 @@ class TextExtractor:
         if not tax_number or tax_number == "N/A" or not tax_office or tax_office == "N/A":
             return
 
-        if tax_number not in cls._tax_office_mapping:
-            cls._tax_office_mapping[tax_number] = tax_office
-            try:
-                with open(cls._tax_office_mapping_file, 'w', encoding='utf-8') as f:
-                    json.dump(cls._tax_office_mapping, f, ensure_ascii=False, indent=2)
-            except Exception as e:
-                print(f"Error updating tax office mapping file: {e}")
+        with cls._mapping_lock:
+            if not cls._tax_office_mapping:
+                # Never write back a mapping that was not loaded from disk first
+                cls.initialize_tax_office_mapping()
+            if tax_number not in cls._tax_office_mapping:
+                cls._tax_office_mapping[tax_number] = tax_office
+                try:
+                    with tracing.span('mapping.write'), open(cls._tax_office_mapping_file, 'w', encoding='utf-8') as f:
+                        json.dump(cls._tax_office_mapping, f, ensure_ascii=False, indent=2)
+                except Exception as e:
+                    print(f"Error updating tax office mapping file: {e}")
 
     @staticmethod
     def extract_tax_office_name(text):
@@ -313,8 +546,7 @@ class TextExtractor:
         if tax_number != "N/A" and tax_number in TextExtractor._tax_office_mapping:
             return TextExtractor._tax_office_mapping[tax_number]
 
-        with open('vergidaireleri.txt', 'r', encoding='utf-8') as f:
-            valid_offices = {office.strip().upper() for office in f.readlines() if office.strip()}
+        valid_offices = TextExtractor.get_valid_offices()
         
         keywords = ['VERGİ DAİRESİ', 'V.D.', 'VD.', 'V.D', 'VD', 'V.D', 'VERGİ', 'DAİRESİ']
         
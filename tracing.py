@@ -0,0 +1,259 @@
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+
+# Lightweight spans for finding where a request spends its time. A trace is
+# only recorded when an exporter is configured (and the request is sampled)
+# or when the caller asks for a summary; otherwise span() is a no-op.
+
+_current_trace = contextvars.ContextVar('trace', default=None)
+_current_span = contextvars.ContextVar('span', default=None)
+
+_exporters = []
+_sample_rate = 1.0
+_export_queue = None
+_export_pid = None
+_export_lock = threading.Lock()
+
+def _new_id(length):
+    return os.urandom(length).hex()
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'start', 'end', 'attributes', '_tokens')
+
+    def __init__(self, trace, name, parent_id=None, attributes=None, start=None):
+        self.trace = trace
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = start if start is not None else time.time_ns()
+        self.end = None
+        self.attributes = attributes or {}
+        self._tokens = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._tokens = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.attributes['error'] = str(exc)
+        self.finish()
+        _current_span.reset(self._tokens)
+
+    def finish(self, end=None):
+        self.end = end if end is not None else time.time_ns()
+        self.trace.add(self)
+
+    @property
+    def duration_ms(self):
+        return (self.end - self.start) / 1e6
+
+class _NullSpan:
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Trace:
+    def __init__(self, name, trace_id=None, parent_id=None, export=True, attributes=None):
+        self.trace_id = trace_id or _new_id(16)
+        self.spans = []
+        self.export = export
+        self._lock = threading.Lock()
+        self._holders = 0
+        self._exported = False
+        self._tokens = None
+        self.root = Span(self, name, parent_id, attributes)
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def hold(self):
+        with self._lock:
+            self._holders += 1
+
+    def release(self):
+        # A trace outlives its request while a background job still holds it
+        with self._lock:
+            self._holders -= 1
+            done = self._holders <= 0 and not self._exported
+            if done:
+                self._exported = True
+        if done and self.export and _exporters:
+            _enqueue_export(list(self.spans))
+
+    def summary(self):
+        with self._lock:
+            spans = list(self.spans)
+        stages = {}
+        for span in spans:
+            if span is self.root:
+                continue
+            stage = stages.setdefault(span.name, {'count': 0, 'total_ms': 0.0})
+            stage['count'] += 1
+            stage['total_ms'] += span.duration_ms
+        for stage in stages.values():
+            stage['total_ms'] = round(stage['total_ms'], 3)
+        end = self.root.end or time.time_ns()
+        return {
+            'trace_id': self.trace_id,
+            'duration_ms': round((end - self.root.start) / 1e6, 3),
+            'stages': dict(sorted(stages.items(), key=lambda item: item[1]['total_ms'], reverse=True))
+        }
+
+def configure(file_path=None, otlp_endpoint=None, sample_rate=1.0, service_name='invoice-ocr'):
+    global _sample_rate
+    _exporters.clear()
+    if file_path:
+        _exporters.append(FileExporter(file_path))
+    if otlp_endpoint:
+        _exporters.append(OtlpHttpExporter(otlp_endpoint, service_name))
+    _sample_rate = sample_rate
+
+def enabled():
+    return bool(_exporters)
+
+def start_trace(name, force=False, trace_id=None, parent_id=None, **attributes):
+    sampled = bool(_exporters) and random.random() < _sample_rate
+    if not (sampled or force):
+        return None
+    trace = Trace(name, trace_id, parent_id, export=sampled, attributes=attributes)
+    trace.hold()
+    trace._tokens = (_current_trace.set(trace), _current_span.set(trace.root))
+    return trace
+
+def end_trace(trace):
+    trace.root.finish()
+    trace_token, span_token = trace._tokens
+    try:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+    except ValueError:
+        # Ended from a different context than it was started in (e.g. after a streamed response)
+        _current_span.set(None)
+        _current_trace.set(None)
+    trace.release()
+
+def current_trace():
+    return _current_trace.get()
+
+def current_context():
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    span = _current_span.get()
+    return {'trace_id': trace.trace_id, 'span_id': span.span_id if span else trace.root.span_id}
+
+def span(name, **attributes):
+    trace = _current_trace.get()
+    if trace is None:
+        return NULL_SPAN
+    parent = _current_span.get()
+    return Span(trace, name, parent.span_id if parent else None, attributes)
+
+def record_span(name, start, end, **attributes):
+    # For intervals measured elsewhere, e.g. time spent waiting in the job queue
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get()
+    Span(trace, name, parent.span_id if parent else None, attributes, start=int(start * 1e9)).finish(int(end * 1e9))
+
+def _enqueue_export(spans):
+    global _export_queue, _export_pid
+    with _export_lock:
+        if _export_pid != os.getpid():
+            _export_queue = queue.Queue(maxsize=1000)
+            _export_pid = os.getpid()
+            threading.Thread(target=_export_loop, args=(_export_queue,), name='trace-exporter', daemon=True).start()
+    try:
+        _export_queue.put_nowait(spans)
+    except queue.Full:
+        print("Trace export queue is full, dropping a trace")
+
+def _export_loop(spans_queue):
+    while True:
+        spans = spans_queue.get()
+        for exporter in list(_exporters):
+            try:
+                exporter.export(spans)
+            except Exception as e:
+                print(f"Error exporting trace with {type(exporter).__name__}: {e}")
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for span in spans:
+                f.write(json.dumps({
+                    'trace_id': span.trace.trace_id,
+                    'span_id': span.span_id,
+                    'parent_id': span.parent_id,
+                    'name': span.name,
+                    'start': span.start / 1e9,
+                    'duration_ms': round(span.duration_ms, 3),
+                    'attributes': span.attributes
+                }, ensure_ascii=False, default=str) + "\n")
+
+class OtlpHttpExporter:
+    # OTLP/HTTP with the JSON encoding, accepted by the OpenTelemetry Collector,
+    # Jaeger and Tempo on port 4318
+    def __init__(self, endpoint, service_name='invoice-ocr', timeout=5):
+        self.endpoint = endpoint if endpoint.rstrip('/').endswith('/v1/traces') else endpoint.rstrip('/') + '/v1/traces'
+        self.service_name = service_name
+        self.timeout = timeout
+
+    @staticmethod
+    def _attribute(key, value):
+        if isinstance(value, bool):
+            typed = {'boolValue': value}
+        elif isinstance(value, int):
+            typed = {'intValue': str(value)}
+        elif isinstance(value, float):
+            typed = {'doubleValue': value}
+        else:
+            typed = {'stringValue': str(value)}
+        return {'key': key, 'value': typed}
+
+    def export(self, spans):
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': [self._attribute('service.name', self.service_name)]},
+            'scopeSpans': [{
+                'scope': {'name': 'tracing'},
+                'spans': [{
+                    'traceId': span.trace.trace_id,
+                    'spanId': span.span_id,
+                    'parentSpanId': span.parent_id or '',
+                    'name': span.name,
+                    'kind': 1,
+                    'startTimeUnixNano': str(span.start),
+                    'endTimeUnixNano': str(span.end),
+                    'attributes': [self._attribute(key, value) for key, value in span.attributes.items()],
+                    'status': {'code': 2, 'message': span.attributes['error']} if 'error' in span.attributes else {}
+                } for span in spans]
+            }]
+        }]}
+        request = urllib.request.Request(self.endpoint, data=json.dumps(payload).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
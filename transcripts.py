@@ -0,0 +1,155 @@
+import glob
+import gzip
+import json
+import os
+import re
+import threading
+
+from cache import content_hash
+
+# Raw OCR output per engine and image, so the text-processing side can be run,
+# profiled and load-tested without the OCR engines. Transcripts are NDJSON
+# (optionally gzipped), one {"engine", "sha256", "filename", "text"} record per
+# line; images are matched by content hash first and file name second.
+#
+#   OCR_TRANSCRIPTS=record:transcripts.ndjson python cli.py batch uploads/ -o out.ndjson
+#   OCR_TRANSCRIPTS=replay:transcripts.ndjson.gz python cli.py batch uploads/ -o out.ndjson
+
+class CorrectedText(str):
+    # Text recorded after correct_text, which passes it through unchanged
+    pass
+
+def _filename(image):
+    return os.path.basename(image) if isinstance(image, str) else None
+
+def _open(path, mode, compressed=None):
+    if compressed or (compressed is None and path.endswith('.gz')):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def read_records(path):
+    with _open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def write_records(records, path):
+    temp_path = path + '.tmp'
+    with _open(temp_path, 'w', compressed=path.endswith('.gz')) as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+    os.replace(temp_path, path)
+
+class TranscriptRecorder:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, engine, image, text):
+        record = {'engine': engine, 'sha256': content_hash(image), 'filename': _filename(image), 'text': text}
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+        # One append per record, so processes recording into the same file do not interleave lines
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode('utf-8'))
+            finally:
+                os.close(fd)
+
+    def wrap(self, cascade):
+        def recording(name, engine):
+            def run(image):
+                text = engine(image)
+                self.add(name, image, text)
+                return text
+            return run
+        return [(name, recording(name, engine)) for name, engine in cascade]
+
+class TranscriptReplay:
+    def __init__(self, path):
+        self.path = path
+        self.by_hash = {}
+        self.by_name = {}
+        self.hits = 0
+        self.misses = 0
+        for record in read_records(path):
+            text = record['text']
+            if text and record.get('corrected'):
+                text = CorrectedText(text)
+            if record.get('sha256'):
+                self.by_hash[(record['engine'], record['sha256'])] = text
+            if record.get('filename'):
+                self.by_name[(record['engine'], record['filename'])] = text
+
+    def engines(self):
+        return sorted({engine for engine, _ in self.by_hash} | {engine for engine, _ in self.by_name})
+
+    def get(self, engine, image):
+        key = (engine, _filename(image))
+        digest = content_hash(image) if self.by_hash else None
+        if digest and (engine, digest) in self.by_hash:
+            self.hits += 1
+            return self.by_hash[(engine, digest)]
+        if key in self.by_name:
+            self.hits += 1
+            return self.by_name[key]
+        # Same as the engine finding no text; the cascade moves on to the next one
+        self.misses += 1
+        return None
+
+    def engine(self, name):
+        return lambda image: self.get(name, image)
+
+    def wrap(self, cascade):
+        return [(name, self.engine(name)) for name, _ in cascade]
+
+def configure(spec):
+    # spec is "record:<path>" or "replay:<path>"
+    if not spec:
+        return None
+    mode, _, path = spec.partition(':')
+    if mode == 'record' and path:
+        return TranscriptRecorder(path)
+    if mode == 'replay' and path:
+        return TranscriptReplay(path)
+    raise ValueError(f"OCR_TRANSCRIPTS must be record:<path> or replay:<path>, got {spec!r}")
+
+def compact(paths, output):
+    # Latest record wins for each engine and image
+    records = {}
+    for path in paths:
+        for record in read_records(path):
+            records[(record['engine'], record.get('sha256') or record.get('filename'))] = record
+    write_records(records.values(), output)
+    return len(records)
+
+def read_test_logs(log_dir, images_dir=None):
+    # The per-engine stats files in test/test_logs hold each image's text after
+    # correct_text, so these transcripts are marked "corrected" and replayed as is
+    records = {}
+    for path in sorted(glob.glob(os.path.join(log_dir, '*_stats_*.txt'))):
+        engine = os.path.basename(path).split('_stats_')[0]
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        for block in re.split(r'^Testing .+? on: ', content, flags=re.M)[1:]:
+            filename, _, rest = block.partition('\n')
+            match = re.search(r'Processed Text Output:\n(.*?)\n-{40}', rest, re.S)
+            if not match:
+                continue
+            filename = filename.strip()
+            image_path = os.path.join(images_dir, filename) if images_dir else None
+            records[(engine, filename)] = {
+                'engine': engine,
+                'sha256': content_hash(image_path) if image_path and os.path.exists(image_path) else None,
+                'filename': filename,
+                'text': match.group(1),
+                'corrected': True
+            }
+    return list(records.values())
+
+def import_test_logs(log_dir, output, images_dir=None):
+    records = read_test_logs(log_dir, images_dir)
+    write_records(records, output)
+    return len(records)
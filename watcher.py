@@ -0,0 +1,113 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from text_extraction import TextExtractor
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+class FolderWatcher:
+    def __init__(self, directory, sink, index_path, allowed_file, poll_interval=2.0, settle_time=1.0, use_inotify=True):
+        self.directory = os.path.abspath(directory)
+        self.sink = sink
+        self.index_path = index_path
+        self.allowed_file = allowed_file
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.index = self._load_index()
+        self._stop_requested = False
+        self._inotify = None
+
+        if use_inotify and INotify is not None:
+            try:
+                self._inotify = INotify()
+                self._inotify.add_watch(self.directory, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE)
+            except OSError as e:
+                print(f"inotify unavailable ({e}), falling back to polling")
+                self._inotify = None
+
+    @property
+    def mode(self):
+        return 'inotify' if self._inotify else 'polling'
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"Error reading processed-file index, starting fresh: {e}")
+            return {}
+
+    def _save_index(self):
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.index_path)
+
+    def pending_files(self):
+        now = time.time()
+        pending = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not self.allowed_file(entry.name):
+                    continue
+                stat = entry.stat()
+                if now - stat.st_mtime < self.settle_time:
+                    continue
+                known = self.index.get(entry.name)
+                if known and known['mtime'] == stat.st_mtime and known['size'] == stat.st_size:
+                    continue
+                pending.append((stat.st_mtime, entry.name, stat))
+        return [(name, stat) for _, name, stat in sorted(pending)]
+
+    def process_pending(self):
+        processed = 0
+        for name, stat in self.pending_files():
+            if self._stop_requested:
+                break
+            path = os.path.join(self.directory, name)
+            try:
+                result, details = TextExtractor.extract_single(path, name, with_details=True)
+            except Exception as e:
+                # Indexed like a processed file so it is retried only once it changes
+                print(f"Error processing {name}: {e}")
+                self.index[name] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'error': str(e),
+                                    'failed_at': datetime.now().isoformat(timespec='seconds')}
+                self._save_index()
+                continue
+
+            result['engine'] = details['engine']
+            result['processing_time'] = details['processing_time']
+            result['processed_at'] = datetime.now().isoformat(timespec='seconds')
+            self.sink.write(result)
+
+            self.index[name] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'processed_at': result['processed_at']}
+            self._save_index()
+            processed += 1
+        return processed
+
+    def _wait_for_changes(self):
+        if self._inotify:
+            events = self._inotify.read(timeout=int(self.poll_interval * 1000))
+            if events and self.settle_time:
+                # Files written without a final close (e.g. network copies) still need to settle
+                time.sleep(self.settle_time)
+        else:
+            time.sleep(self.poll_interval)
+
+    def run(self, once=False):
+        TextExtractor.initialize_tax_office_mapping()
+        while not self._stop_requested:
+            self.process_pending()
+            if once:
+                break
+            self._wait_for_changes()
+
+    def stop(self):
+        self._stop_requested = True
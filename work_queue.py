@@ -0,0 +1,214 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from resp import RespClient, RespError
+from text_extraction import TextExtractor
+import tracing
+
+class WorkQueue:
+    # Tasks move pending -> processing (atomically, via BRPOPLPUSH) and hold a
+    # lease in a sorted set scored by its deadline. Workers extend the lease
+    # while OCR runs; a task whose lease runs out (worker crashed or hung) is
+    # retried, and after max_attempts it goes to the dead-letter list. Results
+    # are pushed to the reply list named by the producer.
+    def __init__(self, url, name='ocr-queue', lease_time=120, max_attempts=3, reply_ttl=86400):
+        self.client = RespClient(url)
+        self.prefix = f"{name}:"
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.reply_ttl = reply_ttl
+        self._unleased = {}
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(parts)
+
+    def new_reply_list(self):
+        return self._key('replies', f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+
+    def enqueue(self, image, filename, reply_to, meta=None):
+        if not isinstance(image, bytes):
+            with open(image, 'rb') as f:
+                image = f.read()
+
+        task_id = uuid.uuid4().hex
+        task = {
+            'id': task_id,
+            'filename': filename,
+            'reply_to': reply_to,
+            'attempts': 0,
+            'enqueued': time.time(),
+            'meta': meta or {}
+        }
+        self.client.execute('SET', self._key('image', task_id), image)
+        self.client.execute('SET', self._key('task', task_id), json.dumps(task, ensure_ascii=False))
+        self.client.execute('LPUSH', self._key('pending'), task_id)
+        return task_id
+
+    def wait_reply(self, reply_to, timeout=5):
+        reply = self.client.execute('BLPOP', reply_to, timeout, timeout=timeout + 10)
+        return json.loads(reply[1]) if reply else None
+
+    def claim(self, timeout=5):
+        task_id = self.client.execute('BRPOPLPUSH', self._key('pending'), self._key('processing'), timeout,
+                                      timeout=timeout + 10)
+        if task_id is None:
+            return None
+        task_id = task_id.decode('utf-8')
+        self.client.execute('ZADD', self._key('leases'), time.time() + self.lease_time, task_id)
+
+        task = self._load_task(task_id)
+        image = self.client.execute('GET', self._key('image', task_id))
+        if task is None or image is None:
+            # Already completed by a worker whose lease had expired
+            self._release(task_id)
+            return None
+        task['image'] = image
+        return task
+
+    def extend_lease(self, task_id):
+        self.client.execute('ZADD', self._key('leases'), 'XX', time.time() + self.lease_time, task_id)
+
+    def complete(self, task, result):
+        # One transaction, so a crash cannot leave a task replied to and still processing
+        self.client.transaction(*self._reply_commands(task, result), *self._release_commands(task['id']),
+                                ('DEL', self._key('task', task['id']), self._key('image', task['id'])))
+
+    def fail(self, task, error):
+        task = self._load_task(task['id'])
+        if task is None:
+            return
+
+        task['attempts'] += 1
+        task['last_error'] = error
+        save = ('SET', self._key('task', task['id']), json.dumps(task, ensure_ascii=False))
+        if task['attempts'] < self.max_attempts:
+            print(f"Task {task['id']} ({task['filename']}) failed, retrying: {error}")
+            self.client.transaction(*self._release_commands(task['id']), save,
+                                    ('LPUSH', self._key('pending'), task['id']))
+            return
+
+        print(f"Task {task['id']} ({task['filename']}) failed {task['attempts']} times, moving to dead letters: {error}")
+        self.client.transaction(*self._release_commands(task['id']), save,
+                                ('DEL', self._key('image', task['id'])), ('LPUSH', self._key('dead'), task['id']),
+                                *self._reply_commands(task, {'error': error, 'attempts': task['attempts']}))
+
+    def reap(self):
+        now = time.time()
+        for task_id in self.client.execute('ZRANGEBYSCORE', self._key('leases'), '-inf', now):
+            task_id = task_id.decode('utf-8')
+            # Only the reaper whose ZREM succeeds handles the task
+            if self.client.execute('ZREM', self._key('leases'), task_id):
+                self.client.execute('LREM', self._key('processing'), 1, task_id)
+                self.fail({'id': task_id}, 'lease expired')
+
+        # A worker that died between taking a task and recording its lease leaves
+        # it in processing without one; give it a lease period before requeueing
+        processing = [task_id.decode('utf-8') for task_id in self.client.execute('LRANGE', self._key('processing'), 0, -1)]
+        for task_id in processing:
+            if self.client.execute('ZSCORE', self._key('leases'), task_id) is not None:
+                self._unleased.pop(task_id, None)
+                continue
+            first_seen = self._unleased.setdefault(task_id, now)
+            if now - first_seen > self.lease_time:
+                self._unleased.pop(task_id, None)
+                if self.client.execute('LREM', self._key('processing'), 1, task_id):
+                    self.fail({'id': task_id}, 'worker lost')
+        for task_id in set(self._unleased) - set(processing):
+            del self._unleased[task_id]
+
+    def stats(self):
+        return {
+            'pending': self.client.execute('LLEN', self._key('pending')),
+            'processing': self.client.execute('LLEN', self._key('processing')),
+            'dead': self.client.execute('LLEN', self._key('dead'))
+        }
+
+    def map(self, image_paths, filenames, result_timeout=3600):
+        reply_to = self.new_reply_list()
+        order = [self.enqueue(path, filename, reply_to) for path, filename in zip(image_paths, filenames)]
+        waiting = set(order)
+        replies = {}
+        deadline = time.time() + result_timeout
+        for task_id in order:
+            while task_id not in replies:
+                if time.time() > deadline:
+                    raise TimeoutError(f"No result for {task_id} within {result_timeout} seconds")
+                reply = self.wait_reply(reply_to)
+                # A task requeued after its lease ran out can be answered twice; the first reply counts
+                if reply and reply['id'] in waiting and reply['id'] not in replies:
+                    replies[reply['id']] = reply
+            waiting.discard(task_id)
+            yield replies.pop(task_id)
+
+    def work(self, should_stop=lambda: False, reap_interval=10, on_task_done=None):
+        last_reap = 0
+        while not should_stop():
+            if time.time() - last_reap > reap_interval:
+                self.reap()
+                last_reap = time.time()
+
+            task = self.claim()
+            if task is None:
+                continue
+
+            stop_heartbeat = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(task['id'], stop_heartbeat), daemon=True)
+            heartbeat.start()
+            wait_time = round(time.time() - task['enqueued'], 3)
+            # Continue the producer's trace; exported if this worker has an exporter configured
+            parent = task['meta'].get('trace')
+            trace = None
+            if parent:
+                trace = tracing.start_trace('worker.task', trace_id=parent['trace_id'], parent_id=parent['span_id'],
+                                            filename=task['filename'], attempt=task['attempts'] + 1)
+            try:
+                fields, details = TextExtractor.extract_single(task['image'], task['filename'], with_details=True,
+                                                               update_mapping=False)
+            except Exception as e:
+                stop_heartbeat.set()
+                self.fail(task, str(e))
+                if on_task_done is not None:
+                    on_task_done()
+                continue
+            finally:
+                if trace is not None:
+                    tracing.end_trace(trace)
+            stop_heartbeat.set()
+
+            self.complete(task, {
+                'fields': fields,
+                'engine': details['engine'],
+                'field_engines': details['field_engines'],
+                'ocr_times': details['ocr_times'],
+                'wait_time': wait_time,
+                'processing_time': details['processing_time'],
+                'worker': f"{socket.gethostname()}:{os.getpid()}"
+            })
+            if on_task_done is not None:
+                on_task_done()
+
+    def _heartbeat(self, task_id, stopped):
+        while not stopped.wait(self.lease_time / 3):
+            try:
+                self.extend_lease(task_id)
+            except (OSError, RespError) as e:
+                print(f"Error extending lease for {task_id}: {e}")
+
+    def _load_task(self, task_id):
+        task = self.client.execute('GET', self._key('task', task_id))
+        return json.loads(task) if task is not None else None
+
+    def _release(self, task_id):
+        self.client.transaction(*self._release_commands(task_id))
+
+    def _release_commands(self, task_id):
+        return [('LREM', self._key('processing'), 1, task_id), ('ZREM', self._key('leases'), task_id)]
+
+    def _reply_commands(self, task, result):
+        reply = dict(result, id=task['id'], filename=task['filename'], meta=task.get('meta', {}))
+        return [('RPUSH', task['reply_to'], json.dumps(reply, ensure_ascii=False)),
+                ('EXPIRE', task['reply_to'], self.reply_ttl)]